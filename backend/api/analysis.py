@@ -1,11 +1,12 @@
-from fastapi import APIRouter, HTTPException, Depends
-from pydantic import BaseModel
-from typing import List, Optional
-import os
-import google.generativeai as genai
-from supabase import create_client, Client
-from datetime import datetime
+from fastapi import APIRouter, HTTPException, Depends, Header, Query, Request, Response
+from fastapi.responses import JSONResponse, StreamingResponse
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, MutableMapping, Optional, Tuple
+import asyncio
+import base64
+from datetime import datetime, timezone
 import json
+import math
+import re
 import uuid
 import sys
 from pathlib import Path
@@ -15,188 +16,1180 @@ backend_dir = Path(__file__).parent.parent
 sys.path.append(str(backend_dir))
 
 # Importar modelos y configuración
-from models import AnalysisRequest, AnalysisResponse, AnalysisHistory, SentimentResult
+from models import (
+    AnalysisRequest, AnalysisResponse, AnalysisDetail, AnalysisHistory, SentimentResult,
+    BatchAnalysisRequest, BatchItemResult, BatchAnalysisResponse, AnalysisMode,
+    LongAnalysisRequest, AnalysisJob, JobStatus, AnalysisStats, SimilarAnalysis, PromptUsage, ModelQuality
+)
 from config import Settings
+from services.gemini import get_gemini_gateway, GeminiSaturatedError, GeminiTimeoutError
+from services.resilience import CircuitOpenError
+from services.structured_output import (
+    ANALYSIS_SCHEMA, BATCH_ANALYSIS_SCHEMA, SHORT_ANALYSIS_SCHEMA,
+    decode_analysis, decode_batch_analysis, missing_fields
+)
+from services.supabase import SupabaseRepository, get_repository
+from services.cache import get_analysis_cache, cache_key, LRUCache
+from services.auth import get_current_user_id
+from services.health import get_readiness_monitor
+from services.local_analyzer import analyze_locally, LOCAL_ENGINE
+from services.workers import run_cpu_bound, WorkerPoolSaturatedError, WorkerTimeoutError
+from services.chunking import split_into_chunks, merge_keywords, merge_sentiments, estimate_tokens
+from services.jobs import get_job_queue, JobQueueFullError, JobsUnavailableError
+from services.coalescing import SingleFlight
+from services.rate_limit import get_rate_limiter
+from services.model_router import get_model_router
+from services.write_buffer import get_write_buffer
+from services.telemetry import span
+from services.prompts import (
+    PromptTemplate, PromptTimer, get_prompt, analysis_prompt_for, compact_text,
+    format_batch_texts, format_summaries, get_prompt_usage,
+)
 
 router = APIRouter()
 
-# Configurar Gemini Pro
 settings = Settings()
-genai.configure(api_key=settings.GEMINI_API_KEY)
 
-# Configurar Supabase
-supabase: Client = create_client(settings.SUPABASE_URL, settings.SUPABASE_SERVICE_ROLE_KEY)
+# Columnas que necesita AnalysisResponse; original_text (hasta 10.000
+# caracteres) solo se pide en el endpoint de detalle
+ANALYSIS_LIST_COLUMNS = "id,summary,keywords,sentiment_label,sentiment_confidence,created_at,model"
+ANALYSIS_DETAIL_COLUMNS = ANALYSIS_LIST_COLUMNS + ",original_text"
 
-@router.post("/analyze", response_model=AnalysisResponse)
-async def analyze_text(request: AnalysisRequest):
+async def generate_with_prompt(
+    prompt: PromptTemplate,
+    response_schema: Optional[dict] = None,
+    quality: ModelQuality = ModelQuality.STANDARD,
+    **values
+) -> Tuple[str, str]:
+    """
+    Renderizar la plantilla y llamar a Gemini con el modelo que elija el
+    router (por el tamaño de la entrada, sin las instrucciones). Registra
+    tokens y latencia de la versión del prompt y devuelve (respuesta, modelo).
+    """
+    rendered = prompt.render(**values)
+    text_length = sum(len(str(value)) for value in values.values())
+    timer = PromptTimer(prompt, rendered)
+    
+    async def call(model: str, timeout: Optional[float], max_retries: Optional[int]):
+        return await get_gemini_gateway().generate_with_usage(
+            rendered, model, timeout=timeout, response_schema=response_schema, max_retries=max_retries
+        )
+    
+    try:
+        (response_text, usage), model = await get_model_router().call(text_length, quality.value, call)
+    except Exception:
+        timer.finish(success=False)
+        raise
+    timer.finish(response_text, usage)
+    return response_text, model
+
+async def local_analysis(text: str) -> dict:
+    """Ejecutar el motor local en el pool de procesos"""
+    return await run_cpu_bound(analyze_locally, text)
+
+def prompt_version_for(text: str, mode: AnalysisMode) -> str:
+    """Versión del prompt que produce el análisis (el motor local no usa prompt)"""
+    return LOCAL_ENGINE if mode == AnalysisMode.FAST else analysis_prompt_for(text).key
+
+async def compute_cache_key(
+    text: str,
+    mode: AnalysisMode,
+    user_id: str,
+    quality: ModelQuality = ModelQuality.STANDARD,
+    prompt_key: Optional[str] = None
+) -> str:
+    """
+    Clave de caché; los textos grandes se normalizan en el pool de procesos.
+    `prompt_key` es la plantilla que generó el resultado si no es la de /analyze
+    (lote, streaming), para no servir su salida como si fuera de otro prompt.
+    """
+    version = prompt_key or prompt_version_for(text, mode)
+    engine = engine_for(mode, quality)
+    if len(text) >= settings.CPU_OFFLOAD_MIN_CHARS:
+        return await run_cpu_bound(cache_key, text, engine, version, user_id)
+    return cache_key(text, engine, version, scope=user_id)
+
+async def parse_analysis_response(response_text: str, text: str, summary: Optional[str] = None) -> dict:
+    """
+    Decodificar la respuesta de Gemini (reparando cercas o JSON truncado).
+    `summary` es el resumen obtenido por otra vía (streaming o texto corto).
+    Los campos que falten se completan con el motor local, sin repetir la
+    llamada; en ese caso el resultado cuenta como degradado y no se cachea.
+    """
+    with span("parse"):
+        analysis_data = decode_analysis(response_text)
+    if summary:
+        analysis_data.setdefault("summary", summary)
+    if not missing_fields(analysis_data):
+        return analysis_data
+    local_data = await local_analysis(text)
+    return {**local_data, **analysis_data, "engine": LOCAL_ENGINE}
+
+async def fallback_analysis(text: str, error: Exception) -> dict:
+    """
+    Modo degradado: analizar con el motor local cuando Gemini falla. La
+    saturación no se degrada, se responde 429 para aplicar backpressure.
+    """
+    if not settings.LOCAL_FALLBACK_ENABLED or isinstance(error, GeminiSaturatedError):
+        raise error
+    print(f"Gemini no disponible, usando motor local: {error}")
+    return await local_analysis(text)
+
+def engine_for(mode: AnalysisMode, quality: ModelQuality = ModelQuality.STANDARD) -> str:
+    """
+    Motor con el que se genera el análisis (forma parte de la clave de caché).
+    Con Gemini basta la calidad: el nivel de modelo depende solo de ella y
+    del texto, que ya está en la clave.
+    """
+    return LOCAL_ENGINE if mode == AnalysisMode.FAST else f"gemini-{quality.value}"
+
+def is_degraded(mode: AnalysisMode, analysis_data: dict) -> bool:
+    """True si se pidió Gemini pero respondió el motor local (no se cachea)"""
+    return mode != AnalysisMode.FAST and analysis_data.get("engine") == LOCAL_ENGINE
+
+def build_insert_data(
+    analysis_id: str, user_id: str, text: str, analysis_data: dict, embedding: Optional[List[float]] = None
+) -> dict:
+    """
+    Preparar la fila de la tabla analyses. created_at se fija aquí (no con
+    el NOW() de Postgres) para que la respuesta, la caché y la fila guardada
+    coincidan aunque el insert se haga más tarde desde el buffer de escritura.
+    """
+    data = {
+        "id": analysis_id,
+        "user_id": user_id,
+        "original_text": text,
+        "summary": analysis_data["summary"],
+        "keywords": analysis_data["keywords"],
+        "sentiment_label": analysis_data["sentiment"]["label"],
+        "sentiment_confidence": float(analysis_data["sentiment"]["confidence"]),
+        "model": analysis_data.get("engine"),
+        "created_at": datetime.now(timezone.utc).isoformat()
+    }
+    if embedding is not None:
+        data["embedding"] = embedding
+    return data
+
+async def save_analyses(repository: SupabaseRepository, rows: List[dict]) -> None:
+    """
+    Guardar filas de analyses. Con el buffer de escritura (en un host
+    persistente) se responde en cuanto quedan en el log local y se insertan
+    en Supabase por lotes; si no, se insertan antes de responder.
+    """
+    with span("store"):
+        if settings.WRITE_BUFFER_ENABLED:
+            await get_write_buffer().add(rows)
+        else:
+            await repository.insert_analyses(rows)
+
+# Columnas que se guardan en Supabase pero no en la caché ni en la respuesta
+STORAGE_ONLY_COLUMNS = ("original_text", "embedding")
+
+def cache_row(insert_data: dict) -> dict:
+    """Fila para la caché: sin texto original ni embedding, con el created_at de la fila"""
+    return {k: v for k, v in insert_data.items() if k not in STORAGE_ONLY_COLUMNS}
+
+async def embed_texts(texts: List[str]) -> List[Optional[List[float]]]:
     """
-    Analizar texto usando Gemini Pro y guardar en Supabase
+    Embeddings para la búsqueda de similares. Son opcionales: se piden con
+    EMBEDDING_TIMEOUT y sin reintentos, y si están desactivados o fallan se
+    devuelve None y el análisis se guarda sin embedding.
     """
+    if not settings.EMBEDDINGS_ENABLED or not texts:
+        return [None] * len(texts)
+    try:
+        return await get_gemini_gateway().embed(
+            [text[:settings.EMBEDDING_MAX_CHARS] for text in texts],
+            settings.EMBEDDING_MODEL,
+            timeout=settings.EMBEDDING_TIMEOUT,
+            max_retries=0
+        )
+    except Exception as e:
+        print(f"Error generando embeddings: {e}")
+        return [None] * len(texts)
+
+async def embed_for(text: str, mode: AnalysisMode) -> Optional[List[float]]:
+    """Embedding de un texto de modo llm; el modo fast no hace llamadas de red"""
+    if mode != AnalysisMode.LLM:
+        return None
+    return (await embed_texts([text]))[0]
+
+async def find_near_duplicate(
+    repository: SupabaseRepository, user_id: str, embedding: Optional[List[float]]
+) -> Optional[dict]:
+    """Análisis previo del usuario casi idéntico (similitud >= NEAR_DUPLICATE_THRESHOLD)"""
+    if embedding is None or settings.NEAR_DUPLICATE_THRESHOLD <= 0:
+        return None
     try:
-        # 1. Configurar el modelo Gemini
-        model = genai.GenerativeModel('gemini-2.0-flash')
+        matches = await repository.match_analyses(
+            user_id, embedding, limit=1, min_similarity=settings.NEAR_DUPLICATE_THRESHOLD
+        )
+    except Exception as e:
+        print(f"Error buscando duplicados: {e}")
+        return None
+    return matches[0] if matches else None
+
+def row_to_response(item: dict, **extra) -> AnalysisResponse:
+    """Convertir una fila de analyses en AnalysisResponse"""
+    return AnalysisResponse(
+        id=item['id'],
+        summary=item['summary'],
+        keywords=item['keywords'],
+        sentiment=SentimentResult(
+            label=item['sentiment_label'],
+            confidence=item['sentiment_confidence']
+        ),
+        created_at=item['created_at'],
+        model=item.get('model'),
+        **extra
+    )
+
+async def analyze_single(
+    text: str, mode: AnalysisMode = AnalysisMode.LLM, quality: ModelQuality = ModelQuality.STANDARD
+) -> dict:
+    """
+    Analizar un texto (con Gemini o con el motor local) y devolver los datos
+    parseados; "engine" indica el modelo que respondió
+    """
+    if mode == AnalysisMode.FAST:
+        return await local_analysis(text)
+    prompt = analysis_prompt_for(text)
+    compact = compact_text(text)
+    # Un texto corto es su propio resumen: solo se piden palabras clave y sentimiento
+    short = prompt.name == "analysis_short"
+    try:
+        response_text, model = await generate_with_prompt(
+            prompt, SHORT_ANALYSIS_SCHEMA if short else ANALYSIS_SCHEMA, quality, text=compact
+        )
+    except Exception as e:
+        return await fallback_analysis(text, e)
+    analysis_data = await parse_analysis_response(response_text, text, summary=compact if short else None)
+    analysis_data.setdefault("engine", model)
+    return analysis_data
+
+async def charge_rate_limit(user_id: str, texts: List[str], prompts: Optional[int] = None) -> Dict[str, str]:
+    """
+    Cobrar al usuario y al presupuesto global los tokens estimados de los
+    textos que irán a Gemini, más las instrucciones de cada prompt (`prompts`,
+    por defecto uno por texto). Se llama solo tras fallar caché e
+    idempotencia, justo antes de llamar al modelo. Devuelve las cabeceras de
+    presupuesto o lanza 429 con Retry-After. Si el backend del limitador
+    falla se deja pasar.
+    """
+    if not settings.RATE_LIMIT_ENABLED or not texts:
+        return {}
+    prompts = len(texts) if prompts is None else prompts
+    tokens = sum(estimate_tokens(text) for text in texts) + prompts * settings.RATE_LIMIT_PROMPT_OVERHEAD_TOKENS
+    try:
+        with span("rate_limit"):
+            decision = await get_rate_limiter().acquire(user_id, tokens)
+    except Exception as e:
+        print(f"Error en el limitador de uso: {e}")
+        return {}
+    if not decision.allowed:
+        raise HTTPException(
+            status_code=429,
+            detail="Límite de uso alcanzado, intenta de nuevo más tarde",
+            headers=decision.headers()
+        )
+    return decision.headers()
+
+def llm_texts(*requests) -> List[str]:
+    """Textos de las solicitudes que se analizarán con Gemini (el modo fast no gasta cuota)"""
+    return [request.text for request in requests if request.mode == AnalysisMode.LLM]
+
+Charge = Callable[[List[str]], Awaitable[None]]
+
+def budget_charger(user_id: str, headers: MutableMapping[str, str]) -> Charge:
+    """Cobro diferido: cobra los textos cuando hace falta y deja las cabeceras en `headers`"""
+    async def charge(texts: List[str]) -> None:
+        headers.update(await charge_rate_limit(user_id, texts))
+    return charge
+
+# Análisis en curso por clave de caché (coalescencia de peticiones idénticas)
+_in_flight = SingleFlight()
+
+# Respuestas ya entregadas por (usuario, Idempotency-Key)
+_idempotent_responses = LRUCache(settings.IDEMPOTENCY_MAX_ENTRIES, settings.IDEMPOTENCY_TTL)
+
+MAX_IDEMPOTENCY_KEY_LENGTH = 255
+
+async def perform_analysis(
+    text: str,
+    mode: AnalysisMode,
+    user_id: str,
+    repository: SupabaseRepository,
+    quality: ModelQuality = ModelQuality.STANDARD,
+    charge: Optional[Charge] = None
+) -> Tuple[AnalysisResponse, Optional[str]]:
+    """
+    Pipeline completo de análisis: caché, Gemini o motor local, Supabase.
+    `charge` cobra el límite de uso solo si el texto llega a Gemini (no en
+    aciertos de caché ni duplicados). Retorna la respuesta y el motor usado
+    (None si vino de caché).
+    """
+    # 1. Buscar en caché por contenido
+    cache = get_analysis_cache()
+    with span("cache"):
+        key = await compute_cache_key(text, mode, user_id, quality)
+        cached = await cache.get(key)
+    if cached is not None:
+        return row_to_response(cached, cached=True), None
+    
+    async def generate_and_store() -> Tuple[AnalysisResponse, Optional[str]]:
+        # 2. Reutilizar un análisis casi idéntico antes de llamar a Gemini
+        embedding = await embed_for(text, mode)
+        duplicate = await find_near_duplicate(repository, user_id, embedding)
+        if duplicate is not None:
+            duplicate.pop("similarity", None)
+            await cache.set(key, duplicate)
+            return row_to_response(duplicate, cached=True), None
+        
+        # 3. Generar y parsear análisis (Gemini o motor local)
+        if charge is not None and mode == AnalysisMode.LLM:
+            await charge([text])
+        analysis_data = await analyze_single(text, mode, quality)
         
-        # 2. Crear prompt para análisis completo
-        prompt = f"""
-        Analiza el siguiente texto y proporciona:
-        1. Un resumen conciso (máximo 200 palabras)
-        2. 5-10 palabras clave principales
-        3. Análisis de sentimiento (positive, negative, neutral) con confianza (0-1)
+        # 4. Guardar en Supabase (con el embedding para búsquedas de similares)
+        analysis_id = str(uuid.uuid4())
+        insert_data = build_insert_data(analysis_id, user_id, text, analysis_data, embedding)
+        await save_analyses(repository, [insert_data])
         
-        Texto a analizar:
-        {request.text}
+        # 5. Guardar en caché (sin el texto original); el modo degradado no se cachea
+        row = cache_row(insert_data)
+        if not is_degraded(mode, analysis_data):
+            await cache.set(key, row)
         
-        Responde en formato JSON:
-        {{
-            "summary": "resumen aquí",
-            "keywords": ["palabra1", "palabra2", "palabra3"],
-            "sentiment": {{
-                "label": "positive/negative/neutral",
-                "confidence": 0.85
-            }}
-        }}
-        """
+        return row_to_response(row, cached=False), analysis_data.get("engine")
+    
+    # Peticiones idénticas concurrentes comparten una sola llamada y una sola fila
+    return await _in_flight.do(key, generate_and_store)
+
+@router.post("/analyze", response_model=AnalysisResponse)
+async def analyze_text(
+    request: AnalysisRequest,
+    response: Response,
+    user_id: str = Depends(get_current_user_id),
+    repository: SupabaseRepository = Depends(get_repository),
+    idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key")
+):
+    """
+    Analizar texto usando Gemini Pro y guardar en Supabase.
+    
+    Con la cabecera Idempotency-Key, los reintentos con la misma clave
+    devuelven la respuesta original sin volver a analizar ni insertar.
+    """
+    try:
+        if idempotency_key is not None:
+            return await analyze_idempotent(request, response, user_id, repository, idempotency_key)
         
-        # 3. Generar análisis con Gemini Pro
-        response = model.generate_content(prompt)
+        result, engine = await perform_analysis(
+            request.text, request.mode, user_id, repository, request.quality,
+            charge=budget_charger(user_id, response.headers)
+        )
+        response.headers["X-Cache"] = "HIT" if result.cached else "MISS"
+        if engine:
+            response.headers["X-Analysis-Engine"] = engine
+        return result
         
-        # 4. Parsear respuesta JSON
+    except HTTPException:
+        raise
+    except (GeminiSaturatedError, WorkerPoolSaturatedError) as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": "1"})
+    except (GeminiTimeoutError, WorkerTimeoutError) as e:
+        raise HTTPException(status_code=504, detail=str(e))
+    except CircuitOpenError as e:
+        raise HTTPException(
+            status_code=503, detail=str(e), headers={"Retry-After": str(int(settings.GEMINI_BREAKER_COOLDOWN))}
+        )
+    except Exception as e:
+        print(f"Error en análisis: {e}")
+        raise HTTPException(status_code=500, detail=f"Error procesando análisis: {str(e)}")
+
+async def analyze_idempotent(
+    request: AnalysisRequest,
+    response: Response,
+    user_id: str,
+    repository: SupabaseRepository,
+    idempotency_key: str
+) -> AnalysisResponse:
+    """
+    Analizar una sola vez por (usuario, Idempotency-Key). Reutilizar la clave
+    con otro texto o modo es un error del cliente (422).
+    """
+    if not idempotency_key or len(idempotency_key) > MAX_IDEMPOTENCY_KEY_LENGTH:
+        raise HTTPException(status_code=400, detail="Idempotency-Key inválida")
+    
+    store_key = f"{user_id}:{idempotency_key}"
+    fingerprint = await compute_cache_key(request.text, request.mode, user_id, request.quality)
+    stored = _idempotent_responses.get(store_key)
+    if stored is None:
+        async def analyze_once() -> Tuple[AnalysisResponse, Optional[str]]:
+            result, engine = await perform_analysis(
+                request.text, request.mode, user_id, repository, request.quality,
+                charge=budget_charger(user_id, response.headers)
+            )
+            if _idempotent_responses.get(store_key) is None:
+                _idempotent_responses.set(store_key, {
+                    "fingerprint": fingerprint,
+                    "response": result.model_dump(mode="json"),
+                    "engine": engine
+                })
+            return result, engine
+        
+        result, engine = await _in_flight.do(f"idempotency:{store_key}:{fingerprint}", analyze_once)
+        stored = _idempotent_responses.get(store_key)
+        if stored is None or stored["fingerprint"] == fingerprint:
+            response.headers["X-Cache"] = "HIT" if result.cached else "MISS"
+            if engine:
+                response.headers["X-Analysis-Engine"] = engine
+            return result
+    
+    if stored["fingerprint"] != fingerprint:
+        raise HTTPException(
+            status_code=422,
+            detail="La Idempotency-Key ya se usó con un texto o modo distinto"
+        )
+    response.headers["Idempotent-Replayed"] = "true"
+    return AnalysisResponse(**stored["response"])
+
+async def run_analysis_job(job: dict) -> dict:
+    """Procesar un trabajo de la cola con el mismo pipeline que /analyze"""
+    payload = job["payload"]
+    result, _ = await perform_analysis(
+        payload["text"],
+        AnalysisMode(payload["mode"]),
+        job["user_id"],
+        get_repository(),
+        ModelQuality(payload.get("quality", ModelQuality.STANDARD.value))
+    )
+    return result.model_dump(mode="json")
+
+get_job_queue().set_handler(run_analysis_job)
+
+def job_to_response(job: dict) -> AnalysisJob:
+    """Convertir un trabajo del almacén a AnalysisJob"""
+    return AnalysisJob(
+        id=job["id"],
+        status=job["status"],
+        created_at=job["created_at"],
+        updated_at=job["updated_at"],
+        result=AnalysisResponse(**job["result"]) if job.get("result") else None,
+        error=job.get("error")
+    )
+
+@router.post("/jobs", response_model=AnalysisJob, status_code=202)
+async def submit_analysis_job(
+    request: AnalysisRequest,
+    http_request: Request,
+    response: Response,
+    user_id: str = Depends(get_current_user_id)
+):
+    """
+    Encolar un análisis y responder de inmediato con el ID del trabajo;
+    el resultado se consulta en GET /jobs/{job_id}. Responde 503 si el
+    despliegue no tiene workers que procesen la cola (ver services/jobs.py).
+    """
+    job_queue = get_job_queue()
+    if not job_queue.accepts_jobs:
+        raise HTTPException(status_code=503, detail="La cola de trabajos no está disponible en este despliegue")
+    # Se cobra al encolar salvo que el resultado ya esté en caché
+    if request.mode == AnalysisMode.LLM:
+        key = await compute_cache_key(request.text, request.mode, user_id, request.quality)
+        if await get_analysis_cache().get(key) is None:
+            response.headers.update(await charge_rate_limit(user_id, [request.text]))
+    try:
+        job = await job_queue.submit(user_id, {
+            "text": request.text, "mode": request.mode.value, "quality": request.quality.value
+        })
+    except JobQueueFullError as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": "5"})
+    except JobsUnavailableError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    response.headers["Location"] = str(http_request.url_for("get_analysis_job", job_id=job["id"]))
+    return job_to_response(job)
+
+@router.get("/jobs/{job_id}", response_model=AnalysisJob)
+async def get_analysis_job(
+    job_id: str,
+    response: Response,
+    user_id: str = Depends(get_current_user_id)
+):
+    """
+    Consultar el estado y, si terminó, el resultado de un trabajo
+    """
+    job = await get_job_queue().get(job_id)
+    if job is None or job["user_id"] != user_id:
+        raise HTTPException(status_code=404, detail="Trabajo no encontrado")
+    if job["status"] in (JobStatus.QUEUED, JobStatus.RUNNING):
+        response.headers["Retry-After"] = "1"
+    return job_to_response(job)
+
+# Separador entre el resumen en texto plano y el JSON en el prompt de streaming
+STREAM_MARKER = "###JSON###"
+
+class SummaryStreamSplitter:
+    """
+    Separar la respuesta en streaming en el resumen (que se reenvía según
+    llega) y el JSON final. Se retiene la cola del buffer que podría ser el
+    inicio del separador partido entre fragmentos.
+    """
+
+    def __init__(self, marker: str = STREAM_MARKER):
+        self.marker = marker
+        self.buffer = ""
+        self.emitted = 0
+        self.marker_at: Optional[int] = None
+
+    def feed(self, chunk: str) -> str:
+        """Agregar un fragmento y devolver el texto de resumen nuevo"""
+        self.buffer += chunk
+        if self.marker_at is not None:
+            return ""
+        index = self.buffer.find(self.marker, max(0, self.emitted - len(self.marker)))
+        if index >= 0:
+            self.marker_at = index
+            end = index
+        else:
+            end = max(self.emitted, len(self.buffer) - len(self.marker) + 1)
+        delta = self.buffer[self.emitted:end]
+        self.emitted = end
+        return delta
+
+    def finish(self) -> Tuple[str, str, str]:
+        """Devolver (resto del resumen, resumen completo, texto JSON)"""
+        if self.marker_at is None:
+            delta = self.buffer[self.emitted:]
+            return delta, self.buffer.strip(), ""
+        return "", self.buffer[:self.marker_at].strip(), self.buffer[self.marker_at + len(self.marker):]
+
+def sse_event(event: str, data: dict) -> str:
+    """Formatear un evento Server-Sent Events"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False, default=str)}\n\n"
+
+@router.post("/analyze/stream")
+async def analyze_text_stream(
+    request: AnalysisRequest,
+    user_id: str = Depends(get_current_user_id),
+    repository: SupabaseRepository = Depends(get_repository)
+):
+    """
+    Analizar texto en streaming (SSE). Eventos:
+        summary  -> {"delta": "..."} según Gemini genera el resumen
+        analysis -> {"keywords": [...], "sentiment": {...}} al terminar
+        done     -> AnalysisResponse completo, tras guardar en Supabase
+        error    -> {"detail": "..."}
+    """
+    # La caché se consulta antes de empezar el stream: el cobro del límite de
+    # uso (solo si hay que llamar a Gemini) puede responder 429 con cabeceras
+    cache = get_analysis_cache()
+    key = await compute_cache_key(request.text, request.mode, user_id, request.quality)
+    cached = await cache.get(key)
+    if cached is None and request.mode == AnalysisMode.LLM:
+        # Lo generado por /analyze o por este endpoint, que se cachea con el prompt de streaming
+        key = await compute_cache_key(
+            request.text, request.mode, user_id, request.quality, get_prompt("stream", request.text).key
+        )
+        cached = await cache.get(key)
+    budget_headers = {} if cached is not None else await charge_rate_limit(user_id, llm_texts(request))
+    
+    async def events() -> AsyncIterator[str]:
         try:
-            # Limpiar la respuesta para extraer solo el JSON
-            response_text = response.text.strip()
-            if response_text.startswith('```json'):
-                response_text = response_text[7:-3]
-            elif response_text.startswith('```'):
-                response_text = response_text[3:-3]
+            # 1. Si está en caché se envía todo de inmediato
+            if cached is not None:
+                analysis = row_to_response(cached, cached=True)
+                yield sse_event("summary", {"delta": analysis.summary})
+                yield sse_event("analysis", {"keywords": analysis.keywords, "sentiment": analysis.sentiment.model_dump(mode="json")})
+                yield sse_event("done", analysis.model_dump(mode="json"))
+                return
             
-            analysis_data = json.loads(response_text)
-        except json.JSONDecodeError:
-            # Fallback si no se puede parsear JSON
-            analysis_data = {
-                "summary": f"Análisis del texto proporcionado: {request.text[:100]}...",
-                "keywords": ["análisis", "texto", "contenido"],
-                "sentiment": {"label": "neutral", "confidence": 0.7}
-            }
-        
-        # 5. Guardar en Supabase
-        analysis_id = str(uuid.uuid4())
+            # 2. Reenviar el resumen según llega (el modo fast y el degradado
+            #    antes del primer fragmento envían el resumen local de una vez)
+            splitter = SummaryStreamSplitter()
+            analysis_data = None
+            if request.mode == AnalysisMode.FAST:
+                analysis_data = await local_analysis(request.text)
+            else:
+                prompt = get_prompt("stream", request.text)
+                # Sin failover: el resumen empieza a enviarse con el primer fragmento
+                model = get_model_router().candidates(len(request.text), request.quality.value)[0]
+                rendered = prompt.render(marker=STREAM_MARKER, text=compact_text(request.text))
+                timer = PromptTimer(prompt, rendered)
+                output = []
+                try:
+                    async for chunk in get_gemini_gateway().generate_stream(rendered, model):
+                        output.append(chunk)
+                        delta = splitter.feed(chunk)
+                        if delta:
+                            yield sse_event("summary", {"delta": delta})
+                    timer.finish("".join(output))
+                except Exception as e:
+                    timer.finish(success=False)
+                    if splitter.emitted:
+                        raise
+                    analysis_data = await fallback_analysis(request.text, e)
+            
+            if analysis_data is not None:
+                yield sse_event("summary", {"delta": analysis_data["summary"]})
+            else:
+                delta, summary, json_text = splitter.finish()
+                if delta:
+                    yield sse_event("summary", {"delta": delta})
+                
+                # 3. Parsear palabras clave y sentimiento
+                analysis_data = await parse_analysis_response(json_text, request.text, summary=summary)
+                analysis_data.setdefault("engine", model)
+            yield sse_event("analysis", {"keywords": analysis_data["keywords"], "sentiment": analysis_data["sentiment"]})
+            
+            # 4. Guardar en Supabase y en caché
+            embedding = await embed_for(request.text, request.mode)
+            insert_data = build_insert_data(str(uuid.uuid4()), user_id, request.text, analysis_data, embedding)
+            await save_analyses(repository, [insert_data])
+            row = cache_row(insert_data)
+            if not is_degraded(request.mode, analysis_data):
+                await cache.set(key, row)
+            
+            yield sse_event("done", row_to_response(row).model_dump(mode="json"))
+            
+        except Exception as e:
+            print(f"Error en análisis en streaming: {e}")
+            yield sse_event("error", {"detail": f"Error procesando análisis: {str(e)}"})
+    
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no", **budget_headers}
+    )
+
+async def reduce_summaries(
+    summaries: List[str], mode: AnalysisMode, quality: ModelQuality = ModelQuality.STANDARD
+) -> Tuple[str, Optional[str]]:
+    """
+    Fusionar resúmenes parciales; devuelve (resumen, motor que lo fusionó),
+    con None si había un solo resumen y no hizo falta fusionar
+    """
+    if len(summaries) == 1:
+        return summaries[0], None
+    joined = "\n\n".join(summaries)
+    if mode == AnalysisMode.FAST:
+        return (await local_analysis(joined))["summary"], LOCAL_ENGINE
+    try:
+        summary, model = await generate_with_prompt(
+            get_prompt("reduce"), quality=quality, parts=format_summaries(summaries)
+        )
+        return summary.strip(), model
+    except Exception as e:
+        return (await fallback_analysis(joined, e))["summary"], LOCAL_ENGINE
+
+async def analyze_chunks(
+    chunks: List[str], mode: AnalysisMode, quality: ModelQuality = ModelQuality.STANDARD
+) -> List[Optional[dict]]:
+    """
+    Map de un documento largo: analizar los fragmentos con una concurrencia
+    acotada (un documento de cientos de fragmentos no ocupa todo el gateway).
+    Un fragmento que falla (p. ej. por saturación) se analiza con el motor
+    local; si tampoco es posible su resultado es None.
+    """
+    limit = asyncio.Semaphore(max(1, min(settings.LONG_DOC_MAX_CONCURRENCY, settings.GEMINI_MAX_CONCURRENCY // 2)))
+    
+    async def analyze_chunk(chunk: str) -> Optional[dict]:
+        async with limit:
+            try:
+                return await analyze_single(chunk, mode, quality)
+            except Exception as e:
+                if mode == AnalysisMode.FAST or not settings.LOCAL_FALLBACK_ENABLED:
+                    print(f"Error analizando fragmento: {e}")
+                    return None
+                print(f"Error analizando fragmento, usando motor local: {e}")
+            try:
+                return await local_analysis(chunk)
+            except Exception as e:
+                print(f"Error analizando fragmento con el motor local: {e}")
+                return None
+    
+    return await asyncio.gather(*(analyze_chunk(chunk) for chunk in chunks))
+
+@router.post("/analyze/long", response_model=AnalysisResponse)
+async def analyze_long_document(
+    request: LongAnalysisRequest,
+    response: Response,
+    user_id: str = Depends(get_current_user_id),
+    repository: SupabaseRepository = Depends(get_repository)
+):
+    """
+    Analizar un documento largo con map-reduce: se divide en fragmentos por
+    párrafos/oraciones, los fragmentos se analizan en paralelo (con
+    concurrencia acotada) y después se fusionan resúmenes, palabras clave y
+    sentimiento. Los fragmentos que no se pudieron analizar se omiten y se
+    informan en X-Chunk-Failures; el resultado parcial no se cachea.
+    """
+    try:
+        # 1. Buscar en caché por contenido
+        cache = get_analysis_cache()
+        key = await run_cpu_bound(cache_key, request.text, engine_for(request.mode, request.quality), get_prompt("analysis").key + "-long", user_id)
+        cached = await cache.get(key)
+        if cached is not None:
+            response.headers["X-Cache"] = "HIT"
+            return row_to_response(cached, cached=True)
+        response.headers["X-Cache"] = "MISS"
         
-        # Para pruebas, usar un UUID válido que existe en auth.users
-        # En producción, esto vendría del token de autenticación
-        user_id = "633a8bbc-6727-426b-ad97-a497fbb15653"
-        
-        # Preparar datos para insertar
-        insert_data = {
-            "id": analysis_id,
-            "user_id": user_id,
-            "original_text": request.text,
-            "summary": analysis_data["summary"],
-            "keywords": analysis_data["keywords"],
-            "sentiment_label": analysis_data["sentiment"]["label"],
-            "sentiment_confidence": float(analysis_data["sentiment"]["confidence"])
-        }
+        # 2. Dividir en fragmentos (en el pool de procesos)
+        chunks = await run_cpu_bound(split_into_chunks, request.text, settings.LONG_DOC_CHUNK_TOKENS)
+        if not chunks:
+            raise HTTPException(status_code=400, detail="El documento no contiene texto")
+        response.headers["X-Chunk-Count"] = str(len(chunks))
         
-        # Insertar en Supabase
-        result = supabase.table('analyses').insert(insert_data).execute()
+        # Se cobran los fragmentos y la fusión: un prompt por fragmento más el de reduce
+        if request.mode == AnalysisMode.LLM:
+            prompts = len(chunks) + (1 if len(chunks) > 1 else 0)
+            response.headers.update(await charge_rate_limit(user_id, chunks, prompts=prompts))
         
-        if not result.data:
-            raise HTTPException(status_code=500, detail="Error guardando análisis")
+        # 3. Map: analizar los fragmentos en paralelo
+        outcomes = await analyze_chunks(chunks, request.mode, request.quality)
+        partials = [partial for partial in outcomes if partial is not None]
+        weights = [len(chunk) for chunk, partial in zip(chunks, outcomes) if partial is not None]
+        failed_chunks = len(chunks) - len(partials)
+        if not partials:
+            raise HTTPException(
+                status_code=503, detail="No se pudo analizar ningún fragmento del documento",
+                headers={"Retry-After": "5"}
+            )
+        if failed_chunks:
+            response.headers["X-Chunk-Failures"] = str(failed_chunks)
         
-        # 6. Retornar respuesta
-        return AnalysisResponse(
-            id=analysis_id,
-            summary=analysis_data["summary"],
-            keywords=analysis_data["keywords"],
-            sentiment=SentimentResult(
-                label=analysis_data["sentiment"]["label"],
-                confidence=analysis_data["sentiment"]["confidence"]
-            ),
-            created_at=datetime.now()
+        # 4. Reduce: fusionar resumen, palabras clave y sentimiento
+        summary, reduce_engine = await reduce_summaries(
+            [p["summary"] for p in partials], request.mode, request.quality
+        )
+        analysis_data = {
+            "summary": summary,
+            "keywords": merge_keywords([p["keywords"] for p in partials], weights),
+            "sentiment": merge_sentiments([p["sentiment"] for p in partials], weights),
+            "engine": reduce_engine or partials[0].get("engine"),
+        }
+        degraded = (
+            failed_chunks > 0
+            or is_degraded(request.mode, analysis_data)
+            or any(is_degraded(request.mode, p) for p in partials)
         )
         
+        # 5. Guardar en Supabase y en caché
+        embedding = await embed_for(request.text, request.mode)
+        insert_data = build_insert_data(str(uuid.uuid4()), user_id, request.text, analysis_data, embedding)
+        await save_analyses(repository, [insert_data])
+        row = cache_row(insert_data)
+        if not degraded:
+            await cache.set(key, row)
+        
+        return row_to_response(row, cached=False)
+        
+    except HTTPException:
+        raise
+    except (GeminiSaturatedError, WorkerPoolSaturatedError) as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": "1"})
+    except (GeminiTimeoutError, WorkerTimeoutError) as e:
+        raise HTTPException(status_code=504, detail=str(e))
+    except CircuitOpenError as e:
+        raise HTTPException(
+            status_code=503, detail=str(e), headers={"Retry-After": str(int(settings.GEMINI_BREAKER_COOLDOWN))}
+        )
     except Exception as e:
-        print(f"Error en análisis: {e}")
+        print(f"Error en análisis de documento largo: {e}")
         raise HTTPException(status_code=500, detail=f"Error procesando análisis: {str(e)}")
 
+def pack_texts(items: List[Tuple[int, str]], max_chars: int, max_items: int) -> List[List[Tuple[int, str]]]:
+    """
+    Agrupar textos cortos en paquetes que caben en un mismo prompt.
+    Un texto más largo que max_chars queda solo en su paquete.
+    """
+    packs: List[List[Tuple[int, str]]] = []
+    current: List[Tuple[int, str]] = []
+    current_chars = 0
+    for index, text in items:
+        if current and (current_chars + len(text) > max_chars or len(current) >= max_items):
+            packs.append(current)
+            current, current_chars = [], 0
+        current.append((index, text))
+        current_chars += len(text)
+    if current:
+        packs.append(current)
+    return packs
+
+async def analyze_pack(
+    pack: List[Tuple[int, str]], quality: ModelQuality = ModelQuality.STANDARD
+) -> Dict[int, dict]:
+    """
+    Analizar un paquete de textos con una sola llamada a Gemini. Si la
+    respuesta empaquetada no se puede interpretar, cada texto se analiza
+    por separado de forma concurrente.
+    """
+    if len(pack) == 1:
+        index, text = pack[0]
+        return {index: await analyze_single(text, quality=quality)}
+    
+    prompt = get_prompt("batch", pack[0][1])
+    try:
+        response_text, model = await generate_with_prompt(
+            prompt, BATCH_ANALYSIS_SCHEMA, quality, texts=format_batch_texts(pack)
+        )
+    except Exception as e:
+        datas = await asyncio.gather(*(fallback_analysis(text, e) for _, text in pack))
+        return {index: data for (index, _), data in zip(pack, datas)}
+    
+    # Solo se vuelven a analizar los textos que faltan o vienen incompletos
+    # (p. ej. el último de una respuesta truncada). "prompt" indica que el
+    # resultado salió del prompt de lote y se cachea bajo su propia clave
+    decoded = decode_batch_analysis(response_text)
+    results = {
+        index: {**decoded[index], "engine": model, "prompt": prompt.key}
+        for index, _ in pack if not missing_fields(decoded.get(index, {}))
+    }
+    retry = [(index, text) for index, text in pack if index not in results]
+    datas = await asyncio.gather(*(analyze_single(text, quality=quality) for _, text in retry))
+    results.update({index: data for (index, _), data in zip(retry, datas)})
+    return results
+
+@router.post("/analyze/batch", response_model=BatchAnalysisResponse)
+async def analyze_batch(
+    request: BatchAnalysisRequest,
+    response: Response,
+    user_id: str = Depends(get_current_user_id),
+    repository: SupabaseRepository = Depends(get_repository)
+):
+    """
+    Analizar varios textos: los cortos se empaquetan en un mismo prompt, los
+    paquetes se procesan en paralelo y las filas se guardan con un único insert
+    """
+    items = request.items
+    cache = get_analysis_cache()
+    results: List[Optional[BatchItemResult]] = [None] * len(items)
+    keys = [await compute_cache_key(item.text, item.mode, user_id, item.quality) for item in items]
+    
+    # 1. Resolver desde caché lo que ya se analizó (con el prompt individual o
+    #    con el de lote); el modo fast se resuelve localmente y el resto se
+    #    agrupa por calidad y versión del prompt de lote (cada paquete va a un
+    #    solo modelo y con una sola versión, la que el canary asigna a cada
+    #    texto, así que se cachea bajo la misma clave que aquí se consulta)
+    pending: Dict[Tuple[ModelQuality, str], List[Tuple[int, str]]] = {}
+    packs: List[List[Tuple[int, str]]] = []
+    for index, item in enumerate(items):
+        cached = await cache.get(keys[index])
+        batch_prompt_key = get_prompt("batch", item.text).key
+        if cached is None and item.mode == AnalysisMode.LLM:
+            cached = await cache.get(
+                await compute_cache_key(item.text, item.mode, user_id, item.quality, batch_prompt_key)
+            )
+        if cached is not None:
+            results[index] = BatchItemResult(index=index, success=True, analysis=row_to_response(cached, cached=True))
+        elif item.mode == AnalysisMode.FAST:
+            packs.append([(index, item.text)])
+        else:
+            pending.setdefault((item.quality, batch_prompt_key), []).append((index, item.text))
+    
+    async def analyze_fast(pack: List[Tuple[int, str]]) -> Dict[int, dict]:
+        index, text = pack[0]
+        return {index: await local_analysis(text)}
+    
+    # 2. Empaquetar y analizar en paralelo (el gateway limita la concurrencia
+    #    de Gemini y el pool de procesos la del motor local)
+    fast_count = len(packs)
+    pack_qualities: List[ModelQuality] = []
+    for (quality, _), group in pending.items():
+        for pack in pack_texts(group, settings.BATCH_PACK_MAX_CHARS, settings.BATCH_PACK_MAX_ITEMS):
+            packs.append(pack)
+            pack_qualities.append(quality)
+    
+    # Solo se cobra lo que va a Gemini: los textos sin caché y un prompt por paquete
+    llm_packs = packs[fast_count:]
+    response.headers.update(await charge_rate_limit(
+        user_id, [text for pack in llm_packs for _, text in pack], prompts=len(llm_packs)
+    ))
+    outcomes = await asyncio.gather(
+        *(
+            analyze_fast(pack) if position < fast_count else analyze_pack(pack, pack_qualities[position - fast_count])
+            for position, pack in enumerate(packs)
+        ),
+        return_exceptions=True
+    )
+    
+    # Embeddings de todos los textos analizados con Gemini en una sola llamada
+    analyzed = [
+        (index, text)
+        for pack, outcome in zip(packs, outcomes) if not isinstance(outcome, Exception)
+        for index, text in pack if items[index].mode == AnalysisMode.LLM
+    ]
+    embeddings = dict(zip(
+        (index for index, _ in analyzed),
+        await embed_texts([text for _, text in analyzed])
+    ))
+    
+    rows: List[dict] = []
+    row_indexes: List[int] = []
+    degraded = set()
+    for pack, outcome in zip(packs, outcomes):
+        for index, text in pack:
+            if isinstance(outcome, Exception):
+                results[index] = BatchItemResult(index=index, success=False, error=str(outcome) or type(outcome).__name__)
+                continue
+            try:
+                rows.append(build_insert_data(str(uuid.uuid4()), user_id, text, outcome[index], embeddings.get(index)))
+                row_indexes.append(index)
+                if is_degraded(items[index].mode, outcome[index]):
+                    degraded.add(index)
+                elif outcome[index].get("prompt"):
+                    item = items[index]
+                    keys[index] = await compute_cache_key(
+                        text, item.mode, user_id, item.quality, outcome[index]["prompt"]
+                    )
+            except (KeyError, TypeError, ValueError) as e:
+                results[index] = BatchItemResult(index=index, success=False, error=f"Respuesta inválida: {e}")
+    
+    # 3. Guardar todas las filas con un único insert (o en el buffer de escritura)
+    if rows:
+        try:
+            await save_analyses(repository, rows)
+        except Exception as e:
+            print(f"Error guardando lote: {e}")
+            for index in row_indexes:
+                results[index] = BatchItemResult(index=index, success=False, error=f"Error guardando análisis: {str(e)}")
+        else:
+            for index, row in zip(row_indexes, rows):
+                row = cache_row(row)
+                if index not in degraded:
+                    await cache.set(keys[index], row)
+                results[index] = BatchItemResult(index=index, success=True, analysis=row_to_response(row))
+    
+    succeeded = sum(1 for result in results if result.success)
+    return BatchAnalysisResponse(
+        results=results,
+        succeeded=succeeded,
+        failed=len(results) - succeeded
+    )
+
+def encode_cursor(*position) -> str:
+    """Codificar la posición de la última fila (p. ej. created_at, id) como cursor opaco"""
+    raw = json.dumps([str(value) for value in position], separators=(",", ":"))
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+def decode_cursor(cursor: str, size: int = 2) -> Tuple[str, ...]:
+    """Decodificar un cursor generado por encode_cursor con `size` valores"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        position = json.loads(raw)
+        if not isinstance(position, list) or len(position) != size:
+            raise ValueError("tamaño de cursor inesperado")
+        return tuple(str(value) for value in position)
+    except (ValueError, TypeError):
+        raise HTTPException(status_code=400, detail="Cursor inválido")
+
+_FRACTION_RE = re.compile(r"\.(\d+)")
+
+def parse_timestamp(value: str) -> datetime:
+    """
+    Parsear un timestamp ISO 8601 como los que devuelve PostgREST. En
+    Python 3.9 fromisoformat no acepta "Z" ni fracciones que no tengan 3 o
+    6 dígitos (Postgres quita los ceros finales), así que se normalizan.
+    """
+    if value.endswith("Z"):
+        value = value[:-1] + "+00:00"
+    value = _FRACTION_RE.sub(lambda match: "." + match.group(1)[:6].ljust(6, "0"), value, count=1)
+    return datetime.fromisoformat(value)
+
+def decode_history_cursor(cursor: str) -> Tuple[str, str]:
+    """(created_at, id) validados de un cursor de /history; 400 si no lo son"""
+    created_at, analysis_id = decode_cursor(cursor)
+    try:
+        return parse_timestamp(created_at).isoformat(), str(uuid.UUID(analysis_id))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Cursor inválido")
+
+def decode_search_cursor(cursor: str) -> Tuple[float, str, str]:
+    """(rank, created_at, id) validados de un cursor de /search; 400 si no lo son"""
+    rank, created_at, analysis_id = decode_cursor(cursor, size=3)
+    try:
+        rank_value = float(rank)
+        if not math.isfinite(rank_value):
+            raise ValueError("rank no finito")
+        return rank_value, parse_timestamp(created_at).isoformat(), str(uuid.UUID(analysis_id))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Cursor inválido")
+
+def parse_analysis_id(analysis_id: str) -> str:
+    """ID de análisis en forma canónica; 400 si no es un UUID"""
+    try:
+        return str(uuid.UUID(analysis_id))
+    except ValueError:
+        raise HTTPException(status_code=400, detail="ID de análisis inválido")
+
+# Total estimado del historial por usuario
+_history_totals = LRUCache(1024, settings.HISTORY_COUNT_CACHE_TTL)
+
+async def get_history_total(repository: SupabaseRepository, user_id: str) -> int:
+    """Total estimado de análisis del usuario, reutilizado durante HISTORY_COUNT_CACHE_TTL"""
+    cached = _history_totals.get(user_id)
+    if cached is None:
+        cached = {"total": await repository.count_analyses(estimated=True, user_id=user_id)}
+        _history_totals.set(user_id, cached)
+    return cached["total"]
+
 @router.get("/history", response_model=AnalysisHistory)
-async def get_analysis_history(page: int = 1, limit: int = 10):
+async def get_analysis_history(
+    page: int = Query(1, ge=1),
+    limit: int = Query(10, ge=1, le=100),
+    cursor: Optional[str] = None,
+    include_total: bool = False,
+    user_id: str = Depends(get_current_user_id),
+    repository: SupabaseRepository = Depends(get_repository)
+):
     """
-    Obtener historial de análisis del usuario con paginación
+    Obtener historial de análisis del usuario con paginación.
+    
+    Usar `cursor` (el `next_cursor` de la página anterior) para paginar por
+    keyset: cada página cuesta lo mismo que la primera. `page` se mantiene
+    por compatibilidad y usa OFFSET. El total solo se calcula con
+    include_total=true y es una estimación cacheada.
     """
     try:
-        # Calcular offset para paginación
-        offset = (page - 1) * limit
-        
-        # Obtener análisis con paginación
-        result = supabase.table('analyses')\
-            .select("*")\
-            .order('created_at', desc=True)\
-            .range(offset, offset + limit - 1)\
-            .execute()
-        
-        # Obtener total de registros
-        count_result = supabase.table('analyses')\
-            .select("id", count="exact")\
-            .execute()
+        # Obtener una fila extra para saber si hay más páginas
+        with span("history_page"):
+            if cursor:
+                rows = await repository.page_analyses(
+                    limit + 1, after=decode_history_cursor(cursor), columns=ANALYSIS_LIST_COLUMNS, user_id=user_id
+                )
+            else:
+                rows = await repository.page_analyses(
+                    limit + 1, offset=(page - 1) * limit, columns=ANALYSIS_LIST_COLUMNS, user_id=user_id
+                )
         
-        total = count_result.count if count_result.count else 0
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            last = rows[-1]
+            next_cursor = encode_cursor(last['created_at'], last['id'])
         
         # Convertir datos a formato de respuesta
         analyses = []
-        for item in result.data:
-            analyses.append(AnalysisResponse(
-                id=item['id'],
-                summary=item['summary'],
-                keywords=item['keywords'],
-                sentiment=SentimentResult(
-                    label=item['sentiment_label'],
-                    confidence=item['sentiment_confidence']
-                ),
-                created_at=item['created_at']
-            ))
-        
-        # Calcular total de páginas
-        total_pages = (total + limit - 1) // limit if total > 0 else 0
+        for item in rows:
+            analyses.append(row_to_response(item))
+        
+        total = None
+        if include_total:
+            with span("history_total"):
+                total = await get_history_total(repository, user_id)
         
         return AnalysisHistory(
             analyses=analyses,
             total=total,
             page=page,
             limit=limit,
-            total_pages=total_pages
+            next_cursor=next_cursor
         )
         
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"Error obteniendo historial: {e}")
         raise HTTPException(status_code=500, detail=f"Error obteniendo historial: {str(e)}")
 
+@router.get("/search", response_model=AnalysisHistory)
+async def search_analysis_history(
+    q: str = Query(..., min_length=1, max_length=200),
+    include_text: bool = False,
+    page: int = Query(1, ge=1),
+    limit: int = Query(10, ge=1, le=100),
+    cursor: Optional[str] = None,
+    user_id: str = Depends(get_current_user_id),
+    repository: SupabaseRepository = Depends(get_repository)
+):
+    """
+    Buscar en el historial por resumen y palabras clave (y en el texto
+    original con include_text=true), ordenado por relevancia.
+    
+    `q` admite la sintaxis de búsqueda web ("frase exacta", -excluir, or).
+    La paginación es la misma que en /history: `cursor` por keyset o `page`.
+    """
+    try:
+        # Obtener una fila extra para saber si hay más páginas
+        if cursor:
+            rows = await repository.search_analyses(
+                user_id, q, limit + 1, after=decode_search_cursor(cursor), include_text=include_text
+            )
+        else:
+            rows = await repository.search_analyses(
+                user_id, q, limit + 1, offset=(page - 1) * limit, include_text=include_text
+            )
+        
+        next_cursor = None
+        if len(rows) > limit:
+            rows = rows[:limit]
+            last = rows[-1]
+            next_cursor = encode_cursor(last['rank'], last['created_at'], last['id'])
+        
+        return AnalysisHistory(
+            analyses=[row_to_response(item) for item in rows],
+            page=page,
+            limit=limit,
+            next_cursor=next_cursor
+        )
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        print(f"Error buscando análisis: {e}")
+        raise HTTPException(status_code=500, detail=f"Error buscando análisis: {str(e)}")
+
+@router.get("/stats", response_model=AnalysisStats)
+async def get_analysis_stats(
+    user_id: str = Depends(get_current_user_id),
+    repository: SupabaseRepository = Depends(get_repository)
+):
+    """
+    Estadísticas del usuario (total, distribución de sentimiento, palabras
+    clave más comunes, análisis del mes y confianza media), leídas de
+    agregados que se actualizan en cada inserción
+    """
+    try:
+        stats = await repository.get_analysis_stats(user_id)
+        return AnalysisStats(**stats)
+        
+    except Exception as e:
+        print(f"Error obteniendo estadísticas: {e}")
+        raise HTTPException(status_code=500, detail=f"Error obteniendo estadísticas: {str(e)}")
+
+@router.get("/prompts/usage", response_model=List[PromptUsage], include_in_schema=False)
+async def get_prompt_usage_stats(authorization: Optional[str] = Header(None)):
+    """
+    Tokens, latencia y errores por versión de prompt desde el arranque del
+    proceso, para comparar versiones durante un despliegue gradual. Son
+    datos de todo el proceso, así que es interno como /metrics: requiere
+    Authorization: Bearer METRICS_TOKEN y sin token configurado no existe.
+    """
+    if not settings.METRICS_TOKEN:
+        raise HTTPException(status_code=404, detail="No encontrado")
+    if authorization != f"Bearer {settings.METRICS_TOKEN}":
+        raise HTTPException(status_code=401, detail="No autorizado")
+    return [PromptUsage(**row) for row in get_prompt_usage().snapshot()]
+
 @router.get("/history/{analysis_id}", response_model=AnalysisResponse)
-async def get_analysis_by_id(analysis_id: str):
+async def get_analysis_by_id(
+    analysis_id: str,
+    user_id: str = Depends(get_current_user_id),
+    repository: SupabaseRepository = Depends(get_repository)
+):
     """
     Obtener un análisis específico por ID
     """
+    analysis_id = parse_analysis_id(analysis_id)
     try:
-        # Buscar análisis por ID
-        result = supabase.table('analyses')\
-            .select("*")\
-            .eq('id', analysis_id)\
-            .execute()
+        # Buscar análisis por ID (si aún no se volcó, en el buffer de escritura)
+        item = await repository.get_analysis(analysis_id, columns=ANALYSIS_LIST_COLUMNS, user_id=user_id)
+        if item is None:
+            item = get_write_buffer().get(analysis_id, user_id)
         
-        if not result.data:
+        if item is None:
             raise HTTPException(status_code=404, detail="Análisis no encontrado")
         
-        item = result.data[0]
-        
-        return AnalysisResponse(
-            id=item['id'],
-            summary=item['summary'],
-            keywords=item['keywords'],
-            sentiment=SentimentResult(
-                label=item['sentiment_label'],
-                confidence=item['sentiment_confidence']
-            ),
-            created_at=item['created_at']
-        )
+        return row_to_response(item)
         
     except HTTPException:
         raise
@@ -204,39 +1197,80 @@ async def get_analysis_by_id(analysis_id: str):
         print(f"Error obteniendo análisis: {e}")
         raise HTTPException(status_code=500, detail=f"Error obteniendo análisis: {str(e)}")
 
-@router.get("/health")
-async def health_check():
+@router.get("/history/{analysis_id}/similar", response_model=List[SimilarAnalysis])
+async def get_similar_analyses(
+    analysis_id: str,
+    limit: int = Query(5, ge=1, le=50),
+    user_id: str = Depends(get_current_user_id),
+    repository: SupabaseRepository = Depends(get_repository)
+):
     """
-    Verificar estado de conexiones a Supabase y Gemini Pro
+    Obtener los análisis del usuario más parecidos a uno dado, por
+    similitud coseno de sus embeddings (índice HNSW en Supabase)
     """
+    analysis_id = parse_analysis_id(analysis_id)
     try:
-        # Verificar conexión a Supabase
-        supabase_status = "ok"
-        try:
-            supabase.table('analyses').select("id").limit(1).execute()
-        except Exception as e:
-            supabase_status = f"error: {str(e)}"
+        rows = await repository.similar_analyses(user_id, analysis_id, limit)
+        return [
+            SimilarAnalysis(**row_to_response(item).model_dump(), similarity=item['similarity'])
+            for item in rows
+        ]
         
-        # Verificar conexión a Gemini
-        gemini_status = "ok"
-        try:
-            model = genai.GenerativeModel('gemini-1.5-flash')
-            test_response = model.generate_content("Test")
-            if not test_response:
-                gemini_status = "error: no response"
-        except Exception as e:
-            gemini_status = f"error: {str(e)}"
+    except Exception as e:
+        print(f"Error obteniendo análisis similares: {e}")
+        raise HTTPException(status_code=500, detail=f"Error obteniendo análisis similares: {str(e)}")
+
+@router.get("/history/{analysis_id}/detail", response_model=AnalysisDetail)
+async def get_analysis_detail(
+    analysis_id: str,
+    include_text: bool = True,
+    user_id: str = Depends(get_current_user_id),
+    repository: SupabaseRepository = Depends(get_repository)
+):
+    """
+    Obtener un análisis con su texto original. La respuesta se comprime con
+    gzip si el cliente envía Accept-Encoding: gzip.
+    """
+    analysis_id = parse_analysis_id(analysis_id)
+    try:
+        columns = ANALYSIS_DETAIL_COLUMNS if include_text else ANALYSIS_LIST_COLUMNS
+        item = await repository.get_analysis(analysis_id, columns=columns, user_id=user_id)
+        if item is None:
+            item = get_write_buffer().get(analysis_id, user_id)
         
-        return {
-            "status": "healthy" if supabase_status == "ok" and gemini_status == "ok" else "unhealthy",
-            "supabase": supabase_status,
-            "gemini": gemini_status,
-            "timestamp": datetime.now().isoformat()
-        }
+        if item is None:
+            raise HTTPException(status_code=404, detail="Análisis no encontrado")
         
+        analysis = row_to_response(item)
+        return AnalysisDetail(**analysis.model_dump(), original_text=item.get('original_text'))
+        
+    except HTTPException:
+        raise
     except Exception as e:
-        return {
-            "status": "error",
-            "error": str(e),
-            "timestamp": datetime.now().isoformat()
-        }
\ No newline at end of file
+        print(f"Error obteniendo análisis: {e}")
+        raise HTTPException(status_code=500, detail=f"Error obteniendo análisis: {str(e)}")
+
+@router.get("/health/live")
+async def liveness_check():
+    """
+    Liveness: el proceso responde. Sin I/O.
+    """
+    return {"status": "alive", "timestamp": datetime.now().isoformat()}
+
+@router.get("/health/ready")
+async def readiness_check():
+    """
+    Readiness: última comprobación de Supabase y Gemini hecha en segundo
+    plano. Responde 503 si alguna dependencia falló o aún no hay resultado.
+    """
+    snapshot = get_readiness_monitor().snapshot()
+    status_code = 200 if snapshot["status"] == "healthy" else 503
+    return JSONResponse(content=snapshot, status_code=status_code)
+
+@router.get("/health")
+async def health_check():
+    """
+    Verificar estado de conexiones a Supabase y Gemini Pro (instantánea
+    cacheada, ver /health/ready)
+    """
+    return get_readiness_monitor().snapshot()
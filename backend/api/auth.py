@@ -1,8 +1,10 @@
 from fastapi import APIRouter, HTTPException, Depends
 from pydantic import BaseModel
-from typing import Optional
-from supabase import create_client, Client
+from typing import Any, Dict, Optional
 from config import settings
+from services.supabase import SupabaseRepository, get_repository
+from services.auth import get_bearer_token, get_current_claims, get_token_verifier
+from services.cache import LRUCache
 import logging
 
 # Configurar logging
@@ -11,10 +13,8 @@ logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
-# Inicializar cliente Supabase
-supabase: Client = create_client(settings.SUPABASE_URL, settings.SUPABASE_ANON_KEY)
-# Cliente con service role key para operaciones administrativas
-supabase_admin: Client = create_client(settings.SUPABASE_URL, settings.SUPABASE_SERVICE_ROLE_KEY)
+# Perfil de usuario por token, para no consultar Supabase Auth en cada /me
+_user_cache = LRUCache(settings.AUTH_CACHE_MAX_ENTRIES, settings.AUTH_CACHE_TTL)
 
 class LoginRequest(BaseModel):
     email: str
@@ -31,30 +31,28 @@ class AuthResponse(BaseModel):
     user: dict
 
 @router.post("/login", response_model=AuthResponse)
-async def login(request: LoginRequest):
+async def login(request: LoginRequest, repository: SupabaseRepository = Depends(get_repository)):
     """
     Autenticar usuario con Supabase
     """
     try:
         # Autenticar con Supabase
-        response = supabase.auth.sign_in_with_password({
-            "email": request.email,
-            "password": request.password
-        })
+        session = await repository.sign_in_with_password(request.email, request.password)
+        user = session.get("user")
         
-        if response.user is None:
+        if user is None:
             raise HTTPException(status_code=401, detail="Credenciales inválidas")
         
-        logger.info(f"Usuario autenticado: {response.user.email}")
+        logger.info(f"Usuario autenticado: {user['email']}")
         
         return {
-            "access_token": response.session.access_token,
+            "access_token": session["access_token"],
             "token_type": "bearer",
             "user": {
-                "id": response.user.id,
-                "email": response.user.email,
-                "email_confirmed_at": response.user.email_confirmed_at,
-                "created_at": response.user.created_at
+                "id": user["id"],
+                "email": user["email"],
+                "email_confirmed_at": user.get("email_confirmed_at"),
+                "created_at": user.get("created_at")
             }
         }
         
@@ -76,74 +74,65 @@ async def login(request: LoginRequest):
             raise HTTPException(status_code=401, detail="Error de autenticación")
 
 @router.post("/register", response_model=AuthResponse)
-async def register(request: RegisterRequest):
+async def register(request: RegisterRequest, repository: SupabaseRepository = Depends(get_repository)):
     """
     Registrar nuevo usuario en Supabase
     """
     try:
-        # Verificar si el usuario ya existe
-        try:
-            existing_user = supabase_admin.auth.admin.get_user_by_email(request.email)
-            if existing_user and existing_user.user:
-                raise HTTPException(status_code=400, detail="El email ya está registrado")
-        except Exception as check_error:
-            # Si no se puede verificar, continuar con el registro
-            logger.info(f"No se pudo verificar usuario existente: {str(check_error)}")
-        
-        # Registrar usuario en Supabase Auth
-        response = supabase.auth.sign_up({
-            "email": request.email,
-            "password": request.password
-        })
-        
-        if response.user is None:
+        # Registrar usuario en Supabase Auth (si el email ya existe
+        # Supabase responde "User already registered")
+        response = await repository.sign_up(request.email, request.password)
+        user = response["user"]
+        session = response["session"]
+        
+        if not user:
             raise HTTPException(status_code=400, detail="Error al crear usuario")
         
-        logger.info(f"Usuario registrado: {response.user.email}")
-        logger.info(f"Session disponible: {response.session is not None}")
-        logger.info(f"Email confirmado: {response.user.email_confirmed_at is not None}")
+        logger.info(f"Usuario registrado: {user['email']}")
+        logger.info(f"Session disponible: {session is not None}")
+        logger.info(f"Email confirmado: {user.get('email_confirmed_at') is not None}")
         
         # Crear perfil de usuario en la tabla user_profiles
         if request.full_name:
             try:
                 profile_data = {
-                    "user_id": response.user.id,
+                    "user_id": user["id"],
                     "full_name": request.full_name
                 }
                 
-                supabase_admin.table('user_profiles').insert(profile_data).execute()
-                logger.info(f"Perfil creado para usuario: {response.user.email}")
+                await repository.insert_user_profile(profile_data)
+                logger.info(f"Perfil creado para usuario: {user['email']}")
                 
             except Exception as profile_error:
                 logger.warning(f"Error creando perfil: {str(profile_error)}")
                 # No fallar el registro si el perfil no se puede crear
         
         # Si el email no está confirmado, informar al usuario
-        if response.user.email_confirmed_at is None:
-            logger.info(f"Email no confirmado para: {response.user.email}")
+        if user.get("email_confirmed_at") is None:
+            logger.info(f"Email no confirmado para: {user['email']}")
             # Retornar información sin token de acceso
             return {
                 "access_token": "",
                 "token_type": "bearer",
                 "user": {
-                    "id": response.user.id,
-                    "email": response.user.email,
+                    "id": user["id"],
+                    "email": user["email"],
                     "full_name": request.full_name,
-                    "email_confirmed_at": response.user.email_confirmed_at,
-                    "created_at": response.user.created_at,
+                    "email_confirmed_at": user.get("email_confirmed_at"),
+                    "created_at": user.get("created_at"),
                     "needs_confirmation": True
                 }
             }
         
         return {
-            "access_token": response.session.access_token if response.session else "",
+            "access_token": session["access_token"] if session else "",
             "token_type": "bearer",
             "user": {
-                "id": response.user.id,
-                "email": response.user.email,
+                "id": user["id"],
+                "email": user["email"],
                 "full_name": request.full_name,
-                "email_confirmed_at": response.user.email_confirmed_at,
-                "created_at": response.user.created_at,
+                "email_confirmed_at": user.get("email_confirmed_at"),
+                "created_at": user.get("created_at"),
                 "needs_confirmation": False
             }
         }
@@ -159,13 +148,19 @@ async def register(request: RegisterRequest):
         raise HTTPException(status_code=400, detail="Error al registrar usuario")
 
 @router.post("/logout")
-async def logout():
+async def logout(
+    token: Optional[str] = Depends(get_bearer_token),
+    repository: SupabaseRepository = Depends(get_repository)
+):
     """
     Cerrar sesión del usuario
     """
     try:
         # Cerrar sesión en Supabase
-        supabase.auth.sign_out()
+        if token:
+            get_token_verifier().forget(token)
+            _user_cache.pop(token)
+            await repository.sign_out(token)
         logger.info("Usuario cerró sesión")
         return {"message": "Logout successful"}
         
@@ -174,7 +169,7 @@ async def logout():
         raise HTTPException(status_code=500, detail="Error al cerrar sesión")
 
 @router.post("/resend-confirmation")
-async def resend_confirmation(request: dict):
+async def resend_confirmation(request: dict, repository: SupabaseRepository = Depends(get_repository)):
     """
     Reenviar email de confirmación
     """
@@ -184,10 +179,7 @@ async def resend_confirmation(request: dict):
             raise HTTPException(status_code=400, detail="Email requerido")
         
         # Reenviar email de confirmación
-        response = supabase.auth.resend({
-            "type": "signup",
-            "email": email
-        })
+        await repository.resend_confirmation(email)
         
         logger.info(f"Email de confirmación reenviado a: {email}")
         return {"message": "Email de confirmación enviado"}
@@ -197,20 +189,26 @@ async def resend_confirmation(request: dict):
         raise HTTPException(status_code=400, detail="Error al enviar email de confirmación")
 
 @router.get("/me")
-async def get_current_user():
+async def get_current_user(
+    claims: Dict[str, Any] = Depends(get_current_claims),
+    token: Optional[str] = Depends(get_bearer_token),
+    repository: SupabaseRepository = Depends(get_repository)
+):
     """
-    Obtener información del usuario actual
+    Obtener información del usuario actual. El token se verifica localmente;
+    Supabase Auth solo se consulta la primera vez que se ve cada token.
     """
     try:
-        user = supabase.auth.get_user()
+        user = _user_cache.get(token)
         if user is None:
-            raise HTTPException(status_code=401, detail="No autenticado")
+            user = await repository.get_user(token)
+            _user_cache.set(token, user)
         
         return {
-            "id": user.user.id,
-            "email": user.user.email,
-            "email_confirmed_at": user.user.email_confirmed_at,
-            "created_at": user.user.created_at
+            "id": user["id"],
+            "email": user["email"],
+            "email_confirmed_at": user.get("email_confirmed_at"),
+            "created_at": user.get("created_at")
         }
         
     except Exception as e:
@@ -1,15 +1,52 @@
-from fastapi import FastAPI
+from fastapi import FastAPI, Header, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import Response
+from contextlib import asynccontextmanager
+from typing import Optional
 from dotenv import load_dotenv
 import os
 
 # Cargar variables de entorno
 load_dotenv()
 
+from config import settings
+from services.supabase import init_repository, close_repository
+from services.health import get_readiness_monitor
+from services.workers import get_worker_pool
+from services.jobs import get_job_queue
+from services.write_buffer import get_write_buffer
+from services.telemetry import TracingMiddleware, render_metrics, PROMETHEUS_CONTENT_TYPE
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Pool HTTP compartido hacia Supabase
+    init_repository()
+    # Pool de procesos para etapas CPU-bound
+    worker_pool = get_worker_pool()
+    worker_pool.start()
+    # Comprobaciones de readiness en segundo plano
+    monitor = get_readiness_monitor()
+    monitor.start()
+    # Workers de la cola de trabajos de análisis
+    job_queue = get_job_queue()
+    await job_queue.start()
+    # Volcado por lotes de los análisis encolados (y los que quedaron en el log)
+    write_buffer = get_write_buffer()
+    if settings.WRITE_BUFFER_ENABLED:
+        await write_buffer.start()
+    yield
+    await job_queue.stop()
+    await write_buffer.stop()
+    await monitor.stop()
+    worker_pool.shutdown()
+    await close_repository()
+
 app = FastAPI(
     title="Analizador de Contenido Inteligente API",
     description="API para análisis de texto usando Gemini Pro",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # Configurar CORS con variables de entorno
@@ -19,14 +56,35 @@ allowed_origins = os.getenv("ALLOWED_ORIGINS", "http://localhost:3000,https://ap
 if "http://localhost:3000" not in allowed_origins:
     allowed_origins.append("http://localhost:3000")
 
+class NonStreamingGZipMiddleware(GZipMiddleware):
+    """GZip que no toca los endpoints SSE (el buffer de gzip retrasaría los eventos)"""
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http" and scope["path"].endswith("/stream"):
+            await self.app(scope, receive, send)
+            return
+        await super().__call__(scope, receive, send)
+
+# Comprimir respuestas grandes (p. ej. el detalle con el texto original)
+app.add_middleware(NonStreamingGZipMiddleware, minimum_size=1000)
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=allowed_origins,
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Cabeceras que el frontend necesita leer (presupuesto de uso, caché, trabajos)
+    expose_headers=[
+        "Retry-After", "X-RateLimit-Limit", "X-RateLimit-Remaining", "X-RateLimit-Reset",
+        "X-Cache", "X-Analysis-Engine", "Idempotent-Replayed", "Location", "Server-Timing",
+    ],
 )
 
+# Traza por petición: Server-Timing y histogramas de /metrics (el más externo,
+# para medir también CORS y gzip)
+app.add_middleware(TracingMiddleware, server_timing=settings.SERVER_TIMING_ENABLED)
+
 @app.get("/")
 async def root():
     return {
@@ -49,6 +107,13 @@ async def health_check():
         "environment": os.getenv("ENVIRONMENT", "development")
     }
 
+@app.get("/metrics", include_in_schema=False)
+async def metrics(authorization: Optional[str] = Header(None)):
+    """Histogramas de latencia por ruta, servicio externo y etapa (formato Prometheus)"""
+    if settings.METRICS_TOKEN and authorization != f"Bearer {settings.METRICS_TOKEN}":
+        raise HTTPException(status_code=401, detail="No autorizado")
+    return Response(content=render_metrics(), media_type=PROMETHEUS_CONTENT_TYPE)
+
 # Importar rutas
 from api.auth import router as auth_router
 from api.analysis import router as analysis_router
@@ -11,9 +11,153 @@ class Settings:
     SUPABASE_URL: str = os.getenv("SUPABASE_URL", "")
     SUPABASE_ANON_KEY: str = os.getenv("SUPABASE_ANON_KEY", "")
     SUPABASE_SERVICE_ROLE_KEY: str = os.getenv("SUPABASE_SERVICE_ROLE_KEY", "")
+    # Conexiones keep-alive del pool HTTP compartido
+    SUPABASE_MAX_CONNECTIONS: int = int(os.getenv("SUPABASE_MAX_CONNECTIONS", "20"))
+    SUPABASE_TIMEOUT: float = float(os.getenv("SUPABASE_TIMEOUT", "10"))
+    # Verificación local de access tokens (Settings > API > JWT Secret)
+    SUPABASE_JWT_SECRET: str = os.getenv("SUPABASE_JWT_SECRET", "")
+    SUPABASE_JWT_AUDIENCE: str = os.getenv("SUPABASE_JWT_AUDIENCE", "authenticated")
+    # Caché de claims verificados y del JWKS (segundos)
+    AUTH_CACHE_MAX_ENTRIES: int = int(os.getenv("AUTH_CACHE_MAX_ENTRIES", "1024"))
+    AUTH_CACHE_TTL: float = float(os.getenv("AUTH_CACHE_TTL", "300"))
+    AUTH_JWKS_TTL: float = float(os.getenv("AUTH_JWKS_TTL", "3600"))
+    # Solo para desarrollo local: las peticiones sin token usan el usuario de pruebas
+    AUTH_DEV_USER_ENABLED: bool = os.getenv("AUTH_DEV_USER_ENABLED", "false").lower() == "true"
     
     # Gemini Pro
     GEMINI_API_KEY: str = os.getenv("GEMINI_API_KEY", "")
+    # Máximo de llamadas simultáneas a Gemini por proceso
+    GEMINI_MAX_CONCURRENCY: int = int(os.getenv("GEMINI_MAX_CONCURRENCY", "32"))
+    # Máximo de peticiones esperando turno antes de responder 429
+    GEMINI_MAX_QUEUE: int = int(os.getenv("GEMINI_MAX_QUEUE", "64"))
+    # Segundos que una petición puede esperar turno antes de responder 429
+    GEMINI_QUEUE_TIMEOUT: float = float(os.getenv("GEMINI_QUEUE_TIMEOUT", "5"))
+    # Segundos máximos por llamada a Gemini
+    GEMINI_TIMEOUT: float = float(os.getenv("GEMINI_TIMEOUT", "30"))
+    # Reintentos de errores transitorios (429/5xx/timeouts) con backoff y jitter
+    GEMINI_MAX_RETRIES: int = int(os.getenv("GEMINI_MAX_RETRIES", "2"))
+    GEMINI_RETRY_BASE_DELAY: float = float(os.getenv("GEMINI_RETRY_BASE_DELAY", "0.5"))
+    GEMINI_RETRY_MAX_DELAY: float = float(os.getenv("GEMINI_RETRY_MAX_DELAY", "4"))
+    # Petición de cobertura si la primera tarda más que el p95 (mínimo GEMINI_HEDGE_MIN_DELAY)
+    GEMINI_HEDGE_ENABLED: bool = os.getenv("GEMINI_HEDGE_ENABLED", "false").lower() == "true"
+    GEMINI_HEDGE_MIN_DELAY: float = float(os.getenv("GEMINI_HEDGE_MIN_DELAY", "1"))
+    # Circuit breaker: se abre con esta tasa de error en la ventana y espera el cooldown
+    GEMINI_BREAKER_ERROR_RATE: float = float(os.getenv("GEMINI_BREAKER_ERROR_RATE", "0.5"))
+    GEMINI_BREAKER_MIN_CALLS: int = int(os.getenv("GEMINI_BREAKER_MIN_CALLS", "10"))
+    GEMINI_BREAKER_WINDOW: int = int(os.getenv("GEMINI_BREAKER_WINDOW", "20"))
+    GEMINI_BREAKER_COOLDOWN: float = float(os.getenv("GEMINI_BREAKER_COOLDOWN", "30"))
+    
+    # Router de modelos (services/model_router.py): modelo por nivel de calidad
+    MODEL_ECONOMY: str = os.getenv("MODEL_ECONOMY", "gemini-2.0-flash-lite")
+    MODEL_STANDARD: str = os.getenv("MODEL_STANDARD", "gemini-2.0-flash")
+    MODEL_HIGH: str = os.getenv("MODEL_HIGH", "gemini-2.5-pro")
+    # Modelo secundario si el principal es lento, falla o no existe ("" = sin failover)
+    MODEL_FALLBACK: str = os.getenv("MODEL_FALLBACK", "gemini-2.5-flash")
+    # Entradas de hasta estos caracteres usan el modelo económico en calidad standard
+    MODEL_ROUTER_SHORT_CHARS: int = int(os.getenv("MODEL_ROUTER_SHORT_CHARS", "2000"))
+    # SLO de latencia: un modelo con p95 por encima cede el turno al secundario,
+    # y es también el timeout del primer intento cuando hay secundario
+    MODEL_LATENCY_SLO: float = float(os.getenv("MODEL_LATENCY_SLO", "10"))
+    # Cada cuántas peticiones se vuelve a probar un modelo relegado por lento
+    MODEL_ROUTER_PROBE_EVERY: int = int(os.getenv("MODEL_ROUTER_PROBE_EVERY", "20"))
+    # Usar el motor local si Gemini falla o su respuesta no se puede interpretar
+    LOCAL_FALLBACK_ENABLED: bool = os.getenv("LOCAL_FALLBACK_ENABLED", "true").lower() == "true"
+    
+    # Caché de resultados de análisis
+    ANALYSIS_CACHE_MAX_ENTRIES: int = int(os.getenv("ANALYSIS_CACHE_MAX_ENTRIES", "1024"))
+    ANALYSIS_CACHE_TTL: float = float(os.getenv("ANALYSIS_CACHE_TTL", "86400"))
+    # Ruta del archivo SQLite para el nivel persistente (vacío = desactivado)
+    ANALYSIS_CACHE_SQLITE_PATH: str = os.getenv("ANALYSIS_CACHE_SQLITE_PATH", "")
+    
+    # Análisis por lotes: caracteres y textos máximos por prompt empaquetado
+    BATCH_PACK_MAX_CHARS: int = int(os.getenv("BATCH_PACK_MAX_CHARS", "6000"))
+    BATCH_PACK_MAX_ITEMS: int = int(os.getenv("BATCH_PACK_MAX_ITEMS", "10"))
+    
+    # Segundos que se reutiliza el total estimado del historial
+    HISTORY_COUNT_CACHE_TTL: float = float(os.getenv("HISTORY_COUNT_CACHE_TTL", "60"))
+    
+    # Segundos entre comprobaciones de readiness en segundo plano
+    HEALTH_CHECK_INTERVAL: float = float(os.getenv("HEALTH_CHECK_INTERVAL", "30"))
+    
+    # Pool de procesos para trabajo CPU (-1 = un proceso por núcleo, 0 = hilos)
+    CPU_POOL_WORKERS: int = int(os.getenv("CPU_POOL_WORKERS", "-1"))
+    CPU_POOL_MAX_PENDING: int = int(os.getenv("CPU_POOL_MAX_PENDING", "256"))
+    CPU_POOL_TASK_TIMEOUT: float = float(os.getenv("CPU_POOL_TASK_TIMEOUT", "10"))
+    # Tamaño de texto a partir del cual la normalización se hace en el pool
+    CPU_OFFLOAD_MIN_CHARS: int = int(os.getenv("CPU_OFFLOAD_MIN_CHARS", "50000"))
+    
+    # Documentos largos: tokens estimados por fragmento
+    LONG_DOC_CHUNK_TOKENS: int = int(os.getenv("LONG_DOC_CHUNK_TOKENS", "2000"))
+    # Fragmentos de un mismo documento analizándose a la vez (como mucho la
+    # mitad de GEMINI_MAX_CONCURRENCY, para no agotar el gateway)
+    LONG_DOC_MAX_CONCURRENCY: int = int(os.getenv("LONG_DOC_MAX_CONCURRENCY", "8"))
+    
+    # Cola de trabajos de análisis (services/jobs.py). Solo se aceptan
+    # trabajos si hay un host de larga duración con workers
+    JOBS_ENABLED: bool = os.getenv("JOBS_ENABLED", "false").lower() == "true"
+    # Workers en este proceso (0 = este despliegue solo encola, p. ej. serverless)
+    JOB_WORKERS: int = int(os.getenv("JOB_WORKERS", "8"))
+    JOB_QUEUE_MAX_SIZE: int = int(os.getenv("JOB_QUEUE_MAX_SIZE", "1000"))
+    JOB_STORE_MAX_JOBS: int = int(os.getenv("JOB_STORE_MAX_JOBS", "10000"))
+    # "memory" (o SQLite con JOB_STORE_SQLITE_PATH) o "supabase" (compartido entre instancias)
+    JOB_STORE_BACKEND: str = os.getenv("JOB_STORE_BACKEND", "memory")
+    # Ruta del archivo SQLite para persistir trabajos (vacío = en memoria)
+    JOB_STORE_SQLITE_PATH: str = os.getenv("JOB_STORE_SQLITE_PATH", "")
+    # Almacén supabase: reserva de un trabajo, intentos máximos y espera entre consultas
+    JOB_LEASE_SECONDS: int = int(os.getenv("JOB_LEASE_SECONDS", "300"))
+    JOB_MAX_ATTEMPTS: int = int(os.getenv("JOB_MAX_ATTEMPTS", "3"))
+    JOB_POLL_INTERVAL: float = float(os.getenv("JOB_POLL_INTERVAL", "1"))
+    
+    # Idempotencia de /analyze (cabecera Idempotency-Key)
+    IDEMPOTENCY_TTL: int = int(os.getenv("IDEMPOTENCY_TTL", "86400"))
+    IDEMPOTENCY_MAX_ENTRIES: int = int(os.getenv("IDEMPOTENCY_MAX_ENTRIES", "10000"))
+    
+    # Embeddings y similitud semántica (pgvector)
+    EMBEDDINGS_ENABLED: bool = os.getenv("EMBEDDINGS_ENABLED", "true").lower() == "true"
+    EMBEDDING_MODEL: str = os.getenv("EMBEDDING_MODEL", "models/text-embedding-004")
+    # Caracteres del texto que se envían al modelo de embeddings
+    EMBEDDING_MAX_CHARS: int = int(os.getenv("EMBEDDING_MAX_CHARS", "8000"))
+    # Segundos máximos de la llamada de embeddings (sin reintentos: es opcional)
+    EMBEDDING_TIMEOUT: float = float(os.getenv("EMBEDDING_TIMEOUT", "2"))
+    # Similitud coseno a partir de la cual se reutiliza un análisis existente (0 = desactivado)
+    NEAR_DUPLICATE_THRESHOLD: float = float(os.getenv("NEAR_DUPLICATE_THRESHOLD", "0.97"))
+    
+    # Límite de uso por tokens estimados (por usuario y global)
+    RATE_LIMIT_ENABLED: bool = os.getenv("RATE_LIMIT_ENABLED", "true").lower() == "true"
+    # "memory" (por proceso) o "supabase" (compartido entre instancias)
+    RATE_LIMIT_BACKEND: str = os.getenv("RATE_LIMIT_BACKEND", "memory")
+    RATE_LIMIT_USER_TOKENS_PER_MINUTE: float = float(os.getenv("RATE_LIMIT_USER_TOKENS_PER_MINUTE", "20000"))
+    RATE_LIMIT_USER_BURST: float = float(os.getenv("RATE_LIMIT_USER_BURST", "40000"))
+    RATE_LIMIT_GLOBAL_TOKENS_PER_MINUTE: float = float(os.getenv("RATE_LIMIT_GLOBAL_TOKENS_PER_MINUTE", "1000000"))
+    RATE_LIMIT_GLOBAL_BURST: float = float(os.getenv("RATE_LIMIT_GLOBAL_BURST", "1000000"))
+    # Tokens que se suman a cada texto por las instrucciones del prompt y la respuesta
+    RATE_LIMIT_PROMPT_OVERHEAD_TOKENS: int = int(os.getenv("RATE_LIMIT_PROMPT_OVERHEAD_TOKENS", "400"))
+    RATE_LIMIT_MAX_USERS: int = int(os.getenv("RATE_LIMIT_MAX_USERS", "10000"))
+    
+    # Prompts versionados (services/prompts.py). Sin versión se usa la más reciente
+    PROMPT_VERSIONS: str = os.getenv("PROMPT_VERSIONS", "analysis=v2,batch=v2,stream=v2,reduce=v1")
+    # Despliegue gradual: "analysis=v3:10" envía el 10 % de los textos a v3
+    PROMPT_CANARY: str = os.getenv("PROMPT_CANARY", "")
+    # Textos de hasta estas palabras se usan como su propio resumen
+    PROMPT_SHORT_TEXT_MAX_WORDS: int = int(os.getenv("PROMPT_SHORT_TEXT_MAX_WORDS", "40"))
+    
+    # Buffer de escritura de análisis (services/write_buffer.py). Solo en un
+    # host persistente: en serverless las filas pendientes se pueden perder
+    WRITE_BUFFER_ENABLED: bool = os.getenv("WRITE_BUFFER_ENABLED", "false").lower() == "true"
+    # Log local de solo-anexado ("" = solo memoria, sin durabilidad)
+    WRITE_BUFFER_LOG_PATH: str = os.getenv("WRITE_BUFFER_LOG_PATH", "/tmp/appresumen-analyses.log")
+    WRITE_BUFFER_MAX_BATCH: int = int(os.getenv("WRITE_BUFFER_MAX_BATCH", "100"))
+    WRITE_BUFFER_FLUSH_INTERVAL: float = float(os.getenv("WRITE_BUFFER_FLUSH_INTERVAL", "0.5"))
+    # Filas pendientes a partir de las cuales se inserta directamente
+    WRITE_BUFFER_MAX_PENDING: int = int(os.getenv("WRITE_BUFFER_MAX_PENDING", "5000"))
+    WRITE_BUFFER_MAX_LOG_BYTES: int = int(os.getenv("WRITE_BUFFER_MAX_LOG_BYTES", str(64 * 1024 * 1024)))
+    WRITE_BUFFER_FSYNC: bool = os.getenv("WRITE_BUFFER_FSYNC", "true").lower() == "true"
+    
+    # Trazas y métricas (services/telemetry.py)
+    TELEMETRY_ENABLED: bool = os.getenv("TELEMETRY_ENABLED", "true").lower() == "true"
+    SERVER_TIMING_ENABLED: bool = os.getenv("SERVER_TIMING_ENABLED", "true").lower() == "true"
+    # Si se define, GET /metrics exige Authorization: Bearer <token>
+    METRICS_TOKEN: str = os.getenv("METRICS_TOKEN", "")
     
     # FastAPI
     SECRET_KEY: str = os.getenv("SECRET_KEY", "fallback-secret-key-change-in-production")
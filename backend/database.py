@@ -50,11 +50,33 @@ class DatabaseSetup:
         with open(sql_file, 'r', encoding='utf-8') as f:
             return f.read()
 
+    @staticmethod
+    def split_sql_commands(sql_content: str) -> list:
+        """Dividir el script por ';' sin cortar los cuerpos de función ($$ ... $$)"""
+        commands = []
+        current = ""
+        for index, part in enumerate(sql_content.split('$$')):
+            if index % 2 == 1:
+                # Dentro de un bloque $$: se conserva completo
+                current += '$$' + part + '$$'
+                continue
+            pieces = part.split(';')
+            current += pieces[0]
+            for piece in pieces[1:]:
+                commands.append(current)
+                current = piece
+        commands.append(current)
+        # Quitar comandos vacíos o que solo contienen comentarios
+        return [
+            cmd.strip() for cmd in commands
+            if any(line.strip() and not line.strip().startswith('--') for line in cmd.splitlines())
+        ]
+
     def execute_sql_script(self, sql_content: str) -> bool:
         """Ejecutar script SQL en Supabase"""
         try:
             # Dividir el script en comandos individuales
-            commands = [cmd.strip() for cmd in sql_content.split(';') if cmd.strip()]
+            commands = self.split_sql_commands(sql_content)
             
             print(f"📝 Ejecutando {len(commands)} comandos SQL...")
             
@@ -155,10 +177,14 @@ class DatabaseSetup:
             print("\n📋 Resumen de tablas creadas:")
             print("   • user_profiles - Perfiles de usuario")
             print("   • analyses - Análisis de texto")
+            print("   • analysis_user_stats / analysis_user_monthly / analysis_keyword_counts - Estadísticas por usuario")
             print("\n🔒 Características de seguridad:")
             print("   • Row Level Security (RLS) habilitado")
             print("   • Políticas de acceso configuradas")
             print("   • Triggers para updated_at automático")
+            print("   • Trigger que mantiene las estadísticas en cada inserción")
+            print("   • Índices GIN para búsqueda de texto completo")
+            print("   • Índice HNSW (pgvector) para análisis similares")
             print("\n🚀 ¡Tu aplicación está lista para usar!")
             
             return True
@@ -0,0 +1,584 @@
+-- =====================================================
+-- 🗄️ ESQUEMA DE BASE DE DATOS - APPRESUMEN
+-- =====================================================
+-- Ejecutar con: python database.py
+-- (o pegarlo en el SQL Editor de Supabase)
+
+CREATE EXTENSION IF NOT EXISTS pgcrypto;
+
+-- =====================================================
+-- PERFILES DE USUARIO
+-- =====================================================
+
+CREATE TABLE IF NOT EXISTS user_profiles (
+    id UUID DEFAULT gen_random_uuid() PRIMARY KEY,
+    user_id UUID NOT NULL UNIQUE REFERENCES auth.users(id) ON DELETE CASCADE,
+    full_name TEXT,
+    avatar_url TEXT,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW() NOT NULL,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW() NOT NULL
+);
+
+-- =====================================================
+-- ANÁLISIS
+-- =====================================================
+
+CREATE TABLE IF NOT EXISTS analyses (
+    id UUID DEFAULT gen_random_uuid() PRIMARY KEY,
+    user_id UUID NOT NULL REFERENCES auth.users(id) ON DELETE CASCADE,
+    original_text TEXT NOT NULL,
+    summary TEXT NOT NULL,
+    keywords TEXT[] NOT NULL DEFAULT '{}',
+    sentiment_label TEXT NOT NULL CHECK (sentiment_label IN ('positive', 'negative', 'neutral')),
+    sentiment_confidence REAL NOT NULL CHECK (sentiment_confidence BETWEEN 0 AND 1),
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW() NOT NULL,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW() NOT NULL
+);
+
+-- Historial paginado por keyset: (user_id, created_at DESC, id DESC)
+CREATE INDEX IF NOT EXISTS analyses_user_created_idx
+    ON analyses (user_id, created_at DESC, id DESC);
+
+-- =====================================================
+-- BÚSQUEDA DE TEXTO COMPLETO
+-- =====================================================
+-- search_vector: palabras clave (peso A) y resumen (peso B).
+-- text_search_vector: texto original (opcional en la búsqueda), limitado a
+-- los primeros 100.000 caracteres para no superar el máximo de un tsvector.
+-- Configuración 'simple' porque los textos pueden estar en español o inglés.
+
+CREATE EXTENSION IF NOT EXISTS btree_gin;
+
+CREATE OR REPLACE FUNCTION analysis_search_document(summary TEXT, keywords TEXT[])
+RETURNS TSVECTOR AS $$
+    SELECT setweight(to_tsvector('simple', COALESCE(array_to_string(keywords, ' '), '')), 'A')
+        || setweight(to_tsvector('simple', COALESCE(summary, '')), 'B');
+$$ LANGUAGE sql IMMUTABLE;
+
+ALTER TABLE analyses ADD COLUMN IF NOT EXISTS search_vector TSVECTOR
+    GENERATED ALWAYS AS (analysis_search_document(summary, keywords)) STORED;
+
+ALTER TABLE analyses ADD COLUMN IF NOT EXISTS text_search_vector TSVECTOR
+    GENERATED ALWAYS AS (to_tsvector('simple', left(original_text, 100000))) STORED;
+
+-- GIN compuesto (user_id + tsvector): solo se recorren las coincidencias del usuario
+CREATE INDEX IF NOT EXISTS analyses_search_idx
+    ON analyses USING GIN (user_id, search_vector);
+
+CREATE INDEX IF NOT EXISTS analyses_text_search_idx
+    ON analyses USING GIN (user_id, text_search_vector);
+
+-- =====================================================
+-- SIMILITUD SEMÁNTICA (pgvector)
+-- =====================================================
+-- Embedding del texto original (text-embedding-004, 768 dimensiones) con
+-- índice HNSW por distancia coseno: top-k en milisegundos aunque la tabla
+-- tenga millones de filas.
+
+CREATE EXTENSION IF NOT EXISTS vector;
+
+ALTER TABLE analyses ADD COLUMN IF NOT EXISTS embedding VECTOR(768);
+
+CREATE INDEX IF NOT EXISTS analyses_embedding_idx
+    ON analyses USING hnsw (embedding vector_cosine_ops);
+
+-- Búsqueda exacta por usuario (ver match_analyses): solo filas con embedding
+CREATE INDEX IF NOT EXISTS analyses_user_embedding_idx
+    ON analyses (user_id) WHERE embedding IS NOT NULL;
+
+-- Modelo que generó cada análisis (p. ej. gemini-2.0-flash-lite o "local"),
+-- elegido por el router de modelos según tamaño, calidad y latencia
+ALTER TABLE analyses ADD COLUMN IF NOT EXISTS model TEXT;
+
+-- =====================================================
+-- TRIGGERS DE updated_at
+-- =====================================================
+
+CREATE OR REPLACE FUNCTION set_updated_at()
+RETURNS TRIGGER AS $$
+BEGIN
+    NEW.updated_at = NOW();
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS user_profiles_updated_at ON user_profiles;
+CREATE TRIGGER user_profiles_updated_at
+    BEFORE UPDATE ON user_profiles
+    FOR EACH ROW EXECUTE FUNCTION set_updated_at();
+
+DROP TRIGGER IF EXISTS analyses_updated_at ON analyses;
+CREATE TRIGGER analyses_updated_at
+    BEFORE UPDATE ON analyses
+    FOR EACH ROW EXECUTE FUNCTION set_updated_at();
+
+-- =====================================================
+-- ROW LEVEL SECURITY
+-- =====================================================
+
+ALTER TABLE user_profiles ENABLE ROW LEVEL SECURITY;
+ALTER TABLE analyses ENABLE ROW LEVEL SECURITY;
+
+DROP POLICY IF EXISTS "Users can view own profile" ON user_profiles;
+CREATE POLICY "Users can view own profile" ON user_profiles
+    FOR SELECT USING (auth.uid() = user_id);
+
+DROP POLICY IF EXISTS "Users can update own profile" ON user_profiles;
+CREATE POLICY "Users can update own profile" ON user_profiles
+    FOR UPDATE USING (auth.uid() = user_id);
+
+DROP POLICY IF EXISTS "Users can view own analyses" ON analyses;
+CREATE POLICY "Users can view own analyses" ON analyses
+    FOR SELECT USING (auth.uid() = user_id);
+
+DROP POLICY IF EXISTS "Users can insert own analyses" ON analyses;
+CREATE POLICY "Users can insert own analyses" ON analyses
+    FOR INSERT WITH CHECK (auth.uid() = user_id);
+
+DROP POLICY IF EXISTS "Users can delete own analyses" ON analyses;
+CREATE POLICY "Users can delete own analyses" ON analyses
+    FOR DELETE USING (auth.uid() = user_id);
+
+-- =====================================================
+-- ESTADÍSTICAS MATERIALIZADAS POR USUARIO
+-- =====================================================
+-- Contadores mantenidos por trigger en cada INSERT/DELETE de analyses,
+-- para que GET /api/analysis/stats no recorra el historial completo.
+
+CREATE TABLE IF NOT EXISTS analysis_user_stats (
+    user_id UUID PRIMARY KEY REFERENCES auth.users(id) ON DELETE CASCADE,
+    total_analyses BIGINT NOT NULL DEFAULT 0,
+    positive_count BIGINT NOT NULL DEFAULT 0,
+    negative_count BIGINT NOT NULL DEFAULT 0,
+    neutral_count BIGINT NOT NULL DEFAULT 0,
+    confidence_sum DOUBLE PRECISION NOT NULL DEFAULT 0,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW() NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS analysis_user_monthly (
+    user_id UUID NOT NULL REFERENCES auth.users(id) ON DELETE CASCADE,
+    month DATE NOT NULL,
+    total_analyses BIGINT NOT NULL DEFAULT 0,
+    PRIMARY KEY (user_id, month)
+);
+
+CREATE TABLE IF NOT EXISTS analysis_keyword_counts (
+    user_id UUID NOT NULL REFERENCES auth.users(id) ON DELETE CASCADE,
+    keyword TEXT NOT NULL,
+    occurrences BIGINT NOT NULL DEFAULT 0,
+    PRIMARY KEY (user_id, keyword)
+);
+
+-- Top de palabras clave por usuario con un index scan
+CREATE INDEX IF NOT EXISTS analysis_keyword_counts_top_idx
+    ON analysis_keyword_counts (user_id, occurrences DESC);
+
+ALTER TABLE analysis_user_stats ENABLE ROW LEVEL SECURITY;
+ALTER TABLE analysis_user_monthly ENABLE ROW LEVEL SECURITY;
+ALTER TABLE analysis_keyword_counts ENABLE ROW LEVEL SECURITY;
+
+DROP POLICY IF EXISTS "Users can view own stats" ON analysis_user_stats;
+CREATE POLICY "Users can view own stats" ON analysis_user_stats
+    FOR SELECT USING (auth.uid() = user_id);
+
+DROP POLICY IF EXISTS "Users can view own monthly stats" ON analysis_user_monthly;
+CREATE POLICY "Users can view own monthly stats" ON analysis_user_monthly
+    FOR SELECT USING (auth.uid() = user_id);
+
+DROP POLICY IF EXISTS "Users can view own keyword counts" ON analysis_keyword_counts;
+CREATE POLICY "Users can view own keyword counts" ON analysis_keyword_counts
+    FOR SELECT USING (auth.uid() = user_id);
+
+-- Aplicar un análisis a los contadores (delta = 1 al insertar, -1 al borrar)
+CREATE OR REPLACE FUNCTION apply_analysis_stats(row_data analyses, delta INTEGER)
+RETURNS VOID AS $$
+BEGIN
+    INSERT INTO analysis_user_stats AS s (
+        user_id, total_analyses, positive_count, negative_count, neutral_count, confidence_sum
+    )
+    VALUES (
+        row_data.user_id,
+        delta,
+        CASE WHEN row_data.sentiment_label = 'positive' THEN delta ELSE 0 END,
+        CASE WHEN row_data.sentiment_label = 'negative' THEN delta ELSE 0 END,
+        CASE WHEN row_data.sentiment_label = 'neutral' THEN delta ELSE 0 END,
+        delta * row_data.sentiment_confidence
+    )
+    ON CONFLICT (user_id) DO UPDATE SET
+        total_analyses = s.total_analyses + EXCLUDED.total_analyses,
+        positive_count = s.positive_count + EXCLUDED.positive_count,
+        negative_count = s.negative_count + EXCLUDED.negative_count,
+        neutral_count = s.neutral_count + EXCLUDED.neutral_count,
+        confidence_sum = s.confidence_sum + EXCLUDED.confidence_sum,
+        updated_at = NOW();
+
+    INSERT INTO analysis_user_monthly AS m (user_id, month, total_analyses)
+    VALUES (row_data.user_id, date_trunc('month', row_data.created_at)::DATE, delta)
+    ON CONFLICT (user_id, month) DO UPDATE SET
+        total_analyses = m.total_analyses + EXCLUDED.total_analyses;
+
+    INSERT INTO analysis_keyword_counts AS k (user_id, keyword, occurrences)
+    SELECT row_data.user_id, keyword, delta
+    FROM (
+        SELECT DISTINCT lower(btrim(raw_keyword)) AS keyword
+        FROM unnest(row_data.keywords) AS raw_keyword
+    ) AS normalized
+    WHERE keyword <> ''
+    ON CONFLICT (user_id, keyword) DO UPDATE SET
+        occurrences = k.occurrences + EXCLUDED.occurrences;
+
+    IF delta < 0 THEN
+        DELETE FROM analysis_keyword_counts
+        WHERE user_id = row_data.user_id AND occurrences <= 0;
+    END IF;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER SET search_path = public;
+
+CREATE OR REPLACE FUNCTION analyses_maintain_stats()
+RETURNS TRIGGER AS $$
+BEGIN
+    IF TG_OP IN ('UPDATE', 'DELETE') THEN
+        PERFORM apply_analysis_stats(OLD, -1);
+    END IF;
+    IF TG_OP IN ('INSERT', 'UPDATE') THEN
+        PERFORM apply_analysis_stats(NEW, 1);
+    END IF;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER SET search_path = public;
+
+DROP TRIGGER IF EXISTS analyses_stats ON analyses;
+CREATE TRIGGER analyses_stats
+    AFTER INSERT OR DELETE OR UPDATE OF user_id, keywords, sentiment_label, sentiment_confidence, created_at
+    ON analyses
+    FOR EACH ROW EXECUTE FUNCTION analyses_maintain_stats();
+
+-- Estadísticas de un usuario en tiempo constante (no depende del historial)
+CREATE OR REPLACE FUNCTION get_analysis_stats(p_user_id UUID, p_keyword_limit INTEGER DEFAULT 10)
+RETURNS JSON AS $$
+    SELECT json_build_object(
+        'total_analyses', COALESCE(s.total_analyses, 0),
+        'sentiment_distribution', json_build_object(
+            'positive', COALESCE(s.positive_count, 0),
+            'negative', COALESCE(s.negative_count, 0),
+            'neutral', COALESCE(s.neutral_count, 0)
+        ),
+        'most_common_keywords', COALESCE((
+            SELECT json_agg(k.keyword ORDER BY k.occurrences DESC, k.keyword)
+            FROM (
+                SELECT keyword, occurrences
+                FROM analysis_keyword_counts
+                WHERE user_id = p_user_id
+                ORDER BY occurrences DESC, keyword
+                LIMIT p_keyword_limit
+            ) AS k
+        ), '[]'::JSON),
+        'analyses_this_month', COALESCE((
+            SELECT m.total_analyses
+            FROM analysis_user_monthly AS m
+            WHERE m.user_id = p_user_id
+              AND m.month = date_trunc('month', NOW())::DATE
+        ), 0),
+        'average_confidence', CASE
+            WHEN COALESCE(s.total_analyses, 0) > 0
+            THEN LEAST(1.0, GREATEST(0.0, s.confidence_sum / s.total_analyses))
+            ELSE 0
+        END
+    )
+    FROM (SELECT 1) AS one
+    LEFT JOIN analysis_user_stats AS s ON s.user_id = p_user_id;
+$$ LANGUAGE sql STABLE;
+
+-- Recalcular los contadores desde cero (migración inicial o reparación)
+CREATE OR REPLACE FUNCTION rebuild_analysis_stats()
+RETURNS VOID AS $$
+BEGIN
+    DELETE FROM analysis_keyword_counts;
+    DELETE FROM analysis_user_monthly;
+    DELETE FROM analysis_user_stats;
+    PERFORM apply_analysis_stats(a, 1) FROM analyses AS a;
+END;
+$$ LANGUAGE plpgsql SECURITY DEFINER SET search_path = public;
+
+-- Búsqueda con ranking, paginada por OFFSET o por keyset sobre (rank, created_at, id).
+-- DROP previo: CREATE OR REPLACE no puede cambiar las columnas devueltas
+DROP FUNCTION IF EXISTS search_analyses(UUID, TEXT, BOOLEAN, INTEGER, INTEGER, REAL, TIMESTAMP WITH TIME ZONE, UUID);
+CREATE OR REPLACE FUNCTION search_analyses(
+    p_user_id UUID,
+    p_query TEXT,
+    p_include_text BOOLEAN DEFAULT FALSE,
+    p_limit INTEGER DEFAULT 10,
+    p_offset INTEGER DEFAULT 0,
+    p_after_rank REAL DEFAULT NULL,
+    p_after_created_at TIMESTAMP WITH TIME ZONE DEFAULT NULL,
+    p_after_id UUID DEFAULT NULL
+)
+RETURNS TABLE (
+    id UUID,
+    summary TEXT,
+    keywords TEXT[],
+    sentiment_label TEXT,
+    sentiment_confidence REAL,
+    created_at TIMESTAMP WITH TIME ZONE,
+    model TEXT,
+    rank REAL
+) AS $$
+    WITH query AS (
+        SELECT websearch_to_tsquery('simple', p_query) AS q
+    ),
+    matches AS (
+        SELECT
+            a.id, a.summary, a.keywords, a.sentiment_label, a.sentiment_confidence, a.created_at, a.model,
+            (ts_rank(a.search_vector, query.q)
+                + CASE WHEN p_include_text THEN 0.1 * ts_rank(a.text_search_vector, query.q) ELSE 0 END
+            )::REAL AS rank
+        FROM analyses AS a, query
+        WHERE a.user_id = p_user_id
+          AND (
+              a.search_vector @@ query.q
+              OR (p_include_text AND a.text_search_vector @@ query.q)
+          )
+    )
+    SELECT *
+    FROM matches AS m
+    WHERE p_after_id IS NULL
+       OR (m.rank, m.created_at, m.id) < (p_after_rank, p_after_created_at, p_after_id)
+    ORDER BY m.rank DESC, m.created_at DESC, m.id DESC
+    LIMIT p_limit
+    OFFSET CASE WHEN p_after_id IS NULL THEN p_offset ELSE 0 END;
+$$ LANGUAGE sql STABLE;
+
+-- Análisis del usuario más parecidos a un embedding (similitud coseno, 1 = idéntico).
+-- El índice HNSW es global: con un filtro por usuario, los candidatos que
+-- devuelve son en su mayoría de otros usuarios y el filtro los descarta.
+-- Por eso:
+--   - Usuarios con hasta 20.000 análisis (contador de analysis_user_stats):
+--     búsqueda exacta sobre sus filas por el índice (user_id, ...). El "+ 0"
+--     impide que el planner use el HNSW para el ORDER BY.
+--   - Usuarios con más: HNSW con búsqueda iterativa (pgvector >= 0.8), que
+--     sigue recorriendo el grafo hasta reunir p_limit filas del usuario.
+--     Con versiones anteriores solo se amplía ef_search.
+DROP FUNCTION IF EXISTS similar_analyses(UUID, UUID, INTEGER);
+DROP FUNCTION IF EXISTS match_analyses(UUID, VECTOR, INTEGER, REAL, UUID);
+CREATE OR REPLACE FUNCTION match_analyses(
+    p_user_id UUID,
+    p_embedding VECTOR(768),
+    p_limit INTEGER DEFAULT 5,
+    p_min_similarity REAL DEFAULT 0,
+    p_exclude_id UUID DEFAULT NULL
+)
+RETURNS TABLE (
+    id UUID,
+    summary TEXT,
+    keywords TEXT[],
+    sentiment_label TEXT,
+    sentiment_confidence REAL,
+    created_at TIMESTAMP WITH TIME ZONE,
+    model TEXT,
+    similarity REAL
+) AS $$
+#variable_conflict use_column
+DECLARE
+    exact_scan_max CONSTANT INTEGER := 20000;
+    user_rows INTEGER;
+BEGIN
+    SELECT s.total_analyses INTO user_rows
+    FROM analysis_user_stats AS s
+    WHERE s.user_id = p_user_id;
+
+    IF COALESCE(user_rows, 0) <= exact_scan_max THEN
+        RETURN QUERY
+        SELECT nearest.*
+        FROM (
+            SELECT
+                a.id, a.summary, a.keywords, a.sentiment_label, a.sentiment_confidence, a.created_at, a.model,
+                (1 - (a.embedding <=> p_embedding))::REAL AS similarity
+            FROM analyses AS a
+            WHERE a.user_id = p_user_id
+              AND a.embedding IS NOT NULL
+              AND (p_exclude_id IS NULL OR a.id <> p_exclude_id)
+            ORDER BY (a.embedding <=> p_embedding) + 0
+            LIMIT p_limit
+        ) AS nearest
+        WHERE nearest.similarity >= p_min_similarity
+        ORDER BY nearest.similarity DESC;
+        RETURN;
+    END IF;
+
+    PERFORM set_config('hnsw.ef_search', '200', true);
+    BEGIN
+        PERFORM set_config('hnsw.iterative_scan', 'relaxed_order', true);
+    EXCEPTION WHEN OTHERS THEN
+        NULL;  -- pgvector < 0.8: sin búsqueda iterativa
+    END;
+
+    RETURN QUERY
+    SELECT nearest.*
+    FROM (
+        SELECT
+            a.id, a.summary, a.keywords, a.sentiment_label, a.sentiment_confidence, a.created_at, a.model,
+            (1 - (a.embedding <=> p_embedding))::REAL AS similarity
+        FROM analyses AS a
+        WHERE a.user_id = p_user_id
+          AND a.embedding IS NOT NULL
+          AND (p_exclude_id IS NULL OR a.id <> p_exclude_id)
+        ORDER BY a.embedding <=> p_embedding
+        LIMIT p_limit
+    ) AS nearest
+    WHERE nearest.similarity >= p_min_similarity
+    -- relaxed_order puede devolver los vecinos ligeramente desordenados
+    ORDER BY nearest.similarity DESC;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Análisis parecidos a uno ya guardado (usa su embedding almacenado)
+CREATE OR REPLACE FUNCTION similar_analyses(p_user_id UUID, p_analysis_id UUID, p_limit INTEGER DEFAULT 5)
+RETURNS TABLE (
+    id UUID,
+    summary TEXT,
+    keywords TEXT[],
+    sentiment_label TEXT,
+    sentiment_confidence REAL,
+    created_at TIMESTAMP WITH TIME ZONE,
+    model TEXT,
+    similarity REAL
+) AS $$
+    SELECT matches.*
+    FROM analyses AS source,
+         LATERAL match_analyses(p_user_id, source.embedding, p_limit, 0, source.id) AS matches
+    WHERE source.id = p_analysis_id
+      AND source.user_id = p_user_id
+      AND source.embedding IS NOT NULL;
+$$ LANGUAGE sql STABLE;
+
+-- =====================================================
+-- LÍMITE DE USO COMPARTIDO (RATE_LIMIT_BACKEND=supabase)
+-- =====================================================
+
+CREATE TABLE IF NOT EXISTS rate_limit_buckets (
+    key TEXT PRIMARY KEY,
+    tokens DOUBLE PRECISION NOT NULL,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW() NOT NULL
+);
+
+ALTER TABLE rate_limit_buckets ENABLE ROW LEVEL SECURITY;
+
+-- Cobrar p_cost en todos los buckets o en ninguno. Las filas se bloquean en
+-- el orden de p_keys (siempre usuario y luego global), sin interbloqueos.
+CREATE OR REPLACE FUNCTION rate_limit_consume(
+    p_keys TEXT[],
+    p_capacities DOUBLE PRECISION[],
+    p_refill_rates DOUBLE PRECISION[],
+    p_cost DOUBLE PRECISION
+)
+RETURNS JSON AS $$
+DECLARE
+    levels DOUBLE PRECISION[] := '{}';
+    current_tokens DOUBLE PRECISION;
+    last_update TIMESTAMP WITH TIME ZONE;
+    allowed BOOLEAN := TRUE;
+    i INTEGER;
+BEGIN
+    FOR i IN 1 .. array_length(p_keys, 1) LOOP
+        INSERT INTO rate_limit_buckets (key, tokens, updated_at)
+        VALUES (p_keys[i], p_capacities[i], clock_timestamp())
+        ON CONFLICT (key) DO NOTHING;
+
+        SELECT tokens, updated_at INTO current_tokens, last_update
+        FROM rate_limit_buckets
+        WHERE key = p_keys[i]
+        FOR UPDATE;
+
+        current_tokens := LEAST(
+            p_capacities[i],
+            current_tokens + EXTRACT(EPOCH FROM clock_timestamp() - last_update) * p_refill_rates[i]
+        );
+        levels := levels || current_tokens;
+        IF current_tokens < p_cost THEN
+            allowed := FALSE;
+        END IF;
+    END LOOP;
+
+    FOR i IN 1 .. array_length(p_keys, 1) LOOP
+        IF allowed THEN
+            levels[i] := levels[i] - p_cost;
+        END IF;
+        UPDATE rate_limit_buckets
+        SET tokens = levels[i], updated_at = clock_timestamp()
+        WHERE key = p_keys[i];
+    END LOOP;
+
+    RETURN json_build_object('allowed', allowed, 'levels', to_json(levels));
+END;
+$$ LANGUAGE plpgsql;
+
+REVOKE EXECUTE ON FUNCTION rate_limit_consume(TEXT[], DOUBLE PRECISION[], DOUBLE PRECISION[], DOUBLE PRECISION)
+    FROM PUBLIC, anon, authenticated;
+
+-- =====================================================
+-- COLA DE TRABAJOS COMPARTIDA (JOB_STORE_BACKEND=supabase)
+-- =====================================================
+-- Cualquier instancia consulta el estado de un trabajo y cualquier host con
+-- workers lo procesa. Un worker reserva el trabajo durante p_lease_seconds;
+-- si su instancia muere o se congela, otro lo retoma al vencer la reserva.
+
+CREATE TABLE IF NOT EXISTS analysis_jobs (
+    id UUID PRIMARY KEY,
+    user_id UUID NOT NULL REFERENCES auth.users(id) ON DELETE CASCADE,
+    status TEXT NOT NULL DEFAULT 'queued' CHECK (status IN ('queued', 'running', 'succeeded', 'failed')),
+    payload JSONB NOT NULL,
+    result JSONB,
+    error TEXT,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    locked_until TIMESTAMP WITH TIME ZONE,
+    created_at TIMESTAMP WITH TIME ZONE DEFAULT NOW() NOT NULL,
+    updated_at TIMESTAMP WITH TIME ZONE DEFAULT NOW() NOT NULL
+);
+
+-- Solo los pendientes: el índice no crece con el historial de trabajos
+CREATE INDEX IF NOT EXISTS analysis_jobs_pending_idx
+    ON analysis_jobs (created_at) WHERE status IN ('queued', 'running');
+
+ALTER TABLE analysis_jobs ENABLE ROW LEVEL SECURITY;
+
+-- Reservar el trabajo pendiente más antiguo (o uno cuya reserva venció).
+-- SKIP LOCKED: varios workers reservan trabajos distintos sin esperarse.
+CREATE OR REPLACE FUNCTION claim_analysis_job(p_lease_seconds INTEGER, p_max_attempts INTEGER)
+RETURNS SETOF analysis_jobs AS $$
+BEGIN
+    UPDATE analysis_jobs
+    SET status = 'failed', error = 'Se agotaron los intentos', locked_until = NULL, updated_at = NOW()
+    WHERE status = 'running' AND locked_until < NOW() AND attempts >= p_max_attempts;
+
+    RETURN QUERY
+    UPDATE analysis_jobs
+    SET status = 'running',
+        attempts = attempts + 1,
+        locked_until = NOW() + make_interval(secs => p_lease_seconds),
+        updated_at = NOW()
+    WHERE id = (
+        SELECT pending.id
+        FROM analysis_jobs AS pending
+        WHERE pending.status = 'queued'
+           OR (pending.status = 'running' AND pending.locked_until < NOW())
+        ORDER BY pending.created_at
+        LIMIT 1
+        FOR UPDATE SKIP LOCKED
+    )
+    RETURNING *;
+END;
+$$ LANGUAGE plpgsql;
+
+REVOKE EXECUTE ON FUNCTION claim_analysis_job(INTEGER, INTEGER) FROM PUBLIC, anon, authenticated;
+
+-- Las funciones de estadísticas y búsqueda solo se llaman desde el backend (service_role)
+REVOKE EXECUTE ON FUNCTION match_analyses(UUID, VECTOR, INTEGER, REAL, UUID) FROM PUBLIC, anon, authenticated;
+REVOKE EXECUTE ON FUNCTION similar_analyses(UUID, UUID, INTEGER) FROM PUBLIC, anon, authenticated;
+REVOKE EXECUTE ON FUNCTION search_analyses(UUID, TEXT, BOOLEAN, INTEGER, INTEGER, REAL, TIMESTAMP WITH TIME ZONE, UUID)
+    FROM PUBLIC, anon, authenticated;
+REVOKE EXECUTE ON FUNCTION get_analysis_stats(UUID, INTEGER) FROM PUBLIC, anon, authenticated;
+REVOKE EXECUTE ON FUNCTION rebuild_analysis_stats() FROM PUBLIC, anon, authenticated;
+REVOKE EXECUTE ON FUNCTION apply_analysis_stats(analyses, INTEGER) FROM PUBLIC, anon, authenticated;
+
+-- Poblar los contadores con los análisis existentes
+SELECT rebuild_analysis_stats();
@@ -21,6 +21,20 @@ class SentimentLabel(str, Enum):
     NEGATIVE = "negative"
     NEUTRAL = "neutral"
 
+class AnalysisMode(str, Enum):
+    """Motor a usar para el análisis"""
+    LLM = "llm"    # Gemini (con motor local como respaldo)
+    FAST = "fast"  # Solo motor local, sin llamar a Gemini
+
+class ModelQuality(str, Enum):
+    """Nivel de modelo de Gemini (ver services/model_router.py)"""
+    ECONOMY = "economy"    # Modelo económico siempre
+    STANDARD = "standard"  # Económico para textos cortos, estándar para el resto
+    HIGH = "high"          # Modelo de mayor calidad
+
+# Longitud máxima de un documento en el modo de documentos largos
+LONG_TEXT_MAX_LENGTH = 1_000_000
+
 # =====================================================
 # MODELOS BASE
 # =====================================================
@@ -85,7 +99,7 @@ class Analysis(TimestampMixin):
 
 class AnalysisCreate(BaseModel):
     """Modelo para crear análisis"""
-    original_text: str = Field(..., min_length=1, max_length=10000)
+    original_text: str = Field(..., min_length=1, max_length=LONG_TEXT_MAX_LENGTH)
     summary: str = Field(..., min_length=1, max_length=2000)
     keywords: List[str] = Field(..., min_items=1, max_items=20)
     sentiment_label: SentimentLabel
@@ -109,10 +123,22 @@ class AnalysisResponse(BaseModel):
     keywords: List[str]
     sentiment: SentimentResult
     created_at: datetime
+    cached: bool = Field(default=False, description="True si el resultado vino de la caché")
+    model: Optional[str] = Field(default=None, description="Modelo que generó el análisis")
+
+class AnalysisDetail(AnalysisResponse):
+    """Análisis con el texto original (solo en el endpoint de detalle)"""
+    original_text: Optional[str] = None
+
+class SimilarAnalysis(AnalysisResponse):
+    """Análisis parecido a otro, con su similitud coseno"""
+    similarity: float = Field(..., ge=-1.0, le=1.0)
 
 class AnalysisRequest(BaseModel):
     """Solicitud de análisis"""
     text: str = Field(..., min_length=10, max_length=10000, description="Texto a analizar")
+    mode: AnalysisMode = Field(default=AnalysisMode.LLM, description="llm (Gemini) o fast (motor local)")
+    quality: ModelQuality = Field(default=ModelQuality.STANDARD, description="economy, standard o high")
 
     @validator('text')
     def validate_text(cls, v):
@@ -126,6 +152,52 @@ class AnalysisRequest(BaseModel):
         
         return v.strip()
 
+class LongAnalysisRequest(BaseModel):
+    """Solicitud de análisis de un documento largo (se divide en fragmentos)"""
+    text: str = Field(..., min_length=10, max_length=LONG_TEXT_MAX_LENGTH, description="Documento a analizar")
+    mode: AnalysisMode = Field(default=AnalysisMode.LLM, description="llm (Gemini) o fast (motor local)")
+    quality: ModelQuality = Field(default=ModelQuality.STANDARD, description="economy, standard o high")
+
+    @validator('text')
+    def validate_text(cls, v):
+        """Validar texto de entrada"""
+        if not v or not v.strip():
+            raise ValueError('El texto no puede estar vacío')
+        return v.strip()
+
+class BatchAnalysisRequest(BaseModel):
+    """Solicitud de análisis por lotes"""
+    items: List[AnalysisRequest] = Field(..., min_items=1, max_items=50, description="Textos a analizar")
+
+class BatchItemResult(BaseModel):
+    """Resultado individual dentro de un lote"""
+    index: int = Field(..., ge=0, description="Posición del texto en la solicitud")
+    success: bool
+    analysis: Optional[AnalysisResponse] = None
+    error: Optional[str] = None
+
+class BatchAnalysisResponse(BaseModel):
+    """Respuesta de análisis por lotes"""
+    results: List[BatchItemResult]
+    succeeded: int = Field(..., ge=0)
+    failed: int = Field(..., ge=0)
+
+class JobStatus(str, Enum):
+    """Estados de un trabajo de análisis"""
+    QUEUED = "queued"
+    RUNNING = "running"
+    SUCCEEDED = "succeeded"
+    FAILED = "failed"
+
+class AnalysisJob(BaseModel):
+    """Trabajo de análisis asíncrono"""
+    id: str
+    status: JobStatus
+    created_at: datetime
+    updated_at: datetime
+    result: Optional[AnalysisResponse] = None
+    error: Optional[str] = None
+
 # =====================================================
 # MODELOS DE PAGINACIÓN
 # =====================================================
@@ -138,15 +210,18 @@ class PaginationParams(BaseModel):
 class AnalysisHistory(BaseModel):
     """Historial de análisis con paginación"""
     analyses: List[AnalysisResponse]
-    total: int = Field(..., ge=0)
+    total: Optional[int] = Field(default=None, ge=0, description="Solo si se pide include_total")
     page: int = Field(..., ge=1)
     limit: int = Field(..., ge=1, le=100)
-    total_pages: int = Field(..., ge=0)
+    total_pages: Optional[int] = Field(default=None, ge=0)
+    next_cursor: Optional[str] = Field(default=None, description="Cursor opaco para la siguiente página")
 
     @validator('total_pages', pre=True, always=True)
     def calculate_total_pages(cls, v, values):
         """Calcular total de páginas automáticamente"""
-        total = values.get('total', 0)
+        total = values.get('total')
+        if total is None:
+            return None
         limit = values.get('limit', 10)
         return (total + limit - 1) // limit if total > 0 else 0
 
@@ -178,6 +253,18 @@ class AnalysisStats(BaseModel):
     analyses_this_month: int = Field(..., ge=0)
     average_confidence: float = Field(..., ge=0.0, le=1.0)
 
+class PromptUsage(BaseModel):
+    """Uso acumulado de una versión de prompt en este proceso"""
+    prompt: str
+    version: str
+    calls: int = Field(..., ge=0)
+    errors: int = Field(..., ge=0)
+    prompt_tokens: int = Field(..., ge=0)
+    output_tokens: int = Field(..., ge=0)
+    avg_prompt_tokens: float = Field(..., ge=0.0)
+    avg_output_tokens: float = Field(..., ge=0.0)
+    avg_latency_ms: float = Field(..., ge=0.0)
+
 # =====================================================
 # CONFIGURACIÓN DE MODELOS
 # =====================================================
@@ -185,8 +272,9 @@ class AnalysisStats(BaseModel):
 # Configurar todos los modelos para usar alias de campo
 for model_class in [
     UserProfile, UserProfileCreate, UserProfileUpdate,
-    Analysis, AnalysisCreate, AnalysisResponse, AnalysisRequest,
-    AnalysisHistory, PaginationParams, ApiResponse, ApiError, AnalysisStats
+    Analysis, AnalysisCreate, AnalysisResponse, AnalysisDetail, AnalysisRequest, LongAnalysisRequest,
+    BatchAnalysisRequest, BatchItemResult, BatchAnalysisResponse, AnalysisJob, SimilarAnalysis,
+    AnalysisHistory, PaginationParams, ApiResponse, ApiError, AnalysisStats, PromptUsage
 ]:
     model_class.model_config = {
         'from_attributes': True,  # Para compatibilidad con ORMs
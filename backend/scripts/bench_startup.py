@@ -0,0 +1,124 @@
+"""
+⏱️ BENCHMARK DE ARRANQUE EN FRÍO
+===============================
+
+Mide, en un proceso nuevo por ruta (como un cold start de Vercel):
+    - el tiempo de importar api.main
+    - la latencia de la primera petición a cada ruta
+
+Las rutas se llaman con TestClient sin ejecutar el lifespan, igual que en
+runtimes serverless que no lo soportan. Con --importtime se listan además
+los módulos más lentos de importar.
+
+Uso:
+    python scripts/bench_startup.py
+    python scripts/bench_startup.py --runs 5 --route /health --importtime
+"""
+
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+
+DEFAULT_ROUTES = [
+    "/",
+    "/health",
+    "/api/analysis/health/live",
+    "/api/analysis/health",
+]
+
+# Código que se ejecuta en cada proceso hijo
+CHILD_SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+from api.main import app
+import_ms = (time.perf_counter() - start) * 1000
+
+from fastapi.testclient import TestClient
+client = TestClient(app)
+start = time.perf_counter()
+response = client.get(sys.argv[1])
+request_ms = (time.perf_counter() - start) * 1000
+print(json.dumps({
+    "import_ms": import_ms,
+    "request_ms": request_ms,
+    "status": response.status_code,
+    "modules": len(sys.modules),
+}))
+"""
+
+
+def measure(route: str) -> dict:
+    """Medir importación y primera petición en un proceso nuevo"""
+    result = subprocess.run(
+        [sys.executable, "-c", CHILD_SCRIPT, route],
+        cwd=BACKEND_DIR,
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.strip().splitlines()[-1] if result.stderr else "error desconocido")
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def slowest_imports(limit: int) -> list:
+    """Módulos con mayor tiempo acumulado de importación (python -X importtime)"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", "import api.main"],
+        cwd=BACKEND_DIR,
+        capture_output=True,
+        text=True,
+    )
+    rows = []
+    for line in result.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, module = line.split("|")
+        rows.append((int(cumulative.strip()), module.rstrip()))
+    rows.sort(reverse=True)
+    return rows[:limit]
+
+
+def main():
+    """Función principal"""
+    parser = argparse.ArgumentParser(description="Benchmark de arranque en frío del backend")
+    parser.add_argument("--route", action="append", help="Ruta a medir (repetible)")
+    parser.add_argument("--runs", type=int, default=3, help="Procesos por ruta")
+    parser.add_argument("--importtime", action="store_true", help="Listar los imports más lentos")
+    parser.add_argument("--top", type=int, default=15, help="Cantidad de imports a listar")
+    args = parser.parse_args()
+
+    routes = args.route or DEFAULT_ROUTES
+
+    print("=" * 72)
+    print("⏱️  BENCHMARK DE ARRANQUE EN FRÍO")
+    print("=" * 72)
+    print(f"{'Ruta':<32} {'import (ms)':>12} {'1ª petición (ms)':>17} {'status':>7}")
+
+    failed = False
+    for route in routes:
+        try:
+            samples = [measure(route) for _ in range(args.runs)]
+        except RuntimeError as e:
+            print(f"{route:<32} ❌ {e}")
+            failed = True
+            continue
+        import_ms = statistics.median(s["import_ms"] for s in samples)
+        request_ms = statistics.median(s["request_ms"] for s in samples)
+        print(f"{route:<32} {import_ms:>12.1f} {request_ms:>17.1f} {samples[-1]['status']:>7}")
+
+    if args.importtime:
+        print("\n📦 Imports más lentos (acumulado):")
+        for cumulative, module in slowest_imports(args.top):
+            print(f"   {cumulative / 1000:>8.1f} ms  {module}")
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
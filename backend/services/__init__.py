@@ -0,0 +1 @@
+# Servicios compartidos
\ No newline at end of file
@@ -0,0 +1,150 @@
+"""
+🔐 VERIFICACIÓN LOCAL DE TOKENS DE SUPABASE
+==========================================
+
+Dependencias de FastAPI que validan el access token de Supabase sin llamar
+a la API de Auth: la firma se comprueba localmente con el JWT secret del
+proyecto (HS256) o con las claves públicas del JWKS, que se descargan una
+vez y se cachean. Los claims decodificados se guardan en una caché TTL
+pequeña, así que un mismo token solo se verifica una vez por intervalo.
+
+python-jose (y cryptography) se importan en la primera verificación para
+no alargar el arranque en frío de rutas que no requieren autenticación.
+"""
+
+import time
+from typing import Any, Dict, Optional
+
+import httpx
+from fastapi import Depends, Header, HTTPException
+
+from config import settings
+from services.cache import LRUCache
+from services.telemetry import span
+
+# Para pruebas en desarrollo, usar un UUID válido que existe en auth.users
+DEVELOPMENT_USER_ID = "633a8bbc-6727-426b-ad97-a497fbb15653"
+
+# Algoritmos aceptados; el "alg" de la cabecera del token no es de fiar
+SECRET_ALGORITHMS = ("HS256",)
+JWKS_ALGORITHMS = ("RS256", "ES256")
+
+
+class TokenVerifier:
+    """Verificador de access tokens de Supabase con caché de claims"""
+
+    def __init__(
+        self,
+        jwt_secret: str,
+        jwks_url: str,
+        audience: str,
+        cache_entries: int,
+        cache_ttl: float,
+        jwks_ttl: float,
+    ):
+        self.jwt_secret = jwt_secret
+        self.jwks_url = jwks_url
+        self.audience = audience
+        self.jwks_ttl = jwks_ttl
+        self._claims = LRUCache(cache_entries, cache_ttl)
+        self._jwks: Optional[Dict[str, Any]] = None
+        self._jwks_expires_at = 0.0
+
+    async def _get_jwks(self) -> Dict[str, Any]:
+        if self._jwks is None or self._jwks_expires_at < time.monotonic():
+            async with httpx.AsyncClient(timeout=5.0) as client:
+                response = await client.get(self.jwks_url)
+                response.raise_for_status()
+                self._jwks = response.json()
+            self._jwks_expires_at = time.monotonic() + self.jwks_ttl
+        return self._jwks
+
+    async def _signing_key(self, token: str) -> Any:
+        from jose import JWTError, jwt
+
+        header = jwt.get_unverified_header(token)
+        algorithm = header.get("alg")
+        if algorithm in SECRET_ALGORITHMS:
+            if not self.jwt_secret:
+                raise JWTError("SUPABASE_JWT_SECRET no está configurada")
+            return self.jwt_secret, algorithm
+        if algorithm not in JWKS_ALGORITHMS:
+            raise JWTError(f"Algoritmo de firma no permitido: {algorithm}")
+        jwks = await self._get_jwks()
+        for key in jwks.get("keys", []):
+            if key.get("kid") == header.get("kid"):
+                # La clave publicada fija su algoritmo; no se acepta otro
+                if key.get("alg", algorithm) != algorithm:
+                    raise JWTError("El algoritmo no coincide con el de la clave")
+                return key, algorithm
+        raise JWTError("Clave de firma desconocida")
+
+    async def verify(self, token: str) -> Dict[str, Any]:
+        """Devolver los claims del token o lanzar JWTError"""
+        from jose import JWTError, jwt
+
+        claims = self._claims.get(token)
+        if claims is None:
+            key, algorithm = await self._signing_key(token)
+            claims = jwt.decode(token, key, algorithms=[algorithm], audience=self.audience)
+            self._claims.set(token, claims)
+        if claims.get("exp", 0) < time.time():
+            raise JWTError("Token expirado")
+        return claims
+
+    def forget(self, token: str) -> None:
+        """Quitar un token de la caché (p. ej. al cerrar sesión)"""
+        self._claims.pop(token)
+
+
+_verifier: Optional[TokenVerifier] = None
+
+
+def get_token_verifier() -> TokenVerifier:
+    """Obtener el verificador compartido del proceso"""
+    global _verifier
+    if _verifier is None:
+        _verifier = TokenVerifier(
+            jwt_secret=settings.SUPABASE_JWT_SECRET,
+            jwks_url=f"{settings.SUPABASE_URL.rstrip('/')}/auth/v1/.well-known/jwks.json",
+            audience=settings.SUPABASE_JWT_AUDIENCE,
+            cache_entries=settings.AUTH_CACHE_MAX_ENTRIES,
+            cache_ttl=settings.AUTH_CACHE_TTL,
+            jwks_ttl=settings.AUTH_JWKS_TTL,
+        )
+    return _verifier
+
+
+def get_bearer_token(authorization: Optional[str] = Header(None)) -> Optional[str]:
+    """Extraer el token del header Authorization: Bearer <token>"""
+    if not authorization:
+        return None
+    scheme, _, token = authorization.partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        return None
+    return token
+
+
+async def get_current_claims(token: Optional[str] = Depends(get_bearer_token)) -> Dict[str, Any]:
+    """Dependencia: claims verificados del usuario autenticado"""
+    from jose import JWTError
+
+    if token is None:
+        raise HTTPException(status_code=401, detail="No autenticado")
+    try:
+        return await get_token_verifier().verify(token)
+    except (JWTError, httpx.HTTPError) as e:
+        raise HTTPException(status_code=401, detail=f"Token inválido: {str(e)}")
+
+
+async def get_current_user_id(token: Optional[str] = Depends(get_bearer_token)) -> str:
+    """
+    Dependencia: ID del usuario autenticado. Las peticiones sin token solo
+    usan el usuario de pruebas si AUTH_DEV_USER_ENABLED está activado
+    explícitamente (y nunca en producción).
+    """
+    if token is None and settings.AUTH_DEV_USER_ENABLED and not settings.is_production:
+        return DEVELOPMENT_USER_ID
+    with span("auth"):
+        claims = await get_current_claims(token)
+    return claims["sub"]
@@ -0,0 +1,148 @@
+"""
+⚡ CACHÉ DE RESULTADOS DE ANÁLISIS
+=================================
+
+Caché direccionada por contenido: la clave es un hash del texto
+normalizado, el modelo y la versión del prompt, así que reenviar el mismo
+texto (o uno que solo difiere en espacios o mayúsculas) no vuelve a llamar
+a Gemini ni inserta otra fila.
+
+Dos niveles:
+    1. LRU en memoria con TTL y número máximo de entradas.
+    2. Opcional: archivo SQLite local (ANALYSIS_CACHE_SQLITE_PATH), que
+       sobrevive a reinicios del proceso.
+"""
+
+import asyncio
+import hashlib
+import json
+import sqlite3
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+from config import settings
+
+
+def normalize_text(text: str) -> str:
+    """Normalizar texto para comparar envíos casi idénticos"""
+    text = unicodedata.normalize("NFKC", text)
+    return " ".join(text.split()).casefold()
+
+
+def cache_key(text: str, model_name: str, prompt_version: str, scope: str = "") -> str:
+    """Clave SHA-256 del texto normalizado, modelo, versión de prompt y ámbito"""
+    digest = hashlib.sha256()
+    for part in (scope, model_name, prompt_version, normalize_text(text)):
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\x00")
+    return digest.hexdigest()
+
+
+class LRUCache:
+    """LRU en memoria con expiración por TTL"""
+
+    def __init__(self, max_entries: int, ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._data: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        item = self._data.get(key)
+        if item is None:
+            return None
+        expires_at, value = item
+        if expires_at < time.monotonic():
+            del self._data[key]
+            return None
+        self._data.move_to_end(key)
+        return value
+
+    def pop(self, key: str) -> None:
+        """Eliminar una entrada si existe"""
+        self._data.pop(key, None)
+
+    def set(self, key: str, value: Dict[str, Any]) -> None:
+        self._data[key] = (time.monotonic() + self.ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_entries:
+            self._data.popitem(last=False)
+
+
+class SQLiteCache:
+    """Nivel persistente sobre un archivo SQLite local"""
+
+    def __init__(self, path: str, ttl: float):
+        self.ttl = ttl
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS analysis_cache ("
+            " key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+        )
+        self._conn.commit()
+        self._lock = asyncio.Lock()
+
+    def _get(self, key: str) -> Optional[Dict[str, Any]]:
+        row = self._conn.execute(
+            "SELECT value, expires_at FROM analysis_cache WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None or row[1] < time.time():
+            return None
+        return json.loads(row[0])
+
+    def _set(self, key: str, value: Dict[str, Any]) -> None:
+        self._conn.execute(
+            "INSERT OR REPLACE INTO analysis_cache (key, value, expires_at) VALUES (?, ?, ?)",
+            (key, json.dumps(value, default=str), time.time() + self.ttl),
+        )
+        self._conn.commit()
+
+    async def get(self, key: str) -> Optional[Dict[str, Any]]:
+        async with self._lock:
+            return await asyncio.to_thread(self._get, key)
+
+    async def set(self, key: str, value: Dict[str, Any]) -> None:
+        async with self._lock:
+            await asyncio.to_thread(self._set, key, value)
+
+
+class AnalysisCache:
+    """Caché de dos niveles para resultados de análisis"""
+
+    def __init__(self, memory: LRUCache, persistent: Optional[SQLiteCache] = None):
+        self.memory = memory
+        self.persistent = persistent
+
+    async def get(self, key: str) -> Optional[Dict[str, Any]]:
+        value = self.memory.get(key)
+        if value is None and self.persistent is not None:
+            value = await self.persistent.get(key)
+            if value is not None:
+                self.memory.set(key, value)
+        return value
+
+    async def set(self, key: str, value: Dict[str, Any]) -> None:
+        self.memory.set(key, value)
+        if self.persistent is not None:
+            await self.persistent.set(key, value)
+
+
+_cache: Optional[AnalysisCache] = None
+
+
+def get_analysis_cache() -> AnalysisCache:
+    """Obtener la caché compartida del proceso"""
+    global _cache
+    if _cache is None:
+        persistent = None
+        if settings.ANALYSIS_CACHE_SQLITE_PATH:
+            persistent = SQLiteCache(settings.ANALYSIS_CACHE_SQLITE_PATH, settings.ANALYSIS_CACHE_TTL)
+        _cache = AnalysisCache(
+            LRUCache(settings.ANALYSIS_CACHE_MAX_ENTRIES, settings.ANALYSIS_CACHE_TTL),
+            persistent,
+        )
+    return _cache
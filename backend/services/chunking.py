@@ -0,0 +1,112 @@
+"""
+✂️ DIVISIÓN DE DOCUMENTOS LARGOS
+===============================
+
+Divide un documento en fragmentos que caben en un presupuesto de tokens,
+cortando por párrafos y, si un párrafo no cabe, por oraciones (y como
+último recurso por palabras). También combina los resultados parciales de
+cada fragmento: unión y re-ranking de palabras clave y sentimiento
+ponderado por la longitud del fragmento.
+
+Las funciones son puras y a nivel de módulo para poder ejecutarse en el
+pool de procesos.
+"""
+
+import re
+from collections import defaultdict
+from typing import Dict, List
+
+_PARAGRAPH_RE = re.compile(r"\n\s*\n")
+_SENTENCE_RE = re.compile(r"(?<=[.!?…])\s+")
+
+# Aproximación usada por Google para texto en lenguas latinas
+CHARS_PER_TOKEN = 4
+
+
+def estimate_tokens(text: str) -> int:
+    """Estimar el número de tokens de un texto"""
+    return max(1, len(text) // CHARS_PER_TOKEN)
+
+
+def _split_oversized(piece: str, max_chars: int) -> List[str]:
+    """Dividir un bloque demasiado grande por oraciones y, si hace falta, por palabras"""
+    parts: List[str] = []
+    for sentence in _SENTENCE_RE.split(piece):
+        if len(sentence) <= max_chars:
+            parts.append(sentence)
+            continue
+        words = sentence.split()
+        current: List[str] = []
+        size = 0
+        for word in words:
+            if current and size + len(word) + 1 > max_chars:
+                parts.append(" ".join(current))
+                current, size = [], 0
+            current.append(word)
+            size += len(word) + 1
+        if current:
+            parts.append(" ".join(current))
+    return parts
+
+
+def split_into_chunks(text: str, max_tokens: int) -> List[str]:
+    """
+    Dividir el texto en fragmentos de como máximo max_tokens (estimados),
+    agrupando párrafos completos siempre que quepan
+    """
+    max_chars = max_tokens * CHARS_PER_TOKEN
+    pieces: List[str] = []
+    for paragraph in _PARAGRAPH_RE.split(text):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        if len(paragraph) <= max_chars:
+            pieces.append(paragraph)
+        else:
+            pieces.extend(_split_oversized(paragraph, max_chars))
+
+    chunks: List[str] = []
+    current: List[str] = []
+    size = 0
+    for piece in pieces:
+        if current and size + len(piece) + 2 > max_chars:
+            chunks.append("\n\n".join(current))
+            current, size = [], 0
+        current.append(piece)
+        size += len(piece) + 2
+    if current:
+        chunks.append("\n\n".join(current))
+    return chunks
+
+
+def merge_keywords(keyword_lists: List[List[str]], weights: List[int], limit: int = 10) -> List[str]:
+    """
+    Unir las palabras clave de todos los fragmentos. Cada palabra suma
+    peso_del_fragmento / (posición + 1), así que cuentan tanto su posición
+    en cada lista como la longitud de los fragmentos donde aparece.
+    """
+    scores: Dict[str, float] = defaultdict(float)
+    display: Dict[str, str] = {}
+    for keywords, weight in zip(keyword_lists, weights):
+        for rank, keyword in enumerate(keywords):
+            key = keyword.strip().casefold()
+            if not key:
+                continue
+            scores[key] += weight / (rank + 1)
+            display.setdefault(key, keyword.strip())
+    ranked = sorted(scores, key=lambda key: scores[key], reverse=True)
+    return [display[key] for key in ranked[:limit]]
+
+
+def merge_sentiments(sentiments: List[dict], weights: List[int]) -> dict:
+    """
+    Sentimiento global: gana la etiqueta con mayor suma de
+    longitud x confianza; la confianza es su proporción sobre el total
+    """
+    totals: Dict[str, float] = defaultdict(float)
+    for sentiment, weight in zip(sentiments, weights):
+        totals[sentiment["label"]] += weight * float(sentiment["confidence"])
+    total_weight = sum(weights) or 1
+    label = max(totals, key=lambda name: totals[name]) if totals else "neutral"
+    confidence = totals.get(label, 0.0) / total_weight
+    return {"label": label, "confidence": round(min(1.0, max(0.0, confidence)), 2)}
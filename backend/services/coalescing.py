@@ -0,0 +1,41 @@
+"""
+🔀 COALESCENCIA DE PETICIONES (SINGLE-FLIGHT)
+============================================
+
+Si llegan varias peticiones idénticas mientras la primera sigue en curso,
+solo esa primera ejecuta el trabajo (llamada a Gemini e inserción en
+Supabase); las demás esperan y reciben el mismo resultado o la misma
+excepción.
+
+El trabajo corre en su propia tarea: si el cliente que lo inició se
+desconecta, los demás siguen esperando el resultado sin cancelarlo.
+"""
+
+import asyncio
+from typing import Any, Awaitable, Callable, Dict
+
+
+class SingleFlight:
+    """Agrupa llamadas concurrentes con la misma clave en una sola ejecución"""
+
+    def __init__(self):
+        self._calls: Dict[str, asyncio.Future] = {}
+
+    def __len__(self) -> int:
+        return len(self._calls)
+
+    async def do(self, key: str, func: Callable[[], Awaitable[Any]]) -> Any:
+        """Ejecutar func() una sola vez por clave mientras esté en curso"""
+        task = self._calls.get(key)
+        if task is None:
+            task = asyncio.ensure_future(func())
+            self._calls[key] = task
+            task.add_done_callback(lambda done: self._forget(key, done))
+        return await asyncio.shield(task)
+
+    def _forget(self, key: str, task: asyncio.Future) -> None:
+        if self._calls.get(key) is task:
+            del self._calls[key]
+        # Evitar el aviso "exception was never retrieved" si nadie esperaba
+        if not task.cancelled():
+            task.exception()
@@ -0,0 +1,399 @@
+"""
+🤖 GATEWAY ASÍNCRONO PARA GEMINI
+================================
+
+Punto único de acceso a Gemini para todos los routers.
+
+Las llamadas usan la API asíncrona del SDK, de modo que una llamada lenta
+no bloquea el event loop. Un semáforo limita las llamadas simultáneas y
+una cola acotada aplica backpressure: si no hay turno a tiempo se lanza
+GeminiSaturatedError, que los routers traducen a un 429.
+
+Cada llamada pasa por un circuit breaker y los errores transitorios se
+reintentan con backoff exponencial y jitter. Los embeddings tienen su
+propio breaker: son opcionales y con un timeout corto, y sus fallos no
+deben abrir el circuito de la generación ni contar para el p95. Opcionalmente, si una
+generación tarda más que el p95 reciente se lanza una segunda petición de
+cobertura y se usa la primera que responda (ver services/resilience.py).
+
+El SDK de Google se importa al crear el gateway (primera llamada real), no
+al importar el módulo, para no penalizar el arranque en frío.
+"""
+
+import asyncio
+import time
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from config import settings
+from services.resilience import (
+    CircuitBreaker,
+    LatencyTracker,
+    backoff_delay,
+    is_retryable,
+)
+from services.telemetry import record_upstream, span, upstream_span
+
+
+class GeminiSaturatedError(Exception):
+    """No hay capacidad para atender la llamada a Gemini"""
+
+
+class GeminiTimeoutError(Exception):
+    """La llamada a Gemini superó el tiempo máximo permitido"""
+
+
+# Mínimo de muestras de latencia antes de usar el p95 para hedging
+HEDGE_MIN_SAMPLES = 20
+
+
+class GeminiGateway:
+    """Cliente asíncrono de Gemini con concurrencia acotada"""
+
+    def __init__(
+        self,
+        api_key: str,
+        max_concurrency: int,
+        max_queue: int,
+        queue_timeout: float,
+        call_timeout: float,
+    ):
+        import google.generativeai as genai
+
+        genai.configure(api_key=api_key)
+        self._genai = genai
+        # Generación restringida a un esquema JSON (SDK >= 0.6, la versión de
+        # requirements.txt); con versiones anteriores el esquema va solo en el prompt
+        config_fields = getattr(genai.types.GenerationConfig, "__dataclass_fields__", {})
+        self.supports_response_schema = "response_schema" in config_fields
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.call_timeout = call_timeout
+        self._models: Dict[str, Any] = {}
+        # El semáforo se crea dentro del event loop (ver _get_semaphore)
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._in_flight = 0
+        self._waiting = 0
+        self.max_retries = settings.GEMINI_MAX_RETRIES
+        self.retry_base_delay = settings.GEMINI_RETRY_BASE_DELAY
+        self.retry_max_delay = settings.GEMINI_RETRY_MAX_DELAY
+        self.hedge_enabled = settings.GEMINI_HEDGE_ENABLED
+        self.hedge_min_delay = settings.GEMINI_HEDGE_MIN_DELAY
+        self.latency = LatencyTracker()
+        self.breaker = self._new_breaker()
+        self.embed_breaker = self._new_breaker()
+
+    @staticmethod
+    def _new_breaker() -> CircuitBreaker:
+        return CircuitBreaker(
+            error_rate=settings.GEMINI_BREAKER_ERROR_RATE,
+            min_calls=settings.GEMINI_BREAKER_MIN_CALLS,
+            window=settings.GEMINI_BREAKER_WINDOW,
+            cooldown=settings.GEMINI_BREAKER_COOLDOWN,
+        )
+
+    @property
+    def in_flight(self) -> int:
+        """Llamadas a Gemini en curso"""
+        return self._in_flight
+
+    @property
+    def waiting(self) -> int:
+        """Peticiones esperando turno"""
+        return self._waiting
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._semaphore
+
+    def _get_model(self, model_name: str) -> Any:
+        model = self._models.get(model_name)
+        if model is None:
+            model = self._genai.GenerativeModel(model_name)
+            self._models[model_name] = model
+        return model
+
+    async def _acquire(self) -> None:
+        """Reservar un turno o lanzar GeminiSaturatedError"""
+        semaphore = self._get_semaphore()
+
+        if semaphore.locked() and (self.queue_timeout <= 0 or self._waiting >= self.max_queue):
+            raise GeminiSaturatedError("Demasiadas solicitudes a Gemini en curso")
+
+        self._waiting += 1
+        try:
+            await asyncio.wait_for(semaphore.acquire(), timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            raise GeminiSaturatedError("Tiempo de espera agotado en la cola de Gemini")
+        finally:
+            self._waiting -= 1
+
+    @staticmethod
+    def _is_transient(error: Exception) -> bool:
+        return isinstance(error, GeminiTimeoutError) or is_retryable(error)
+
+    async def _attempt(
+        self,
+        call: Callable[[], Awaitable[Any]],
+        breaker: Optional[CircuitBreaker] = None,
+        latency: Optional[LatencyTracker] = None,
+    ) -> Any:
+        """
+        Una llamada a Gemini, registrada en el circuit breaker y en las
+        latencias (por defecto los de la generación)
+        """
+        breaker = breaker or self.breaker
+        breaker.before_call()
+        started = time.monotonic()
+        try:
+            result = await call()
+        except (GeminiSaturatedError, asyncio.CancelledError):
+            breaker.record_ignored()
+            raise
+        except Exception as e:
+            if self._is_transient(e):
+                breaker.record_failure()
+            else:
+                # Gemini respondió (p. ej. 400): el servicio está disponible
+                breaker.record_success()
+            raise
+        breaker.record_success()
+        if latency is not None:
+            latency.record(time.monotonic() - started)
+        return result
+
+    async def _with_retries(self, call: Callable[[], Awaitable[Any]], max_retries: Optional[int] = None) -> Any:
+        """Reintentar errores transitorios con backoff exponencial y jitter"""
+        max_retries = self.max_retries if max_retries is None else max_retries
+        for attempt in range(max_retries + 1):
+            try:
+                return await call()
+            except Exception as e:
+                if attempt >= max_retries or not self._is_transient(e):
+                    raise
+                await asyncio.sleep(backoff_delay(attempt, self.retry_base_delay, self.retry_max_delay))
+
+    def _hedge_delay(self) -> Optional[float]:
+        if not self.hedge_enabled or len(self.latency) < HEDGE_MIN_SAMPLES:
+            return None
+        return max(self.hedge_min_delay, self.latency.percentile(95))
+
+    async def _hedged(self, call: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Si la llamada supera el p95 reciente y hay capacidad libre, lanzar
+        una segunda y quedarse con la primera respuesta correcta
+        """
+        delay = self._hedge_delay()
+        if delay is None:
+            return await call()
+
+        tasks = [asyncio.ensure_future(call())]
+        try:
+            await asyncio.wait(tasks, timeout=delay)
+            if not tasks[0].done() and not self._get_semaphore().locked() \
+                    and self.breaker.state == CircuitBreaker.CLOSED:
+                tasks.append(asyncio.ensure_future(call()))
+
+            pending = set(tasks)
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+            raise tasks[0].exception()
+        finally:
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+                elif not task.cancelled():
+                    task.exception()
+
+    def _generation_config(self, response_schema: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        if response_schema is None or not self.supports_response_schema:
+            return None
+        return {"response_mime_type": "application/json", "response_schema": response_schema}
+
+    @staticmethod
+    def _usage(response: Any) -> Dict[str, int]:
+        """
+        Tokens reales de la respuesta si el SDK los expone (usage_metadata);
+        vacío en versiones que no lo hacen, y el llamador los estima
+        """
+        usage = getattr(response, "usage_metadata", None)
+        if usage is None:
+            return {}
+        return {
+            "prompt_tokens": getattr(usage, "prompt_token_count", 0) or 0,
+            "output_tokens": getattr(usage, "candidates_token_count", 0) or 0,
+        }
+
+    async def _generate_once(
+        self, prompt: str, model_name: str, timeout: Optional[float], response_schema: Optional[Dict[str, Any]]
+    ) -> Tuple[str, Dict[str, int]]:
+        with span("gemini_queue"):
+            await self._acquire()
+        self._in_flight += 1
+        try:
+            model = self._get_model(model_name)
+            with upstream_span("gemini", "generate"):
+                response = await asyncio.wait_for(
+                    model.generate_content_async(
+                        prompt, generation_config=self._generation_config(response_schema)
+                    ),
+                    timeout=timeout or self.call_timeout,
+                )
+            return response.text, self._usage(response)
+        except asyncio.TimeoutError:
+            raise GeminiTimeoutError(f"Gemini no respondió en {timeout or self.call_timeout}s")
+        finally:
+            self._in_flight -= 1
+            self._get_semaphore().release()
+
+    async def generate(
+        self,
+        prompt: str,
+        model_name: str,
+        timeout: Optional[float] = None,
+        response_schema: Optional[Dict[str, Any]] = None,
+    ) -> str:
+        """
+        Generar contenido con Gemini y devolver el texto de la respuesta.
+        Con response_schema se pide JSON que cumpla el esquema.
+        Lanza CircuitOpenError si Gemini está marcado como caído.
+        """
+        text, _ = await self.generate_with_usage(prompt, model_name, timeout, response_schema)
+        return text
+
+    async def generate_with_usage(
+        self,
+        prompt: str,
+        model_name: str,
+        timeout: Optional[float] = None,
+        response_schema: Optional[Dict[str, Any]] = None,
+        max_retries: Optional[int] = None,
+    ) -> Tuple[str, Dict[str, int]]:
+        """
+        Como generate, devolviendo además los tokens usados ({} si el SDK no
+        los informa). max_retries=0 desactiva los reintentos (el router de
+        modelos prefiere pasar al modelo secundario).
+        """
+        async def attempt() -> Tuple[str, Dict[str, int]]:
+            return await self._attempt(
+                lambda: self._generate_once(prompt, model_name, timeout, response_schema), latency=self.latency
+            )
+
+        return await self._with_retries(lambda: self._hedged(attempt), max_retries)
+
+    async def embed(
+        self,
+        texts: List[str],
+        model_name: str,
+        timeout: Optional[float] = None,
+        max_retries: Optional[int] = None,
+    ) -> List[List[float]]:
+        """
+        Calcular embeddings de varios textos en una sola llamada (el SDK
+        agrupa la petición con batch_embed_contents). Usan embed_breaker y no
+        registran latencias: no afectan al circuito ni al hedging de la generación.
+        """
+        async def embed_once() -> List[List[float]]:
+            with span("gemini_queue"):
+                await self._acquire()
+            self._in_flight += 1
+            try:
+                with upstream_span("gemini", "embed"):
+                    result = await asyncio.wait_for(
+                        asyncio.to_thread(self._genai.embed_content, model=model_name, content=list(texts)),
+                        timeout=timeout or self.call_timeout,
+                    )
+                return result["embedding"]
+            except asyncio.TimeoutError:
+                raise GeminiTimeoutError(f"Gemini no respondió en {timeout or self.call_timeout}s")
+            finally:
+                self._in_flight -= 1
+                self._get_semaphore().release()
+
+        return await self._with_retries(lambda: self._attempt(embed_once, breaker=self.embed_breaker), max_retries)
+
+    async def ping(self, model_name: str) -> None:
+        """
+        Verificar que la API responde consultando los metadatos del modelo
+        (no genera contenido ni consume tokens)
+        """
+        try:
+            await asyncio.wait_for(
+                asyncio.to_thread(self._genai.get_model, f"models/{model_name}"),
+                timeout=self.call_timeout,
+            )
+        except asyncio.TimeoutError:
+            raise GeminiTimeoutError(f"Gemini no respondió en {self.call_timeout}s")
+
+    async def generate_stream(
+        self, prompt: str, model_name: str, timeout: Optional[float] = None
+    ) -> AsyncIterator[str]:
+        """
+        Generar contenido en streaming, devolviendo el texto de cada fragmento.
+        El timeout se aplica a la espera de cada fragmento. No se reintenta
+        (parte del texto ya pudo enviarse), pero cuenta para el circuit breaker.
+        """
+        timeout = timeout or self.call_timeout
+        self.breaker.before_call()
+        try:
+            await self._acquire()
+        except GeminiSaturatedError:
+            self.breaker.record_ignored()
+            raise
+        self._in_flight += 1
+        outcome_recorded = completed = False
+        started = time.perf_counter()
+        try:
+            model = self._get_model(model_name)
+            response = await asyncio.wait_for(
+                model.generate_content_async(prompt, stream=True),
+                timeout=timeout,
+            )
+            chunks = response.__aiter__()
+            while True:
+                try:
+                    chunk = await asyncio.wait_for(chunks.__anext__(), timeout=timeout)
+                except StopAsyncIteration:
+                    break
+                yield chunk.text
+            self.breaker.record_success()
+            outcome_recorded = completed = True
+        except asyncio.TimeoutError:
+            self.breaker.record_failure()
+            outcome_recorded = True
+            raise GeminiTimeoutError(f"Gemini no respondió en {timeout}s")
+        except Exception as e:
+            if self._is_transient(e):
+                self.breaker.record_failure()
+            else:
+                self.breaker.record_success()
+            outcome_recorded = True
+            raise
+        finally:
+            # Cancelación o cliente desconectado: sin veredicto
+            if not outcome_recorded:
+                self.breaker.record_ignored()
+            record_upstream("gemini", "stream", time.perf_counter() - started, "ok" if completed else "error")
+            self._in_flight -= 1
+            self._get_semaphore().release()
+
+
+_gateway: Optional[GeminiGateway] = None
+
+
+def get_gemini_gateway() -> GeminiGateway:
+    """Obtener el gateway compartido del proceso"""
+    global _gateway
+    if _gateway is None:
+        _gateway = GeminiGateway(
+            api_key=settings.GEMINI_API_KEY,
+            max_concurrency=settings.GEMINI_MAX_CONCURRENCY,
+            max_queue=settings.GEMINI_MAX_QUEUE,
+            queue_timeout=settings.GEMINI_QUEUE_TIMEOUT,
+            call_timeout=settings.GEMINI_TIMEOUT,
+        )
+    return _gateway
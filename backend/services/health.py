@@ -0,0 +1,102 @@
+"""
+🩺 MONITOR DE DISPONIBILIDAD
+===========================
+
+Las comprobaciones de Supabase y Gemini se ejecutan en segundo plano cada
+HEALTH_CHECK_INTERVAL segundos y el último resultado se guarda con su
+marca de tiempo. El endpoint de readiness sirve esa instantánea sin hacer
+I/O, así que los sondeos del balanceador no generan llamadas a Gemini.
+"""
+
+import asyncio
+import time
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+from config import settings
+from services.gemini import get_gemini_gateway
+from services.supabase import get_repository
+
+class ReadinessMonitor:
+    """Ejecuta las comprobaciones de dependencias y cachea el resultado"""
+
+    def __init__(self, interval: float):
+        self.interval = interval
+        self._snapshot: Dict[str, Any] = {
+            "status": "unknown",
+            "supabase": "unknown",
+            "gemini": "unknown",
+            "timestamp": None,
+        }
+        self._checked_at = 0.0
+        self._task: Optional[asyncio.Task] = None
+        self._refreshing: Optional[asyncio.Task] = None
+
+    async def check(self) -> Dict[str, Any]:
+        """Ejecutar las comprobaciones y actualizar la instantánea"""
+        supabase_status = "ok"
+        try:
+            await get_repository().ping()
+        except Exception as e:
+            supabase_status = f"error: {str(e)}"
+
+        gemini_status = "ok"
+        try:
+            await get_gemini_gateway().ping(settings.MODEL_STANDARD)
+        except Exception as e:
+            gemini_status = f"error: {str(e)}"
+
+        self._snapshot = {
+            "status": "healthy" if supabase_status == "ok" and gemini_status == "ok" else "unhealthy",
+            "supabase": supabase_status,
+            "gemini": gemini_status,
+            "timestamp": datetime.now().isoformat(),
+        }
+        self._checked_at = time.monotonic()
+        return self._snapshot
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self.check()
+            except Exception as e:
+                print(f"Error en comprobación de salud: {e}")
+            await asyncio.sleep(self.interval)
+
+    def start(self) -> None:
+        """Lanzar el bucle de comprobaciones en segundo plano"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Detener el bucle de comprobaciones"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def snapshot(self) -> Dict[str, Any]:
+        """
+        Última instantánea con su antigüedad. Si el bucle no está corriendo
+        (p. ej. en serverless sin lifespan) y la instantánea está vencida,
+        se programa una comprobación sin esperar su resultado.
+        """
+        stale = time.monotonic() - self._checked_at > self.interval
+        if self._task is None and stale and (self._refreshing is None or self._refreshing.done()):
+            self._refreshing = asyncio.create_task(self.check())
+        age = round(time.monotonic() - self._checked_at, 1) if self._checked_at else None
+        return {**self._snapshot, "age_seconds": age}
+
+
+_monitor: Optional[ReadinessMonitor] = None
+
+
+def get_readiness_monitor() -> ReadinessMonitor:
+    """Obtener el monitor compartido del proceso"""
+    global _monitor
+    if _monitor is None:
+        _monitor = ReadinessMonitor(settings.HEALTH_CHECK_INTERVAL)
+    return _monitor
@@ -0,0 +1,339 @@
+"""
+📬 COLA DE TRABAJOS DE ANÁLISIS
+==============================
+
+API de enviar-y-consultar: el endpoint encola el trabajo y responde de
+inmediato con su ID; un grupo de workers (tareas asyncio) procesa los
+trabajos y guarda el estado y el resultado en un almacén.
+
+Almacenes disponibles (JOB_STORE_BACKEND):
+    - memory: en memoria del proceso (desarrollo y pruebas). Con
+      JOB_STORE_SQLITE_PATH, archivo SQLite local: los trabajos
+      pendientes se vuelven a encolar al reiniciar el proceso.
+    - supabase: tabla analysis_jobs compartida. Cualquier instancia
+      consulta el estado y los workers de cualquier host reservan
+      trabajos con una reserva (lease) que vence si el host muere.
+
+Los workers necesitan un proceso de larga duración: en serverless la
+instancia se congela entre peticiones. Por eso la cola solo acepta
+trabajos con JOBS_ENABLED=true y, con un almacén local, si este mismo
+proceso tiene workers (JOB_WORKERS > 0). En Vercel se usa el almacén
+supabase con JOB_WORKERS=0 y los workers corren en un host persistente
+con la misma configuración.
+
+El procesamiento en sí lo define el router mediante set_handler, para que
+este módulo no dependa del pipeline de análisis.
+"""
+
+import asyncio
+import json
+import sqlite3
+import uuid
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from config import settings
+from services.supabase import SupabaseRepository, get_repository
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_SUCCEEDED = "succeeded"
+JOB_FAILED = "failed"
+
+FINISHED_STATUSES = (JOB_SUCCEEDED, JOB_FAILED)
+
+
+class JobQueueFullError(Exception):
+    """La cola de trabajos alcanzó su tamaño máximo"""
+
+
+class JobsUnavailableError(Exception):
+    """Este despliegue no tiene workers que procesen los trabajos"""
+
+
+class InMemoryJobStore:
+    """Almacén en memoria; descarta los trabajos terminados más antiguos"""
+
+    # Solo lo ven los workers de este proceso
+    shared = False
+
+    def __init__(self, max_jobs: int):
+        self.max_jobs = max_jobs
+        self._jobs: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+
+    async def create(self, job: Dict[str, Any]) -> None:
+        self._jobs[job["id"]] = job
+        if len(self._jobs) > self.max_jobs:
+            for job_id in [k for k, v in self._jobs.items() if v["status"] in FINISHED_STATUSES]:
+                del self._jobs[job_id]
+                if len(self._jobs) <= self.max_jobs:
+                    break
+
+    async def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        job = self._jobs.get(job_id)
+        return dict(job) if job is not None else None
+
+    async def update(self, job_id: str, **fields: Any) -> None:
+        if job_id in self._jobs:
+            self._jobs[job_id].update(fields, updated_at=datetime.now().isoformat())
+
+    async def list_unfinished(self) -> List[Dict[str, Any]]:
+        return []
+
+
+class SQLiteJobStore:
+    """Almacén persistente sobre un archivo SQLite local"""
+
+    shared = False
+
+    def __init__(self, path: str):
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS analysis_jobs ("
+            " id TEXT PRIMARY KEY, user_id TEXT NOT NULL, status TEXT NOT NULL,"
+            " payload TEXT NOT NULL, result TEXT, error TEXT,"
+            " created_at TEXT NOT NULL, updated_at TEXT NOT NULL)"
+        )
+        self._conn.commit()
+        self._lock = asyncio.Lock()
+
+    @staticmethod
+    def _row_to_job(row: tuple) -> Dict[str, Any]:
+        return {
+            "id": row[0],
+            "user_id": row[1],
+            "status": row[2],
+            "payload": json.loads(row[3]),
+            "result": json.loads(row[4]) if row[4] else None,
+            "error": row[5],
+            "created_at": row[6],
+            "updated_at": row[7],
+        }
+
+    def _execute(self, sql: str, params: tuple = ()) -> List[tuple]:
+        rows = self._conn.execute(sql, params).fetchall()
+        self._conn.commit()
+        return rows
+
+    async def _run(self, sql: str, params: tuple = ()) -> List[tuple]:
+        async with self._lock:
+            return await asyncio.to_thread(self._execute, sql, params)
+
+    async def create(self, job: Dict[str, Any]) -> None:
+        await self._run(
+            "INSERT INTO analysis_jobs VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (
+                job["id"], job["user_id"], job["status"], json.dumps(job["payload"]),
+                None, None, job["created_at"], job["updated_at"],
+            ),
+        )
+
+    async def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        rows = await self._run("SELECT * FROM analysis_jobs WHERE id = ?", (job_id,))
+        return self._row_to_job(rows[0]) if rows else None
+
+    async def update(self, job_id: str, **fields: Any) -> None:
+        fields["updated_at"] = datetime.now().isoformat()
+        if "result" in fields:
+            fields["result"] = json.dumps(fields["result"], default=str)
+        columns = ", ".join(f"{name} = ?" for name in fields)
+        await self._run(f"UPDATE analysis_jobs SET {columns} WHERE id = ?", (*fields.values(), job_id))
+
+    async def list_unfinished(self) -> List[Dict[str, Any]]:
+        rows = await self._run(
+            "SELECT * FROM analysis_jobs WHERE status IN (?, ?) ORDER BY created_at",
+            (JOB_QUEUED, JOB_RUNNING),
+        )
+        return [self._row_to_job(row) for row in rows]
+
+
+class SupabaseJobStore:
+    """Almacén compartido en la tabla analysis_jobs de Supabase"""
+
+    shared = True
+
+    COLUMNS = "id,user_id,status,payload,result,error,created_at,updated_at"
+
+    def __init__(self, repository: SupabaseRepository, lease_seconds: int, max_attempts: int):
+        self.repository = repository
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+
+    async def create(self, job: Dict[str, Any]) -> None:
+        await self.repository.insert_job(job)
+
+    async def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        try:
+            uuid.UUID(job_id)
+        except ValueError:
+            return None
+        return await self.repository.get_job(job_id, columns=self.COLUMNS)
+
+    async def update(self, job_id: str, **fields: Any) -> None:
+        fields["updated_at"] = datetime.now().isoformat()
+        if fields.get("status") in FINISHED_STATUSES:
+            fields["locked_until"] = None
+        await self.repository.update_job(job_id, fields)
+
+    async def list_unfinished(self) -> List[Dict[str, Any]]:
+        # Los pendientes se reservan de la tabla (claim), no se reencolan
+        return []
+
+    async def count_queued(self) -> int:
+        return await self.repository.count_jobs(JOB_QUEUED)
+
+    async def claim(self) -> Optional[Dict[str, Any]]:
+        """Reservar el siguiente trabajo pendiente (o uno abandonado)"""
+        return await self.repository.claim_job(self.lease_seconds, self.max_attempts)
+
+
+JobHandler = Callable[[Dict[str, Any]], Awaitable[Dict[str, Any]]]
+
+
+class JobQueue:
+    """Cola acotada de trabajos con un grupo de workers asyncio"""
+
+    def __init__(
+        self, store: Any, workers: int, max_size: int, enabled: bool = True, poll_interval: float = 1.0
+    ):
+        self.store = store
+        self.workers = workers
+        self.max_size = max_size
+        self.enabled = enabled
+        self.poll_interval = poll_interval
+        self._handler: Optional[JobHandler] = None
+        self._queue: Optional[asyncio.Queue] = None
+        # Despierta a los workers locales al encolar en el almacén compartido
+        self._wake: Optional[asyncio.Event] = None
+        self._tasks: List[asyncio.Task] = []
+        self._started = False
+
+    @property
+    def accepts_jobs(self) -> bool:
+        """
+        True si algún worker procesará los trabajos: con el almacén compartido
+        puede ser otro host; con uno local, tiene que ser este proceso
+        """
+        return self.enabled and (self.store.shared or self.workers > 0)
+
+    def set_handler(self, handler: JobHandler) -> None:
+        """Definir la función que procesa cada trabajo y devuelve su resultado"""
+        self._handler = handler
+
+    async def start(self) -> None:
+        """Lanzar los workers y volver a encolar trabajos pendientes del almacén"""
+        if self._started or not self.enabled:
+            return
+        self._started = True
+        self._queue = asyncio.Queue(maxsize=self.max_size)
+        self._wake = asyncio.Event()
+        worker = self._shared_worker if self.store.shared else self._worker
+        self._tasks = [asyncio.create_task(worker()) for _ in range(self.workers)]
+        for job in await self.store.list_unfinished():
+            if self._queue.full():
+                print("Cola llena: trabajos pendientes sin re-encolar")
+                break
+            await self.store.update(job["id"], status=JOB_QUEUED)
+            self._queue.put_nowait(job["id"])
+
+    async def stop(self) -> None:
+        """Detener los workers (los trabajos pendientes quedan en el almacén)"""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._started = False
+
+    async def submit(self, user_id: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+        """Encolar un trabajo y devolverlo con estado queued"""
+        if not self.accepts_jobs:
+            raise JobsUnavailableError("La cola de trabajos no está disponible en este despliegue")
+        await self.start()
+        if self.store.shared:
+            full = await self.store.count_queued() >= self.max_size
+        else:
+            full = self._queue.full()
+        if full:
+            raise JobQueueFullError("La cola de trabajos está llena")
+        now = datetime.now().isoformat()
+        job = {
+            "id": str(uuid.uuid4()),
+            "user_id": user_id,
+            "status": JOB_QUEUED,
+            "payload": payload,
+            "result": None,
+            "error": None,
+            "created_at": now,
+            "updated_at": now,
+        }
+        await self.store.create(job)
+        if self.store.shared:
+            self._wake.set()
+        else:
+            self._queue.put_nowait(job["id"])
+        return job
+
+    async def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Obtener el estado de un trabajo"""
+        return await self.store.get(job_id)
+
+    async def _process(self, job: Dict[str, Any]) -> None:
+        try:
+            result = await self._handler(job)
+        except Exception as e:
+            print(f"Error procesando trabajo {job['id']}: {e}")
+            await self.store.update(job["id"], status=JOB_FAILED, error=str(e) or type(e).__name__)
+        else:
+            await self.store.update(job["id"], status=JOB_SUCCEEDED, result=result)
+
+    async def _worker(self) -> None:
+        while True:
+            job_id = await self._queue.get()
+            try:
+                job = await self.store.get(job_id)
+                if job is None or job["status"] in FINISHED_STATUSES:
+                    continue
+                await self.store.update(job_id, status=JOB_RUNNING)
+                await self._process(job)
+            finally:
+                self._queue.task_done()
+
+    async def _shared_worker(self) -> None:
+        """Reservar trabajos del almacén compartido; sin trabajo, esperar poll_interval"""
+        while True:
+            try:
+                job = await self.store.claim()
+                if job is not None:
+                    await self._process(job)
+                    continue
+            except Exception as e:
+                print(f"Error en el worker de trabajos: {e}")
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+
+
+_queue: Optional[JobQueue] = None
+
+
+def get_job_queue() -> JobQueue:
+    """Obtener la cola compartida del proceso"""
+    global _queue
+    if _queue is None:
+        if settings.JOB_STORE_BACKEND == "supabase":
+            store = SupabaseJobStore(get_repository(), settings.JOB_LEASE_SECONDS, settings.JOB_MAX_ATTEMPTS)
+        elif settings.JOB_STORE_SQLITE_PATH:
+            store = SQLiteJobStore(settings.JOB_STORE_SQLITE_PATH)
+        else:
+            store = InMemoryJobStore(settings.JOB_STORE_MAX_JOBS)
+        _queue = JobQueue(
+            store,
+            settings.JOB_WORKERS,
+            settings.JOB_QUEUE_MAX_SIZE,
+            enabled=settings.JOBS_ENABLED,
+            poll_interval=settings.JOB_POLL_INTERVAL,
+        )
+    return _queue
@@ -0,0 +1,184 @@
+"""
+🧮 MOTOR DE ANÁLISIS LOCAL
+=========================
+
+Análisis extractivo sin LLM, solo CPU, con la misma forma de datos que
+devuelve Gemini ({"summary", "keywords", "sentiment"}):
+
+    - Resumen: las oraciones con mayor puntuación TF-IDF (cada oración es
+      un documento), en su orden original.
+    - Palabras clave: términos con mayor peso TF-IDF acumulado.
+    - Sentimiento: léxico de palabras positivas/negativas en español e
+      inglés, con inversión tras negaciones.
+
+Se usa como modo degradado cuando Gemini falla o responde algo que no se
+puede interpretar, y como modo "fast" opcional.
+
+numpy se importa en la primera llamada (normalmente en el pool de
+procesos), no al importar el módulo, para no alargar el arranque en frío.
+"""
+
+import re
+from typing import TYPE_CHECKING, Dict, List
+
+if TYPE_CHECKING:
+    import numpy as np
+
+# Nombre con el que se identifica este motor (clave de caché, cabeceras)
+LOCAL_ENGINE = "local"
+
+MAX_SUMMARY_WORDS = 200
+MAX_KEYWORDS = 8
+
+_WORD_RE = re.compile(r"[^\W\d_]+", re.UNICODE)
+_SENTENCE_RE = re.compile(r"(?<=[.!?¡¿…])\s+|\n{2,}")
+
+STOPWORDS = frozenset("""
+a al algo algunas algunos ante antes como con contra cual cuando de del desde donde durante e el
+ella ellas ellos en entre era eran es esa esas ese eso esos esta estaba estado estan estar estas
+este esto estos fue fueron ha hace hacia han hasta hay la las le les lo los mas me mi mis mucho
+muy más nada ni no nos nosotros o otra otras otro otros para pero poco por porque que quien se
+ser si sido sin sobre su sus también tambien te tiene tienen todo todos tu tus un una uno unos
+y ya yo él ésta éste qué cómo cuándo dónde sí son sea puede pueden hacer cada según
+the of and to in is are was were be been being it its this that these those for on with as by
+at from or an not but have has had do does did will would can could should may might must there
+their they them he she his her we our you your i me my so if than then also into about over
+such which who whom what when where why how all any each more most other some no nor only own
+same too very just
+""".split())
+
+POSITIVE_WORDS = frozenset("""
+bueno buena buenos buenas excelente excelentes genial feliz felices alegre alegría mejor mejores
+éxito exitoso exitosa positivo positiva positivos favorable beneficio beneficios ventaja ventajas
+encanta encantó gusta agradable maravilloso maravillosa increíble fantástico fantástica perfecto
+perfecta eficiente eficaz satisfecho satisfecha satisfacción logro logros crecimiento mejora
+mejoras avance avances oportunidad oportunidades seguro segura fácil útil recomendable calidad
+amor esperanza optimista ganar ganancia ganancias fuerte innovador innovadora
+good great excellent amazing awesome happy glad joy best better success successful positive
+benefit benefits advantage love loved like liked wonderful fantastic perfect efficient effective
+satisfied satisfaction achievement growth improve improved improvement progress opportunity
+easy useful recommend quality hope optimistic win gain strong innovative pleasant nice
+""".split())
+
+NEGATIVE_WORDS = frozenset("""
+malo mala malos malas terrible terribles horrible triste tristeza peor peores fracaso fracasó
+negativo negativa negativos problema problemas error errores falla fallas fallo crisis riesgo
+riesgos pérdida pérdidas difícil difíciles odio odia odio preocupación preocupante miedo
+deficiente lento lenta caro cara daño daños peligro peligroso peligrosa conflicto conflictos
+dolor enojo molesto molesta inútil decepción decepcionante pobre débil caída disminución
+insatisfecho insatisfecha queja quejas grave violencia
+bad terrible horrible awful sad worse worst failure failed fail negative problem problems error
+errors crisis risk risks loss losses difficult hate hated worry worried fear poor slow expensive
+damage danger dangerous conflict pain angry annoying useless disappointing disappointment weak
+decline decrease complaint complaints serious violence broken
+""".split())
+
+NEGATIONS = frozenset("no nunca jamás tampoco ni sin not never no nor without".split())
+
+
+def _tokens(text: str) -> List[str]:
+    return [token.lower() for token in _WORD_RE.findall(text)]
+
+
+def split_sentences(text: str) -> List[str]:
+    """Dividir el texto en oraciones"""
+    return [sentence.strip() for sentence in _SENTENCE_RE.split(text) if sentence and sentence.strip()]
+
+
+def _tfidf(sentences: List[List[str]]):
+    """Matriz TF-IDF (oraciones x vocabulario) y el vocabulario"""
+    import numpy as np
+
+    vocabulary: Dict[str, int] = {}
+    for tokens in sentences:
+        for token in tokens:
+            if token not in STOPWORDS and len(token) > 2:
+                vocabulary.setdefault(token, len(vocabulary))
+
+    counts = np.zeros((len(sentences), max(len(vocabulary), 1)), dtype=np.float64)
+    for row, tokens in enumerate(sentences):
+        for token in tokens:
+            column = vocabulary.get(token)
+            if column is not None:
+                counts[row, column] += 1.0
+
+    document_frequency = np.count_nonzero(counts, axis=0)
+    idf = np.log((1.0 + len(sentences)) / (1.0 + document_frequency)) + 1.0
+    lengths = counts.sum(axis=1, keepdims=True)
+    tf = np.divide(counts, lengths, out=np.zeros_like(counts), where=lengths > 0)
+    return tf * idf, vocabulary
+
+
+def extract_summary(sentences: List[str], weights: "np.ndarray") -> str:
+    """Elegir las oraciones con más peso hasta MAX_SUMMARY_WORDS palabras"""
+    import numpy as np
+
+    if not sentences:
+        return ""
+    target = max(1, min(5, round(len(sentences) * 0.3)))
+    scores = weights.sum(axis=1)
+    chosen: List[int] = []
+    words = 0
+    for index in np.argsort(-scores, kind="stable"):
+        sentence_words = len(sentences[index].split())
+        if chosen and words + sentence_words > MAX_SUMMARY_WORDS:
+            continue
+        chosen.append(int(index))
+        words += sentence_words
+        if len(chosen) >= target:
+            break
+    summary = " ".join(sentences[index] for index in sorted(chosen))
+    return " ".join(summary.split()[:MAX_SUMMARY_WORDS])
+
+
+def extract_keywords(weights: "np.ndarray", vocabulary: Dict[str, int], limit: int = MAX_KEYWORDS) -> List[str]:
+    """Términos con mayor peso TF-IDF acumulado"""
+    import numpy as np
+
+    if not vocabulary:
+        return []
+    terms = list(vocabulary)
+    scores = weights.sum(axis=0)
+    return [terms[index] for index in np.argsort(-scores, kind="stable")[:limit]]
+
+
+def score_sentiment(tokens: List[str]) -> Dict[str, object]:
+    """Sentimiento por léxico, invirtiendo la polaridad tras una negación"""
+    positive = negative = 0
+    negate_until = -1
+    for index, token in enumerate(tokens):
+        if token in NEGATIONS:
+            negate_until = index + 3
+            continue
+        polarity = 1 if token in POSITIVE_WORDS else -1 if token in NEGATIVE_WORDS else 0
+        if polarity and index <= negate_until:
+            polarity = -polarity
+        if polarity > 0:
+            positive += 1
+        elif polarity < 0:
+            negative += 1
+
+    hits = positive + negative
+    if hits == 0:
+        return {"label": "neutral", "confidence": 0.6}
+    balance = (positive - negative) / hits
+    # Más palabras con polaridad = más evidencia
+    coverage = min(1.0, hits / 5.0)
+    if abs(balance) < 0.2:
+        return {"label": "neutral", "confidence": round(0.5 + 0.3 * (1 - abs(balance)) * coverage, 2)}
+    label = "positive" if balance > 0 else "negative"
+    return {"label": label, "confidence": round(min(0.95, 0.5 + 0.45 * abs(balance) * coverage), 2)}
+
+
+def analyze_locally(text: str) -> dict:
+    """Analizar el texto sin LLM, con la misma forma que la respuesta de Gemini"""
+    sentences = split_sentences(text) or [text]
+    tokenized = [_tokens(sentence) for sentence in sentences]
+    weights, vocabulary = _tfidf(tokenized)
+    keywords = extract_keywords(weights, vocabulary) or _tokens(text)[:3] or ["texto"]
+    return {
+        "summary": extract_summary(sentences, weights) or text[:500],
+        "keywords": keywords,
+        "sentiment": score_sentiment([token for tokens in tokenized for token in tokens]),
+        "engine": LOCAL_ENGINE,
+    }
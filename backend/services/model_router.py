@@ -0,0 +1,163 @@
+"""
+🧭 ROUTER DE MODELOS
+===================
+
+Elige el modelo de Gemini de cada llamada en lugar de usar uno fijo:
+
+    - Calidad pedida: "economy", "standard" (por defecto) o "high".
+    - Tamaño de la entrada: en calidad standard, las entradas de hasta
+      MODEL_ROUTER_SHORT_CHARS caracteres van al modelo económico (más
+      barato y rápido); el resto al estándar.
+    - Latencia observada: si el p95 del modelo elegido alcanza
+      MODEL_LATENCY_SLO (los timeouts y fallos transitorios cuentan como
+      llamadas lentas), el secundario (MODEL_FALLBACK) pasa delante.
+      Cada MODEL_ROUTER_PROBE_EVERY peticiones se vuelve a probar el
+      relegado para detectar que se recuperó.
+
+Con secundario, el primer intento no se reintenta y usa el SLO como
+timeout: si el principal tarda o falla de forma transitoria, la llamada
+pasa al secundario. Un modelo que no existe (404, p. ej. retirado o mal
+configurado) también pasa al secundario y desde entonces se intenta el
+último. La saturación y el circuito abierto no cambian de modelo (afectan
+a todo Gemini).
+"""
+
+import asyncio
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+from config import settings
+from services.gemini import GeminiTimeoutError
+from services.resilience import LatencyTracker, is_retryable
+
+ECONOMY = "economy"
+STANDARD = "standard"
+HIGH = "high"
+
+# Mínimo de muestras antes de comparar el p95 de un modelo con el SLO
+MIN_LATENCY_SAMPLES = 10
+
+# Código con el que Gemini responde a un modelo inexistente o retirado
+MODEL_NOT_FOUND = 404
+
+
+def is_unknown_model(error: Exception) -> bool:
+    """True si el error indica que el modelo no existe"""
+    code = getattr(error, "code", None)
+    return getattr(code, "value", code) == MODEL_NOT_FOUND
+
+
+class ModelRouter:
+    """Selección de modelo por calidad, tamaño y latencia, con failover"""
+
+    def __init__(
+        self,
+        tiers: Dict[str, str],
+        fallback: str,
+        short_chars: int,
+        latency_slo: float,
+        probe_every: int,
+    ):
+        self.tiers = tiers
+        self.fallback = fallback
+        self.short_chars = short_chars
+        self.latency_slo = latency_slo
+        self.probe_every = max(1, probe_every)
+        self._latency: Dict[str, LatencyTracker] = {}
+        self._demoted_calls: Dict[str, int] = {}
+        # Modelos que respondieron 404: se intentan después de los demás
+        self._unknown: Set[str] = set()
+
+    def tier_for(self, text_length: int, quality: str = STANDARD) -> str:
+        """Nivel de modelo según la calidad pedida y el tamaño de la entrada"""
+        if quality == HIGH:
+            return HIGH
+        if quality == ECONOMY or text_length <= self.short_chars:
+            return ECONOMY
+        return STANDARD
+
+    def _tracker(self, model: str) -> LatencyTracker:
+        return self._latency.setdefault(model, LatencyTracker())
+
+    def p95(self, model: str) -> Optional[float]:
+        tracker = self._tracker(model)
+        return tracker.percentile(95) if len(tracker) >= MIN_LATENCY_SAMPLES else None
+
+    def is_slow(self, model: str) -> bool:
+        p95 = self.p95(model)
+        return p95 is not None and p95 >= self.latency_slo
+
+    def candidates(self, text_length: int, quality: str = STANDARD) -> List[str]:
+        """Modelos a intentar en orden: el del nivel y, si existe, el secundario"""
+        primary = self.tiers[self.tier_for(text_length, quality)]
+        if not self.fallback or self.fallback == primary:
+            return [primary]
+        if primary in self._unknown and self.fallback not in self._unknown:
+            return [self.fallback, primary]
+        if self.is_slow(primary) and not self.is_slow(self.fallback):
+            # Relegado por lento; de vez en cuando se prueba igualmente
+            calls = self._demoted_calls.get(primary, 0) + 1
+            self._demoted_calls[primary] = calls
+            if calls % self.probe_every:
+                return [self.fallback, primary]
+        return [primary, self.fallback]
+
+    def record(self, model: str, seconds: float) -> None:
+        self._tracker(model).record(seconds)
+
+    async def call(
+        self,
+        text_length: int,
+        quality: str,
+        call: Callable[[str, Optional[float], Optional[int]], Awaitable[Any]],
+    ) -> Tuple[Any, str]:
+        """
+        Ejecutar call(modelo, timeout, max_retries) con el modelo elegido y
+        pasar al siguiente si es lento, falla de forma transitoria o no
+        existe. Devuelve el resultado y el modelo que respondió.
+        """
+        models = self.candidates(text_length, quality)
+        for position, model in enumerate(models):
+            last = position == len(models) - 1
+            started = time.monotonic()
+            try:
+                result = await call(model, None if last else self.latency_slo, None if last else 0)
+            except Exception as e:
+                if is_unknown_model(e):
+                    self._unknown.add(model)
+                    if last:
+                        raise
+                    print(f"Modelo {model} no existe o fue retirado, usando {models[position + 1]}: {e}")
+                    continue
+                transient = isinstance(e, (GeminiTimeoutError, asyncio.TimeoutError)) or is_retryable(e)
+                if transient:
+                    # Un timeout o un fallo transitorio cuenta como una llamada al menos tan lenta como el SLO
+                    self.record(model, max(self.latency_slo, time.monotonic() - started))
+                if last or not transient:
+                    raise
+                print(f"Modelo {model} lento o no disponible, usando {models[position + 1]}: {e}")
+                continue
+            self._unknown.discard(model)
+            self.record(model, time.monotonic() - started)
+            return result, model
+
+
+_router: Optional[ModelRouter] = None
+
+
+def get_model_router() -> ModelRouter:
+    """Obtener el router compartido del proceso"""
+    global _router
+    if _router is None:
+        _router = ModelRouter(
+            tiers={
+                ECONOMY: settings.MODEL_ECONOMY,
+                STANDARD: settings.MODEL_STANDARD,
+                HIGH: settings.MODEL_HIGH,
+            },
+            fallback=settings.MODEL_FALLBACK,
+            short_chars=settings.MODEL_ROUTER_SHORT_CHARS,
+            latency_slo=settings.MODEL_LATENCY_SLO,
+            probe_every=settings.MODEL_ROUTER_PROBE_EVERY,
+        )
+    return _router
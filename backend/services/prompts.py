@@ -0,0 +1,305 @@
+"""
+📝 REGISTRO DE PROMPTS VERSIONADOS
+=================================
+
+Todas las plantillas de prompt del análisis, con nombre y versión:
+
+    analysis        análisis completo (resumen, palabras clave, sentimiento)
+    analysis_short  textos cortos: el texto ya es su propio resumen, solo
+                    se piden palabras clave y sentimiento
+    batch           varios textos en una sola llamada
+    stream          resumen en texto plano + JSON tras un marcador
+    reduce          fusión de resúmenes parciales (documentos largos)
+
+La versión activa de cada plantilla se elige con PROMPT_VERSIONS
+("analysis=v2,batch=v2") y se puede probar una nueva con PROMPT_CANARY
+("analysis=v3:10" = 10 % de los textos). El reparto es determinista por
+texto, así que la clave de caché no cambia entre peticiones.
+
+El uso de tokens y la latencia se acumulan por (plantilla, versión) para
+comparar coste y rendimiento entre versiones.
+"""
+
+import re
+import time
+import zlib
+from typing import Any, Dict, List, Optional, Tuple
+
+from config import settings
+from services.chunking import estimate_tokens
+
+_WHITESPACE_RE = re.compile(r"[ \t\r\f\v]+")
+_LINE_EDGES_RE = re.compile(r" ?\n ?")
+_BLANK_LINES_RE = re.compile(r"\n{3,}")
+
+
+class PromptTemplate:
+    """Plantilla de prompt (str.format) con nombre y versión"""
+
+    def __init__(self, name: str, version: str, template: str):
+        self.name = name
+        self.version = version
+        self.template = template
+
+    @property
+    def key(self) -> str:
+        """Identificador estable, p. ej. "analysis:v2" (forma parte de la clave de caché)"""
+        return f"{self.name}:{self.version}"
+
+    def render(self, **values: Any) -> str:
+        return self.template.format(**values)
+
+
+PROMPTS: Dict[str, Dict[str, PromptTemplate]] = {}
+
+
+def register_prompt(name: str, version: str, template: str) -> PromptTemplate:
+    """Registrar una versión de una plantilla"""
+    prompt = PromptTemplate(name, version, template)
+    PROMPTS.setdefault(name, {})[version] = prompt
+    return prompt
+
+
+# =====================================================
+# PLANTILLAS
+# =====================================================
+
+register_prompt("analysis", "v1", """
+        Analiza el siguiente texto y proporciona:
+        1. Un resumen conciso (máximo 200 palabras)
+        2. 5-10 palabras clave principales
+        3. Análisis de sentimiento (positive, negative, neutral) con confianza (0-1)
+
+        Texto a analizar:
+        {text}
+
+        Responde en formato JSON:
+        {{
+            "summary": "resumen aquí",
+            "keywords": ["palabra1", "palabra2", "palabra3"],
+            "sentiment": {{
+                "label": "positive/negative/neutral",
+                "confidence": 0.85
+            }}
+        }}
+        """)
+
+register_prompt("analysis", "v2", (
+    'Analiza el texto. Responde solo JSON: {{"summary": resumen de máximo 200 palabras, '
+    '"keywords": 5-10 palabras clave, "sentiment": {{"label": "positive"|"negative"|"neutral", '
+    '"confidence": 0-1}}}}\n\nTexto:\n{text}'
+))
+
+register_prompt("analysis_short", "v2", (
+    'Texto breve. Responde solo JSON: {{"keywords": 3-5 palabras clave, '
+    '"sentiment": {{"label": "positive"|"negative"|"neutral", "confidence": 0-1}}}}\n\nTexto:\n{text}'
+))
+
+register_prompt("batch", "v1", """
+        Analiza cada uno de los siguientes textos por separado y proporciona para cada uno:
+        1. Un resumen conciso (máximo 200 palabras)
+        2. 5-10 palabras clave principales
+        3. Análisis de sentimiento (positive, negative, neutral) con confianza (0-1)
+
+        {texts}
+
+        Responde solo con un arreglo JSON con un objeto por texto, usando el número de [TEXTO n] como "index":
+        [
+            {{
+                "index": 0,
+                "summary": "resumen aquí",
+                "keywords": ["palabra1", "palabra2", "palabra3"],
+                "sentiment": {{
+                    "label": "positive/negative/neutral",
+                    "confidence": 0.85
+                }}
+            }}
+        ]
+        """)
+
+register_prompt("batch", "v2", (
+    'Analiza cada texto por separado. Responde solo un arreglo JSON, un objeto por texto: '
+    '{{"index": n de [TEXTO n], "summary": resumen de máximo 200 palabras, "keywords": 5-10 palabras clave, '
+    '"sentiment": {{"label": "positive"|"negative"|"neutral", "confidence": 0-1}}}}\n\n{texts}'
+))
+
+register_prompt("stream", "v1", """
+        Analiza el siguiente texto.
+
+        Primero escribe un resumen conciso (máximo 200 palabras) en texto plano, sin encabezados.
+        Después escribe una línea que contenga solo {marker} y a continuación un JSON con:
+        1. 5-10 palabras clave principales
+        2. Análisis de sentimiento (positive, negative, neutral) con confianza (0-1)
+
+        Texto a analizar:
+        {text}
+
+        Formato del JSON:
+        {{
+            "keywords": ["palabra1", "palabra2", "palabra3"],
+            "sentiment": {{
+                "label": "positive/negative/neutral",
+                "confidence": 0.85
+            }}
+        }}
+        """)
+
+register_prompt("stream", "v2", (
+    'Escribe un resumen del texto (máximo 200 palabras, texto plano, sin encabezados). '
+    'Luego una línea con solo {marker} y después JSON: {{"keywords": 5-10 palabras clave, '
+    '"sentiment": {{"label": "positive"|"negative"|"neutral", "confidence": 0-1}}}}\n\nTexto:\n{text}'
+))
+
+register_prompt("reduce", "v1", """
+        Los siguientes son resúmenes de partes consecutivas de un mismo documento.
+        Escríbelos como un único resumen conciso y coherente del documento completo
+        (máximo 300 palabras). Responde solo con el resumen en texto plano.
+
+        {parts}
+        """)
+
+
+# =====================================================
+# SELECCIÓN DE VERSIÓN
+# =====================================================
+
+def _parse_mapping(raw: str) -> Dict[str, str]:
+    """'analysis=v2,batch=v1' -> {"analysis": "v2", "batch": "v1"}"""
+    mapping = {}
+    for item in raw.split(","):
+        name, _, value = item.partition("=")
+        if name.strip() and value.strip():
+            mapping[name.strip()] = value.strip()
+    return mapping
+
+
+def _latest_version(name: str) -> str:
+    return max(PROMPTS[name], key=lambda version: int(version.lstrip("v") or 0))
+
+
+def get_prompt(name: str, routing_key: str = "") -> PromptTemplate:
+    """
+    Plantilla activa para `name`. Con PROMPT_CANARY, un porcentaje de los
+    routing_key (normalmente el texto) recibe la versión candidata.
+    """
+    versions = PROMPTS[name]
+    canary = _parse_mapping(settings.PROMPT_CANARY).get(name)
+    if canary and routing_key:
+        version, _, percent = canary.partition(":")
+        if version in versions and zlib.crc32(routing_key.encode("utf-8")) % 100 < float(percent or 0):
+            return versions[version]
+    version = _parse_mapping(settings.PROMPT_VERSIONS).get(name)
+    if version not in versions:
+        version = _latest_version(name)
+    return versions[version]
+
+
+# =====================================================
+# TAMAÑO DEL PROMPT
+# =====================================================
+
+def compact_text(text: str) -> str:
+    """Colapsar espacios repetidos y líneas en blanco; no cambia el contenido"""
+    text = _LINE_EDGES_RE.sub("\n", _WHITESPACE_RE.sub(" ", text.strip()))
+    return _BLANK_LINES_RE.sub("\n\n", text)
+
+
+def count_tokens(text: str) -> int:
+    """Tokens estimados de un prompt (aproximación de 4 caracteres por token)"""
+    return estimate_tokens(text)
+
+
+def is_short_text(text: str) -> bool:
+    """True si el texto es tan corto que sirve como su propio resumen"""
+    return len(text.split()) <= settings.PROMPT_SHORT_TEXT_MAX_WORDS
+
+
+def analysis_prompt_for(text: str) -> PromptTemplate:
+    """Plantilla para analizar `text`: la corta si no hace falta resumir"""
+    return get_prompt("analysis_short" if is_short_text(text) else "analysis", text)
+
+
+def format_batch_texts(items: List[Tuple[int, str]]) -> str:
+    return "\n\n".join(f"[TEXTO {index}]\n{compact_text(text)}" for index, text in items)
+
+
+def format_summaries(summaries: List[str]) -> str:
+    return "\n\n".join(f"[PARTE {index + 1}]\n{summary}" for index, summary in enumerate(summaries))
+
+
+# =====================================================
+# USO POR VERSIÓN
+# =====================================================
+
+class PromptUsageStats:
+    """Tokens, latencia y errores acumulados por plantilla y versión"""
+
+    def __init__(self):
+        self._stats: Dict[str, Dict[str, float]] = {}
+
+    def record(
+        self,
+        prompt: PromptTemplate,
+        prompt_tokens: int,
+        output_tokens: int,
+        latency: float,
+        success: bool = True,
+    ) -> None:
+        stats = self._stats.setdefault(prompt.key, {
+            "calls": 0, "errors": 0, "prompt_tokens": 0, "output_tokens": 0, "latency_seconds": 0.0,
+        })
+        stats["calls"] += 1
+        stats["errors"] += 0 if success else 1
+        stats["prompt_tokens"] += prompt_tokens
+        stats["output_tokens"] += output_tokens
+        stats["latency_seconds"] += latency
+
+    def snapshot(self) -> List[Dict[str, Any]]:
+        """Totales y promedios por versión"""
+        rows = []
+        for key, stats in sorted(self._stats.items()):
+            name, _, version = key.partition(":")
+            calls = stats["calls"] or 1
+            rows.append({
+                "prompt": name,
+                "version": version,
+                "calls": int(stats["calls"]),
+                "errors": int(stats["errors"]),
+                "prompt_tokens": int(stats["prompt_tokens"]),
+                "output_tokens": int(stats["output_tokens"]),
+                "avg_prompt_tokens": round(stats["prompt_tokens"] / calls, 1),
+                "avg_output_tokens": round(stats["output_tokens"] / calls, 1),
+                "avg_latency_ms": round(stats["latency_seconds"] / calls * 1000, 1),
+            })
+        return rows
+
+
+_usage: Optional[PromptUsageStats] = None
+
+
+def get_prompt_usage() -> PromptUsageStats:
+    """Obtener el acumulador compartido del proceso"""
+    global _usage
+    if _usage is None:
+        _usage = PromptUsageStats()
+    return _usage
+
+
+class PromptTimer:
+    """Medir una llamada y registrar su uso al terminar"""
+
+    def __init__(self, prompt: PromptTemplate, rendered: str):
+        self.prompt = prompt
+        self.prompt_tokens = count_tokens(rendered)
+        self.started = time.monotonic()
+
+    def finish(self, output: str = "", usage: Optional[Dict[str, int]] = None, success: bool = True) -> None:
+        usage = usage or {}
+        output_tokens = usage.get("output_tokens") or (count_tokens(output) if output else 0)
+        get_prompt_usage().record(
+            self.prompt,
+            usage.get("prompt_tokens") or self.prompt_tokens,
+            output_tokens,
+            time.monotonic() - self.started,
+            success,
+        )
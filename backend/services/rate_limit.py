@@ -0,0 +1,164 @@
+"""
+🚦 LÍMITE DE USO POR TOKENS
+==========================
+
+Token buckets que cobran por tokens estimados del prompt, no por petición:
+un texto de 10.000 palabras gasta más presupuesto que uno de 50.
+
+Cada petición se cobra a la vez en dos buckets:
+    - el del usuario (RATE_LIMIT_USER_*), para que un cliente ruidoso solo
+      agote su propio presupuesto;
+    - el global (RATE_LIMIT_GLOBAL_*), que protege la cuota de Gemini.
+Si cualquiera de los dos no alcanza, no se cobra nada y se devuelve cuánto
+esperar.
+
+Backends:
+    - "memory" (por defecto): buckets en el proceso.
+    - "supabase": buckets compartidos entre instancias (p. ej. varias
+      funciones serverless) mediante la función rate_limit_consume de
+      database.sql.
+"""
+
+import math
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from config import settings
+from services.supabase import get_repository
+
+GLOBAL_BUCKET = "global"
+
+
+class BucketSpec:
+    """Capacidad (ráfaga máxima) y recarga en tokens por segundo"""
+
+    def __init__(self, capacity: float, refill_rate: float):
+        self.capacity = capacity
+        self.refill_rate = refill_rate
+
+
+class RateLimitDecision:
+    """Resultado de intentar cobrar una petición"""
+
+    def __init__(self, allowed: bool, limit: int, remaining: int, retry_after: float, reset_after: float):
+        self.allowed = allowed
+        self.limit = limit
+        self.remaining = remaining
+        self.retry_after = retry_after
+        self.reset_after = reset_after
+
+    def headers(self) -> Dict[str, str]:
+        """Cabeceras de presupuesto del usuario (y Retry-After si se rechazó)"""
+        headers = {
+            "X-RateLimit-Limit": str(self.limit),
+            "X-RateLimit-Remaining": str(self.remaining),
+            "X-RateLimit-Reset": str(math.ceil(self.reset_after)),
+        }
+        if not self.allowed:
+            headers["Retry-After"] = str(max(1, math.ceil(self.retry_after)))
+        return headers
+
+
+class InMemoryBuckets:
+    """Buckets en el proceso; se descartan los usuarios menos recientes"""
+
+    def __init__(self, max_buckets: int):
+        self.max_buckets = max_buckets
+        # clave -> (tokens disponibles, instante de la última recarga)
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+
+    async def consume(self, keys: List[str], specs: List[BucketSpec], cost: float) -> Tuple[bool, List[float]]:
+        """
+        Cobrar `cost` en todos los buckets o en ninguno. Devuelve si se
+        cobró y los tokens que quedan en cada bucket. No hay awaits
+        intermedios, así que es atómico dentro del event loop.
+        """
+        now = time.monotonic()
+        levels = []
+        for key, spec in zip(keys, specs):
+            tokens, updated_at = self._buckets.get(key, (spec.capacity, now))
+            levels.append(min(spec.capacity, tokens + (now - updated_at) * spec.refill_rate))
+        allowed = all(level >= cost for level in levels)
+        if allowed:
+            levels = [level - cost for level in levels]
+        for key, level in zip(keys, levels):
+            self._buckets[key] = (level, now)
+            self._buckets.move_to_end(key)
+        while len(self._buckets) > self.max_buckets:
+            self._buckets.popitem(last=False)
+        return allowed, levels
+
+
+class SupabaseBuckets:
+    """Buckets compartidos en Postgres (función rate_limit_consume)"""
+
+    def __init__(self, repository):
+        self.repository = repository
+
+    async def consume(self, keys: List[str], specs: List[BucketSpec], cost: float) -> Tuple[bool, List[float]]:
+        result = await self.repository.consume_rate_limit(
+            keys,
+            [spec.capacity for spec in specs],
+            [spec.refill_rate for spec in specs],
+            cost,
+        )
+        return result["allowed"], result["levels"]
+
+
+class RateLimiter:
+    """Limitador por usuario y global, cobrando tokens estimados"""
+
+    def __init__(self, buckets, user_spec: BucketSpec, global_spec: BucketSpec):
+        self.buckets = buckets
+        self.user_spec = user_spec
+        self.global_spec = global_spec
+
+    async def acquire(self, user_id: str, tokens: int) -> RateLimitDecision:
+        """Cobrar `tokens` al usuario y al bucket global"""
+        specs = [self.user_spec, self.global_spec]
+        # Una petición mayor que la ráfaga se cobra como la ráfaga completa;
+        # si no, nunca podría pasar
+        cost = float(min(tokens, self.user_spec.capacity, self.global_spec.capacity))
+        allowed, levels = await self.buckets.consume([f"user:{user_id}", GLOBAL_BUCKET], specs, cost)
+
+        retry_after = 0.0
+        if not allowed:
+            retry_after = max(
+                (cost - level) / spec.refill_rate
+                for level, spec in zip(levels, specs)
+                if level < cost
+            )
+        user_level = max(0.0, levels[0])
+        return RateLimitDecision(
+            allowed=allowed,
+            limit=int(self.user_spec.capacity),
+            remaining=int(user_level),
+            retry_after=retry_after,
+            reset_after=(self.user_spec.capacity - user_level) / self.user_spec.refill_rate,
+        )
+
+
+_limiter: Optional[RateLimiter] = None
+
+
+def get_rate_limiter() -> RateLimiter:
+    """Obtener el limitador compartido del proceso"""
+    global _limiter
+    if _limiter is None:
+        if settings.RATE_LIMIT_BACKEND == "supabase":
+            buckets = SupabaseBuckets(get_repository())
+        else:
+            buckets = InMemoryBuckets(settings.RATE_LIMIT_MAX_USERS)
+        _limiter = RateLimiter(
+            buckets,
+            user_spec=BucketSpec(
+                capacity=settings.RATE_LIMIT_USER_BURST,
+                refill_rate=settings.RATE_LIMIT_USER_TOKENS_PER_MINUTE / 60.0,
+            ),
+            global_spec=BucketSpec(
+                capacity=settings.RATE_LIMIT_GLOBAL_BURST,
+                refill_rate=settings.RATE_LIMIT_GLOBAL_TOKENS_PER_MINUTE / 60.0,
+            ),
+        )
+    return _limiter
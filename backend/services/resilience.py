@@ -0,0 +1,132 @@
+"""
+🛡️ RESILIENCIA PARA LLAMADAS EXTERNAS
+====================================
+
+Piezas que usa el gateway de Gemini para no amplificar los incidentes del
+proveedor:
+
+    - Reintentos con backoff exponencial y jitter completo, solo para
+      errores transitorios (429, 500, 503, 504 y timeouts).
+    - LatencyTracker: percentiles de las últimas llamadas, para lanzar una
+      petición de cobertura (hedging) cuando la primera tarda más que el p95.
+    - CircuitBreaker: si la tasa de error de la ventana supera el umbral se
+      abre y las llamadas fallan de inmediato (los routers usan el motor
+      local) hasta que una llamada de prueba sale bien.
+"""
+
+import asyncio
+import random
+import time
+from collections import deque
+from typing import Optional
+
+# Códigos HTTP/gRPC que indican un fallo transitorio del proveedor
+RETRYABLE_STATUS_CODES = frozenset({408, 429, 500, 502, 503, 504})
+
+
+class CircuitOpenError(Exception):
+    """El circuito está abierto: el proveedor se considera caído"""
+
+
+def is_retryable(error: Exception) -> bool:
+    """
+    True si el error es transitorio. Las excepciones de google.api_core
+    exponen el código HTTP en `code`; así no hace falta importarlas aquí.
+    """
+    if isinstance(error, asyncio.TimeoutError):
+        return True
+    code = getattr(error, "code", None)
+    code = getattr(code, "value", code)
+    return isinstance(code, int) and code in RETRYABLE_STATUS_CODES
+
+
+def backoff_delay(attempt: int, base: float, cap: float) -> float:
+    """Espera antes del reintento `attempt` (0, 1, ...): jitter completo sobre base * 2^attempt"""
+    return random.uniform(0, min(cap, base * (2 ** attempt)))
+
+
+class LatencyTracker:
+    """Latencias de las últimas llamadas exitosas"""
+
+    def __init__(self, window: int = 200):
+        self._samples: "deque[float]" = deque(maxlen=window)
+
+    def __len__(self) -> int:
+        return len(self._samples)
+
+    def record(self, seconds: float) -> None:
+        self._samples.append(seconds)
+
+    def percentile(self, percent: float) -> Optional[float]:
+        """Percentil de las muestras o None si no hay ninguna"""
+        if not self._samples:
+            return None
+        ordered = sorted(self._samples)
+        index = min(len(ordered) - 1, int(round(percent / 100 * (len(ordered) - 1))))
+        return ordered[index]
+
+
+class CircuitBreaker:
+    """
+    Cerrado -> abierto cuando, con al menos `min_calls` resultados en la
+    ventana, la tasa de error alcanza `error_rate`. Tras `cooldown` segundos
+    pasa a semiabierto y deja pasar una sola llamada de prueba.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, error_rate: float, min_calls: int, window: int, cooldown: float):
+        self.error_rate = error_rate
+        self.min_calls = min_calls
+        self.cooldown = cooldown
+        self._outcomes: "deque[bool]" = deque(maxlen=window)
+        self._opened_at = 0.0
+        self._state = self.CLOSED
+        self._probe_in_flight = False
+
+    @property
+    def state(self) -> str:
+        if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.cooldown:
+            return self.HALF_OPEN
+        return self._state
+
+    def before_call(self) -> None:
+        """Lanzar CircuitOpenError si la llamada no debe hacerse"""
+        state = self.state
+        if state == self.OPEN:
+            raise CircuitOpenError("Gemini no disponible temporalmente (circuito abierto)")
+        if state == self.HALF_OPEN:
+            if self._probe_in_flight:
+                raise CircuitOpenError("Gemini no disponible temporalmente (probando recuperación)")
+            self._state = self.HALF_OPEN
+            self._probe_in_flight = True
+
+    def record_success(self) -> None:
+        if self._state == self.HALF_OPEN:
+            self._state = self.CLOSED
+            self._probe_in_flight = False
+            self._outcomes.clear()
+        self._outcomes.append(True)
+
+    def record_failure(self) -> None:
+        if self._state == self.HALF_OPEN:
+            self._open()
+            return
+        self._outcomes.append(False)
+        failures = self._outcomes.count(False)
+        if len(self._outcomes) >= self.min_calls and failures / len(self._outcomes) >= self.error_rate:
+            self._open()
+
+    def record_ignored(self) -> None:
+        """La llamada terminó sin veredicto (p. ej. cancelada): liberar la prueba"""
+        if self._state == self.HALF_OPEN:
+            self._probe_in_flight = False
+            self._state = self.OPEN
+
+    def _open(self) -> None:
+        self._state = self.OPEN
+        self._opened_at = time.monotonic()
+        self._probe_in_flight = False
+        self._outcomes.clear()
@@ -0,0 +1,245 @@
+"""
+🧩 DECODIFICADOR DE RESPUESTAS ESTRUCTURADAS
+===========================================
+
+Convierte la respuesta de Gemini en el dict de análisis
+({"summary", "keywords", "sentiment"}) en una sola pasada:
+
+    1. Se extrae el JSON aunque venga entre ```json ... ``` o con texto
+       alrededor.
+    2. Se parsea con orjson (json estándar si no está instalado).
+    3. Si el JSON está truncado (respuesta cortada por límite de tokens) se
+       repara cerrando la cadena y los corchetes abiertos, o cortando en la
+       última coma válida, en lugar de descartar la respuesta.
+    4. Se valida y normaliza campo por campo; los campos que falten se
+       informan para completarlos sin repetir la llamada.
+
+Los esquemas ANALYSIS_SCHEMA y BATCH_ANALYSIS_SCHEMA se envían a Gemini
+como response_schema cuando el SDK lo soporta (generación restringida).
+"""
+
+import json
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+try:
+    import orjson
+
+    def _loads(raw: str) -> Any:
+        return orjson.loads(raw)
+except ImportError:  # pragma: no cover - orjson es opcional
+    _loads = json.loads
+
+ANALYSIS_FIELDS = ("summary", "keywords", "sentiment")
+SENTIMENT_LABELS = ("positive", "negative", "neutral")
+MAX_KEYWORDS = 10
+
+# Etiquetas que Gemini a veces devuelve en español o abreviadas
+_LABEL_ALIASES = {
+    "positivo": "positive", "positiva": "positive", "pos": "positive",
+    "negativo": "negative", "negativa": "negative", "neg": "negative",
+    "neutro": "neutral", "neutra": "neutral", "neutral": "neutral", "mixed": "neutral", "mixto": "neutral",
+}
+
+_SENTIMENT_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        "label": {"type": "STRING", "enum": list(SENTIMENT_LABELS)},
+        "confidence": {"type": "NUMBER"},
+    },
+    "required": ["label", "confidence"],
+}
+
+ANALYSIS_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        "summary": {"type": "STRING"},
+        "keywords": {"type": "ARRAY", "items": {"type": "STRING"}},
+        "sentiment": _SENTIMENT_SCHEMA,
+    },
+    "required": list(ANALYSIS_FIELDS),
+}
+
+# Textos cortos: el resumen es el propio texto (ver services/prompts.py)
+SHORT_ANALYSIS_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        "keywords": ANALYSIS_SCHEMA["properties"]["keywords"],
+        "sentiment": _SENTIMENT_SCHEMA,
+    },
+    "required": ["keywords", "sentiment"],
+}
+
+BATCH_ANALYSIS_SCHEMA = {
+    "type": "ARRAY",
+    "items": {
+        "type": "OBJECT",
+        "properties": {"index": {"type": "INTEGER"}, **ANALYSIS_SCHEMA["properties"]},
+        "required": ["index", *ANALYSIS_FIELDS],
+    },
+}
+
+_FENCE_RE = re.compile(r"```(?:json|JSON)?\s*(.*?)(?:```|$)", re.S)
+
+# Máximo de puntos de corte que se prueban al reparar un JSON truncado
+MAX_REPAIR_ATTEMPTS = 8
+
+
+class StructuredOutputError(ValueError):
+    """La respuesta no contiene JSON recuperable"""
+
+
+def extract_json(raw: str) -> str:
+    """Quitar cercas de Markdown y texto previo al primer { o ["""
+    fenced = _FENCE_RE.search(raw)
+    text = fenced.group(1) if fenced else raw
+    starts = [position for position in (text.find("{"), text.find("[")) if position >= 0]
+    if not starts:
+        raise StructuredOutputError("La respuesta no contiene JSON")
+    return text[min(starts):].strip()
+
+
+def _repair_candidates(text: str) -> List[str]:
+    """
+    Versiones cerradas de un JSON truncado: primero el texto completo con la
+    cadena y los corchetes cerrados, después cortando en las últimas comas
+    de nivel estructural (descarta el elemento a medias)
+    """
+    closers = {"{": "}", "[": "]"}
+    stack: List[str] = []
+    cut_points: List[Tuple[int, str]] = []
+    in_string = escaped = False
+    for position, char in enumerate(text):
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == "\\":
+                escaped = True
+            elif char == '"':
+                in_string = False
+            continue
+        if char == '"':
+            in_string = True
+        elif char in closers:
+            stack.append(closers[char])
+        elif char in "}]":
+            if stack:
+                stack.pop()
+            if not stack:
+                # JSON completo: ignorar lo que venga después
+                return [text[:position + 1]]
+        elif char == ",":
+            cut_points.append((position, "".join(reversed(stack))))
+
+    tail = text
+    if in_string:
+        tail += "\\" if escaped else ""
+        tail += '"'
+    tail = tail.rstrip().rstrip(",")
+    if tail.endswith(":"):
+        tail += "null"
+    candidates = [tail + "".join(reversed(stack))]
+    for position, closing in reversed(cut_points[-MAX_REPAIR_ATTEMPTS:]):
+        candidates.append(text[:position] + closing)
+    return candidates
+
+
+def decode_json(raw: str) -> Any:
+    """Parsear la respuesta de Gemini, reparando cercas y truncamientos"""
+    text = extract_json(raw)
+    try:
+        return _loads(text)
+    except ValueError:
+        pass
+    for candidate in _repair_candidates(text):
+        try:
+            return _loads(candidate)
+        except ValueError:
+            continue
+    raise StructuredOutputError("JSON irrecuperable en la respuesta de Gemini")
+
+
+def _normalize_keywords(value: Any) -> Optional[List[str]]:
+    if isinstance(value, str):
+        value = value.split(",")
+    if not isinstance(value, list):
+        return None
+    keywords: List[str] = []
+    seen = set()
+    for keyword in value:
+        if not isinstance(keyword, str):
+            continue
+        keyword = keyword.strip()
+        if keyword and keyword.casefold() not in seen:
+            seen.add(keyword.casefold())
+            keywords.append(keyword)
+    return keywords[:MAX_KEYWORDS] or None
+
+
+def _normalize_sentiment(value: Any) -> Optional[Dict[str, Any]]:
+    if isinstance(value, str):
+        value = {"label": value}
+    if not isinstance(value, dict):
+        return None
+    label = str(value.get("label", "")).strip().lower()
+    label = _LABEL_ALIASES.get(label, label)
+    if label not in SENTIMENT_LABELS:
+        return None
+    try:
+        confidence = float(value.get("confidence", 0.5))
+    except (TypeError, ValueError):
+        confidence = 0.5
+    return {"label": label, "confidence": min(1.0, max(0.0, confidence))}
+
+
+def normalize_analysis(data: Any) -> Dict[str, Any]:
+    """
+    Validar un objeto de análisis y devolver solo los campos válidos
+    (puede faltar alguno si la respuesta venía truncada)
+    """
+    if not isinstance(data, dict):
+        return {}
+    result: Dict[str, Any] = {}
+    summary = data.get("summary")
+    if isinstance(summary, str) and summary.strip():
+        result["summary"] = summary.strip()
+    keywords = _normalize_keywords(data.get("keywords"))
+    if keywords:
+        result["keywords"] = keywords
+    sentiment = _normalize_sentiment(data.get("sentiment"))
+    if sentiment:
+        result["sentiment"] = sentiment
+    return result
+
+
+def missing_fields(analysis: Dict[str, Any]) -> List[str]:
+    """Campos del análisis que faltan tras normalizar"""
+    return [field for field in ANALYSIS_FIELDS if field not in analysis]
+
+
+def decode_analysis(raw: str) -> Dict[str, Any]:
+    """Decodificar y normalizar la respuesta de un análisis individual"""
+    try:
+        return normalize_analysis(decode_json(raw))
+    except StructuredOutputError:
+        return {}
+
+
+def decode_batch_analysis(raw: str) -> Dict[int, Dict[str, Any]]:
+    """Decodificar la respuesta de un paquete: {index: análisis normalizado}"""
+    try:
+        parsed = decode_json(raw)
+    except StructuredOutputError:
+        return {}
+    if isinstance(parsed, dict):
+        parsed = parsed.get("results") or parsed.get("items") or [parsed]
+    results: Dict[int, Dict[str, Any]] = {}
+    for item in parsed if isinstance(parsed, list) else []:
+        if not isinstance(item, dict):
+            continue
+        try:
+            index = int(item.get("index"))
+        except (TypeError, ValueError):
+            continue
+        results[index] = normalize_analysis(item)
+    return results
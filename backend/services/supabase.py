@@ -0,0 +1,487 @@
+"""
+🗄️ REPOSITORIO ASÍNCRONO DE SUPABASE
+===================================
+
+Acceso compartido a la API REST (PostgREST) y a Auth (GoTrue) de Supabase
+sobre un único httpx.AsyncClient con keep-alive. El cliente se crea en el
+lifespan de FastAPI y todas las rutas lo reutilizan, así que las consultas
+no bloquean el event loop ni repiten el handshake TLS.
+"""
+
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import httpx
+
+from config import settings
+from services.telemetry import record_upstream
+
+
+class SupabaseError(Exception):
+    """Error devuelto por Supabase"""
+
+    def __init__(self, message: str, status_code: int = 500):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+class SupabaseRepository:
+    """Métodos tipados sobre las tablas y la autenticación de Supabase"""
+
+    def __init__(
+        self,
+        url: str,
+        anon_key: str,
+        service_role_key: str,
+        max_connections: int = 20,
+        timeout: float = 10.0,
+    ):
+        self.url = url.rstrip("/")
+        self.anon_key = anon_key
+        self.service_role_key = service_role_key
+        self._client = httpx.AsyncClient(
+            base_url=self.url,
+            timeout=timeout,
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_connections,
+            ),
+            # Latencia de cada llamada para Server-Timing y /metrics
+            event_hooks={"request": [self._start_timer], "response": [self._record_timing]},
+        )
+
+    async def close(self) -> None:
+        """Cerrar las conexiones del pool"""
+        await self._client.aclose()
+
+    # =====================================================
+    # UTILIDADES
+    # =====================================================
+
+    def _headers(self, key: Optional[str] = None, token: Optional[str] = None, **extra: str) -> Dict[str, str]:
+        key = key or self.service_role_key
+        headers = {
+            "apikey": key,
+            "Authorization": f"Bearer {token or key}",
+        }
+        headers.update(extra)
+        return headers
+
+    @staticmethod
+    def _operation(path: str) -> str:
+        """Tabla, función RPC o endpoint de Auth de una URL (etiqueta de métricas)"""
+        parts = path.strip("/").split("/")
+        if parts[:2] == ["rest", "v1"]:
+            return "/".join(parts[2:4]) if parts[2:3] == ["rpc"] else "/".join(parts[2:3])
+        return "/".join(part for part in parts[:3] if part != "v1")
+
+    @staticmethod
+    async def _start_timer(request: httpx.Request) -> None:
+        request.extensions["started_at"] = time.perf_counter()
+
+    async def _record_timing(self, response: httpx.Response) -> None:
+        request = response.request
+        started = request.extensions.get("started_at")
+        if started is not None:
+            record_upstream(
+                "supabase",
+                self._operation(request.url.path),
+                time.perf_counter() - started,
+                "ok" if response.status_code < 500 else "error",
+            )
+
+    @staticmethod
+    def _raise_for_status(response: httpx.Response) -> None:
+        if response.status_code < 400:
+            return
+        try:
+            body = response.json()
+        except ValueError:
+            body = {}
+        message = (
+            body.get("error_description")
+            or body.get("msg")
+            or body.get("message")
+            or body.get("error")
+            or response.text
+        )
+        raise SupabaseError(str(message), status_code=response.status_code)
+
+    @staticmethod
+    def _parse_count(response: httpx.Response) -> int:
+        # Content-Range: 0-9/123  ó  */0
+        content_range = response.headers.get("content-range", "")
+        total = content_range.rsplit("/", 1)[-1]
+        return int(total) if total.isdigit() else 0
+
+    # =====================================================
+    # ANÁLISIS
+    # =====================================================
+
+    async def insert_analysis(self, data: Dict[str, Any]) -> Dict[str, Any]:
+        """Insertar un análisis y devolver la fila creada"""
+        response = await self._client.post(
+            "/rest/v1/analyses",
+            json=data,
+            headers=self._headers(Prefer="return=representation"),
+        )
+        self._raise_for_status(response)
+        rows = response.json()
+        if not rows:
+            raise SupabaseError("Error guardando análisis")
+        return rows[0]
+
+    async def insert_analyses(self, rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Insertar varios análisis en una sola petición"""
+        response = await self._client.post(
+            "/rest/v1/analyses",
+            json=rows,
+            headers=self._headers(Prefer="return=representation"),
+        )
+        self._raise_for_status(response)
+        return response.json()
+
+    async def upsert_analyses(self, rows: List[Dict[str, Any]]) -> None:
+        """
+        Insertar varios análisis ignorando los id que ya existen, para que
+        reintentar un lote no duplique filas
+        """
+        response = await self._client.post(
+            "/rest/v1/analyses",
+            params={"on_conflict": "id"},
+            json=rows,
+            headers=self._headers(Prefer="resolution=ignore-duplicates,return=minimal"),
+        )
+        self._raise_for_status(response)
+
+    async def page_analyses(
+        self,
+        limit: int,
+        offset: int = 0,
+        after: Optional[Tuple[str, str]] = None,
+        columns: str = "*",
+        user_id: Optional[str] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        Obtener una página de análisis ordenados por (created_at, id)
+        descendente. Con `after` se usa paginación por keyset: solo filas
+        anteriores a ese (created_at, id), sin OFFSET.
+        """
+        params: Dict[str, Any] = {
+            "select": columns,
+            "order": "created_at.desc,id.desc",
+            "limit": limit,
+        }
+        if user_id is not None:
+            params["user_id"] = f"eq.{user_id}"
+        if after is not None:
+            created_at, analysis_id = after
+            params["or"] = (
+                f'(created_at.lt."{created_at}",'
+                f'and(created_at.eq."{created_at}",id.lt."{analysis_id}"))'
+            )
+        elif offset:
+            params["offset"] = offset
+        response = await self._client.get("/rest/v1/analyses", params=params, headers=self._headers())
+        self._raise_for_status(response)
+        return response.json()
+
+    async def get_analysis(
+        self, analysis_id: str, columns: str = "*", user_id: Optional[str] = None
+    ) -> Optional[Dict[str, Any]]:
+        """Obtener un análisis por ID (del usuario, si se indica) o None si no existe"""
+        params = {"select": columns, "id": f"eq.{analysis_id}", "limit": 1}
+        if user_id is not None:
+            params["user_id"] = f"eq.{user_id}"
+        response = await self._client.get("/rest/v1/analyses", params=params, headers=self._headers())
+        self._raise_for_status(response)
+        rows = response.json()
+        return rows[0] if rows else None
+
+    async def count_analyses(self, estimated: bool = False, user_id: Optional[str] = None) -> int:
+        """
+        Contar el total de análisis. Con estimated=True PostgREST usa las
+        estadísticas del planner en vez de recorrer la tabla.
+        """
+        params = {"select": "id"}
+        if user_id is not None:
+            params["user_id"] = f"eq.{user_id}"
+        response = await self._client.head(
+            "/rest/v1/analyses",
+            params=params,
+            headers=self._headers(Prefer="count=estimated" if estimated else "count=exact", Range="0-0"),
+        )
+        self._raise_for_status(response)
+        return self._parse_count(response)
+
+    async def search_analyses(
+        self,
+        user_id: str,
+        query: str,
+        limit: int,
+        offset: int = 0,
+        after: Optional[Tuple[float, str, str]] = None,
+        include_text: bool = False,
+    ) -> List[Dict[str, Any]]:
+        """
+        Buscar análisis del usuario por texto completo (índices GIN, ver
+        database.sql), ordenados por relevancia. Con `after` (rank,
+        created_at, id) se pagina por keyset en vez de OFFSET.
+        """
+        payload: Dict[str, Any] = {
+            "p_user_id": user_id,
+            "p_query": query,
+            "p_include_text": include_text,
+            "p_limit": limit,
+            "p_offset": offset,
+        }
+        if after is not None:
+            rank, created_at, analysis_id = after
+            payload.update(p_after_rank=rank, p_after_created_at=created_at, p_after_id=analysis_id)
+        response = await self._client.post(
+            "/rest/v1/rpc/search_analyses",
+            json=payload,
+            headers=self._headers(),
+        )
+        self._raise_for_status(response)
+        return response.json()
+
+    async def match_analyses(
+        self,
+        user_id: str,
+        embedding: List[float],
+        limit: int = 5,
+        min_similarity: float = 0.0,
+        exclude_id: Optional[str] = None,
+    ) -> List[Dict[str, Any]]:
+        """
+        Análisis del usuario más parecidos a un embedding (índice HNSW, ver
+        database.sql), con su similitud coseno
+        """
+        response = await self._client.post(
+            "/rest/v1/rpc/match_analyses",
+            json={
+                "p_user_id": user_id,
+                "p_embedding": embedding,
+                "p_limit": limit,
+                "p_min_similarity": min_similarity,
+                "p_exclude_id": exclude_id,
+            },
+            headers=self._headers(),
+        )
+        self._raise_for_status(response)
+        return response.json()
+
+    async def similar_analyses(self, user_id: str, analysis_id: str, limit: int = 5) -> List[Dict[str, Any]]:
+        """Análisis parecidos a uno ya guardado, usando su embedding almacenado"""
+        response = await self._client.post(
+            "/rest/v1/rpc/similar_analyses",
+            json={"p_user_id": user_id, "p_analysis_id": analysis_id, "p_limit": limit},
+            headers=self._headers(),
+        )
+        self._raise_for_status(response)
+        return response.json()
+
+    async def get_analysis_stats(self, user_id: str, keyword_limit: int = 10) -> Dict[str, Any]:
+        """
+        Estadísticas del usuario desde los contadores que mantiene el trigger
+        analyses_stats (ver database.sql); no recorre el historial
+        """
+        response = await self._client.post(
+            "/rest/v1/rpc/get_analysis_stats",
+            json={"p_user_id": user_id, "p_keyword_limit": keyword_limit},
+            headers=self._headers(),
+        )
+        self._raise_for_status(response)
+        return response.json()
+
+    async def consume_rate_limit(
+        self, keys: List[str], capacities: List[float], refill_rates: List[float], cost: float
+    ) -> Dict[str, Any]:
+        """
+        Cobrar `cost` tokens en varios token buckets compartidos, todos o
+        ninguno (función rate_limit_consume, ver database.sql)
+        """
+        response = await self._client.post(
+            "/rest/v1/rpc/rate_limit_consume",
+            json={
+                "p_keys": keys,
+                "p_capacities": capacities,
+                "p_refill_rates": refill_rates,
+                "p_cost": cost,
+            },
+            headers=self._headers(),
+        )
+        self._raise_for_status(response)
+        return response.json()
+
+    # =====================================================
+    # TRABAJOS
+    # =====================================================
+
+    async def insert_job(self, job: Dict[str, Any]) -> None:
+        """Crear un trabajo de análisis (tabla analysis_jobs)"""
+        response = await self._client.post(
+            "/rest/v1/analysis_jobs",
+            json=job,
+            headers=self._headers(Prefer="return=minimal"),
+        )
+        self._raise_for_status(response)
+
+    async def get_job(self, job_id: str, columns: str = "*") -> Optional[Dict[str, Any]]:
+        """Obtener un trabajo por ID o None si no existe"""
+        response = await self._client.get(
+            "/rest/v1/analysis_jobs",
+            params={"select": columns, "id": f"eq.{job_id}", "limit": 1},
+            headers=self._headers(),
+        )
+        self._raise_for_status(response)
+        rows = response.json()
+        return rows[0] if rows else None
+
+    async def update_job(self, job_id: str, fields: Dict[str, Any]) -> None:
+        """Actualizar el estado o el resultado de un trabajo"""
+        response = await self._client.patch(
+            "/rest/v1/analysis_jobs",
+            params={"id": f"eq.{job_id}"},
+            json=fields,
+            headers=self._headers(Prefer="return=minimal"),
+        )
+        self._raise_for_status(response)
+
+    async def count_jobs(self, status: str) -> int:
+        """Contar los trabajos con un estado (índice parcial de pendientes)"""
+        response = await self._client.head(
+            "/rest/v1/analysis_jobs",
+            params={"select": "id", "status": f"eq.{status}"},
+            headers=self._headers(Prefer="count=exact", Range="0-0"),
+        )
+        self._raise_for_status(response)
+        return self._parse_count(response)
+
+    async def claim_job(self, lease_seconds: int, max_attempts: int) -> Optional[Dict[str, Any]]:
+        """
+        Reservar el trabajo pendiente más antiguo (función claim_analysis_job,
+        ver database.sql); None si no hay ninguno
+        """
+        response = await self._client.post(
+            "/rest/v1/rpc/claim_analysis_job",
+            json={"p_lease_seconds": lease_seconds, "p_max_attempts": max_attempts},
+            headers=self._headers(),
+        )
+        self._raise_for_status(response)
+        rows = response.json()
+        return rows[0] if rows else None
+
+    async def ping(self) -> None:
+        """Consulta mínima para verificar la conexión"""
+        response = await self._client.get(
+            "/rest/v1/analyses",
+            params={"select": "id", "limit": 1},
+            headers=self._headers(),
+        )
+        self._raise_for_status(response)
+
+    # =====================================================
+    # PERFILES
+    # =====================================================
+
+    async def insert_user_profile(self, data: Dict[str, Any]) -> None:
+        """Crear el perfil de un usuario"""
+        response = await self._client.post(
+            "/rest/v1/user_profiles",
+            json=data,
+            headers=self._headers(Prefer="return=minimal"),
+        )
+        self._raise_for_status(response)
+
+    # =====================================================
+    # AUTENTICACIÓN
+    # =====================================================
+
+    async def sign_in_with_password(self, email: str, password: str) -> Dict[str, Any]:
+        """Iniciar sesión; devuelve la sesión con access_token y user"""
+        response = await self._client.post(
+            "/auth/v1/token",
+            params={"grant_type": "password"},
+            json={"email": email, "password": password},
+            headers=self._headers(self.anon_key),
+        )
+        self._raise_for_status(response)
+        return response.json()
+
+    async def sign_up(self, email: str, password: str) -> Dict[str, Any]:
+        """
+        Registrar usuario. Devuelve {"user": ..., "session": ...}; session es
+        None si el email requiere confirmación.
+        """
+        response = await self._client.post(
+            "/auth/v1/signup",
+            json={"email": email, "password": password},
+            headers=self._headers(self.anon_key),
+        )
+        self._raise_for_status(response)
+        body = response.json()
+        # Con confirmación pendiente GoTrue devuelve el usuario directamente
+        if "access_token" in body:
+            return {"user": body.get("user"), "session": body}
+        return {"user": body.get("user", body), "session": None}
+
+    async def sign_out(self, access_token: str) -> None:
+        """Revocar la sesión asociada al token"""
+        response = await self._client.post(
+            "/auth/v1/logout",
+            headers=self._headers(self.anon_key, token=access_token),
+        )
+        self._raise_for_status(response)
+
+    async def resend_confirmation(self, email: str) -> None:
+        """Reenviar el email de confirmación de registro"""
+        response = await self._client.post(
+            "/auth/v1/resend",
+            json={"type": "signup", "email": email},
+            headers=self._headers(self.anon_key),
+        )
+        self._raise_for_status(response)
+
+    async def get_user(self, access_token: str) -> Dict[str, Any]:
+        """Obtener el usuario dueño del token"""
+        response = await self._client.get(
+            "/auth/v1/user",
+            headers=self._headers(self.anon_key, token=access_token),
+        )
+        self._raise_for_status(response)
+        return response.json()
+
+
+_repository: Optional[SupabaseRepository] = None
+
+
+def init_repository() -> SupabaseRepository:
+    """Crear el repositorio compartido (llamado desde el lifespan)"""
+    global _repository
+    if _repository is None:
+        _repository = SupabaseRepository(
+            url=settings.SUPABASE_URL,
+            anon_key=settings.SUPABASE_ANON_KEY,
+            service_role_key=settings.SUPABASE_SERVICE_ROLE_KEY,
+            max_connections=settings.SUPABASE_MAX_CONNECTIONS,
+            timeout=settings.SUPABASE_TIMEOUT,
+        )
+    return _repository
+
+
+async def close_repository() -> None:
+    """Cerrar el repositorio compartido"""
+    global _repository
+    if _repository is not None:
+        await _repository.close()
+        _repository = None
+
+
+def get_repository() -> SupabaseRepository:
+    """
+    Dependencia de FastAPI. Si el lifespan no se ejecutó (p. ej. en algunos
+    runtimes serverless) el repositorio se crea en la primera petición.
+    """
+    return init_repository()
@@ -0,0 +1,207 @@
+"""
+⏱️ TRAZAS POR PETICIÓN Y MÉTRICAS
+================================
+
+Desglose de latencia de cada petición sin dependencias externas:
+
+    - TracingMiddleware (ASGI puro, no envuelve el cuerpo) abre una traza
+      por petición y, al enviar las cabeceras, añade Server-Timing con la
+      duración acumulada de cada etapa y el total, p. ej.
+          Server-Timing: cache;dur=0.4, gemini;dur=812.3, store;dur=1.1, total;dur=820.9
+    - span("etapa") mide un bloque de código y lo suma a la traza actual
+      (contextvars, así que funciona igual en tareas hijas).
+    - record_upstream() registra llamadas a Gemini y Supabase.
+
+Todo se acumula en histogramas en memoria (búsqueda binaria del bucket y
+una suma por observación) que GET /metrics expone en el formato de texto
+de Prometheus:
+
+    http_request_duration_seconds{method, route, status}
+    upstream_request_duration_seconds{upstream, operation, outcome}
+    stage_duration_seconds{stage}
+
+La ruta es la plantilla (/api/analysis/history/{analysis_id}) o el nombre
+del endpoint, nunca la URL, para que el número de series no crezca con los IDs.
+"""
+
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from config import settings
+
+# Límites superiores de los buckets, en segundos
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+PROMETHEUS_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class Histogram:
+    """Histograma acumulativo con etiquetas, al estilo de Prometheus"""
+
+    def __init__(self, name: str, help_text: str, label_names: Tuple[str, ...], buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.buckets = tuple(buckets)
+        # etiquetas -> [conteo por bucket..., conteo total, suma]
+        self._series: Dict[Tuple[str, ...], List[float]] = {}
+
+    def observe(self, value: float, *labels: str) -> None:
+        series = self._series.get(labels)
+        if series is None:
+            series = self._series[labels] = [0] * (len(self.buckets) + 1) + [0.0]
+        index = bisect_left(self.buckets, value)
+        if index < len(self.buckets):
+            series[index] += 1
+        series[-2] += 1
+        series[-1] += value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        for labels, series in sorted(self._series.items()):
+            pairs = [f'{name}="{_escape(value)}"' for name, value in zip(self.label_names, labels)]
+            cumulative = 0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                lines.append(self._sample("_bucket", pairs + [f'le="{bound}"'], cumulative))
+            lines.append(self._sample("_bucket", pairs + ['le="+Inf"'], int(series[-2])))
+            lines.append(self._sample("_sum", pairs, series[-1]))
+            lines.append(self._sample("_count", pairs, int(series[-2])))
+        return lines
+
+    def _sample(self, suffix: str, pairs: List[str], value: float) -> str:
+        label_text = "{" + ",".join(pairs) + "}" if pairs else ""
+        return f"{self.name}{suffix}{label_text} {value}"
+
+
+HTTP_REQUESTS = Histogram(
+    "http_request_duration_seconds", "Duración de las peticiones HTTP por ruta", ("method", "route", "status")
+)
+UPSTREAM_REQUESTS = Histogram(
+    "upstream_request_duration_seconds",
+    "Duración de las llamadas a servicios externos",
+    ("upstream", "operation", "outcome"),
+)
+STAGES = Histogram("stage_duration_seconds", "Duración de las etapas internas de una petición", ("stage",))
+
+
+def render_metrics() -> str:
+    """Todas las métricas en formato de texto de Prometheus"""
+    lines: List[str] = []
+    for histogram in (HTTP_REQUESTS, UPSTREAM_REQUESTS, STAGES):
+        lines.extend(histogram.render())
+    return "\n".join(lines) + "\n"
+
+
+# =====================================================
+# TRAZA DE LA PETICIÓN
+# =====================================================
+
+class RequestTrace:
+    """Duración acumulada por etapa dentro de una petición"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.spans: Dict[str, float] = {}
+
+    def add(self, name: str, seconds: float) -> None:
+        self.spans[name] = self.spans.get(name, 0.0) + seconds
+
+    def server_timing(self) -> str:
+        entries = [f"{name};dur={seconds * 1000:.1f}" for name, seconds in self.spans.items()]
+        entries.append(f"total;dur={(time.perf_counter() - self.started) * 1000:.1f}")
+        return ", ".join(entries)
+
+
+_current_trace: ContextVar[Optional[RequestTrace]] = ContextVar("request_trace", default=None)
+
+
+@contextmanager
+def span(name: str) -> Iterator[None]:
+    """Medir una etapa: se suma a la traza de la petición y al histograma de etapas"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        trace = _current_trace.get()
+        if trace is not None:
+            trace.add(name, elapsed)
+        if settings.TELEMETRY_ENABLED:
+            STAGES.observe(elapsed, name)
+
+
+def record_upstream(upstream: str, operation: str, seconds: float, outcome: str = "ok") -> None:
+    """Registrar una llamada a un servicio externo (aparece como `upstream` en Server-Timing)"""
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.add(upstream, seconds)
+    if settings.TELEMETRY_ENABLED:
+        UPSTREAM_REQUESTS.observe(seconds, upstream, operation, outcome)
+
+
+@contextmanager
+def upstream_span(upstream: str, operation: str) -> Iterator[None]:
+    """Medir una llamada a un servicio externo, marcando si terminó en error"""
+    started = time.perf_counter()
+    outcome = "error"
+    try:
+        yield
+        outcome = "ok"
+    finally:
+        record_upstream(upstream, operation, time.perf_counter() - started, outcome)
+
+
+# =====================================================
+# MIDDLEWARE
+# =====================================================
+
+def _route_label(scope: dict) -> str:
+    """Plantilla de la ruta que atendió la petición (el router la deja en el scope)"""
+    route = scope.get("route")
+    if route is not None and getattr(route, "path", None):
+        return route.path
+    endpoint = scope.get("endpoint")
+    return getattr(endpoint, "__name__", "unmatched")
+
+
+class TracingMiddleware:
+    """Traza por petición, cabecera Server-Timing e histograma por ruta"""
+
+    def __init__(self, app, server_timing: bool = True):
+        self.app = app
+        self.server_timing = server_timing
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not settings.TELEMETRY_ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        trace = RequestTrace()
+        token = _current_trace.set(trace)
+        status = 500
+
+        async def send_with_timing(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                if self.server_timing:
+                    headers = list(message.get("headers", []))
+                    headers.append((b"server-timing", trace.server_timing().encode("latin-1")))
+                    message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _current_trace.reset(token)
+            HTTP_REQUESTS.observe(
+                time.perf_counter() - trace.started, scope["method"], _route_label(scope), str(status)
+            )
@@ -0,0 +1,127 @@
+"""
+🧵 POOL DE PROCESOS PARA TRABAJO CPU
+===================================
+
+ProcessPoolExecutor compartido, creado en el lifespan de FastAPI, para las
+etapas CPU-bound del análisis (motor local, normalización de texto para la
+caché, división en fragmentos). Así no bloquean el event loop y un equipo
+con varios núcleos los aprovecha todos.
+
+La cola está acotada: si hay más de CPU_POOL_MAX_PENDING tareas en curso
+se lanza WorkerPoolSaturatedError, y cada tarea tiene un tiempo máximo
+(CPU_POOL_TASK_TIMEOUT). Un proceso no se puede interrumpir, así que una
+tarea que supera el tiempo sigue ocupando su hueco hasta que termina de
+verdad. Si un proceso muere (BrokenProcessPool) el pool se recrea en la
+siguiente llamada. Con CPU_POOL_WORKERS=0 (o si el entorno no
+permite crear procesos, como algunos runtimes serverless) las funciones se
+ejecutan en un hilo.
+"""
+
+import asyncio
+import functools
+import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Optional
+
+from config import settings
+
+
+class WorkerPoolSaturatedError(Exception):
+    """La cola del pool de procesos está llena"""
+
+
+class WorkerTimeoutError(Exception):
+    """Una tarea del pool superó el tiempo máximo"""
+
+
+class CPUWorkerPool:
+    """Pool de procesos con cola acotada y timeout por tarea"""
+
+    def __init__(self, workers: int, max_pending: int, task_timeout: float):
+        self.workers = workers
+        self.max_pending = max_pending
+        self.task_timeout = task_timeout
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._pending = 0
+
+    @property
+    def pending(self) -> int:
+        """Tareas enviadas que aún no terminan (incluidas las que superaron el timeout)"""
+        return self._pending
+
+    def _release(self, future: asyncio.Future) -> None:
+        self._pending -= 1
+        if not future.cancelled():
+            # Consumir la excepción de una tarea que ya nadie espera
+            future.exception()
+
+    def _discard(self, executor: Optional[ProcessPoolExecutor]) -> None:
+        """Descartar un pool roto para que start() cree uno nuevo"""
+        if executor is not None and self._executor is executor:
+            print("El pool de procesos se rompió, se recreará en la siguiente tarea")
+            executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def start(self) -> None:
+        """Crear los procesos del pool"""
+        if self._executor is None and self.workers > 0:
+            try:
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            except (OSError, NotImplementedError) as e:
+                print(f"No se pudo crear el pool de procesos, se usarán hilos: {e}")
+                self.workers = 0
+
+    def shutdown(self) -> None:
+        """Terminar los procesos del pool"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    async def run(self, func: Callable[..., Any], *args: Any, timeout: Optional[float] = None) -> Any:
+        """
+        Ejecutar func(*args) en el pool. func y sus argumentos deben ser
+        serializables (funciones a nivel de módulo).
+        """
+        if self._pending >= self.max_pending:
+            raise WorkerPoolSaturatedError("Demasiadas tareas de CPU en cola")
+
+        self.start()
+        loop = asyncio.get_running_loop()
+        call = functools.partial(func, *args)
+        # Sin pool de procesos, run_in_executor(None) usa el pool de hilos del loop
+        executor = self._executor
+        try:
+            future = loop.run_in_executor(executor, call)
+        except BrokenProcessPool:
+            self._discard(executor)
+            raise
+        # El hueco se libera cuando la tarea termina, no cuando se deja de esperar
+        self._pending += 1
+        future.add_done_callback(self._release)
+        try:
+            return await asyncio.wait_for(asyncio.shield(future), timeout=timeout or self.task_timeout)
+        except asyncio.TimeoutError:
+            raise WorkerTimeoutError(f"La tarea {func.__name__} superó {timeout or self.task_timeout}s")
+        except BrokenProcessPool:
+            self._discard(executor)
+            raise
+
+
+_pool: Optional[CPUWorkerPool] = None
+
+
+def get_worker_pool() -> CPUWorkerPool:
+    """Obtener el pool compartido del proceso"""
+    global _pool
+    if _pool is None:
+        workers = settings.CPU_POOL_WORKERS
+        if workers < 0:
+            workers = os.cpu_count() or 1
+        _pool = CPUWorkerPool(workers, settings.CPU_POOL_MAX_PENDING, settings.CPU_POOL_TASK_TIMEOUT)
+    return _pool
+
+
+async def run_cpu_bound(func: Callable[..., Any], *args: Any, timeout: Optional[float] = None) -> Any:
+    """Ejecutar una función CPU-bound en el pool compartido"""
+    return await get_worker_pool().run(func, *args, timeout=timeout)
@@ -0,0 +1,277 @@
+"""
+📝 BUFFER DE ESCRITURA DE ANÁLISIS
+=================================
+
+Write-behind para la tabla analyses: la petición no espera el insert en
+Supabase. Cada fila se añade a un log local de solo-anexado (una línea
+JSON por fila, con fsync) y a la cola en memoria; con eso la fila ya es
+durable y se responde al usuario.
+
+Una tarea en segundo plano vuelca la cola a Supabase con inserts de varias
+filas cuando se juntan WRITE_BUFFER_MAX_BATCH filas o pasan
+WRITE_BUFFER_FLUSH_INTERVAL segundos. El insert usa on_conflict=id con
+ignore-duplicates, así que reintentar un lote (o reprocesar el log tras un
+reinicio) nunca duplica filas. Los errores transitorios se reintentan con
+backoff; una fila rechazada por Supabase (4xx) se aparta a <log>.failed
+para no bloquear a las demás.
+
+El log se vacía cuando la cola queda vacía y se compacta si crece más de
+WRITE_BUFFER_MAX_LOG_BYTES. Al arrancar, las filas que quedaron en el log
+se vuelven a encolar.
+
+Solo sirve en un host persistente (uvicorn en una VM o contenedor): en
+serverless /tmp es efímero y por instancia, y la tarea de volcado se
+congela entre invocaciones, así que una fila confirmada podría no llegar
+nunca a Postgres. Por eso está desactivado por defecto
+(WRITE_BUFFER_ENABLED) y, si el lifespan no lo arrancó, add() inserta
+directamente. Mientras una fila está en el buffer solo la ven la consulta
+por ID y el detalle; historial, búsqueda y estadísticas la muestran tras
+el volcado (normalmente en WRITE_BUFFER_FLUSH_INTERVAL segundos).
+"""
+
+import asyncio
+import json
+import os
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+from config import settings
+from services.resilience import RETRYABLE_STATUS_CODES, backoff_delay
+from services.supabase import SupabaseError, get_repository
+
+# Espera máxima entre reintentos de volcado
+MAX_FLUSH_BACKOFF = 30.0
+
+
+class AnalysisWriteBuffer:
+    """Cola durable de filas de analyses con volcado por lotes a Supabase"""
+
+    def __init__(
+        self,
+        log_path: str,
+        max_batch: int,
+        flush_interval: float,
+        max_pending: int,
+        max_log_bytes: int,
+        fsync: bool = True,
+    ):
+        self.log_path = log_path
+        self.max_batch = max_batch
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.max_log_bytes = max_log_bytes
+        self.fsync = fsync
+        # id -> {"row": fila, "queued_at": instante en que se encoló}
+        self._pending: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        # Los locks y el evento se crean dentro del event loop (ver start)
+        self._log_lock: Optional[asyncio.Lock] = None
+        self._flush_lock: Optional[asyncio.Lock] = None
+        self._wake: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def pending_count(self) -> int:
+        return len(self._pending)
+
+    @property
+    def running(self) -> bool:
+        """True si la tarea de volcado está activa (la arranca el lifespan)"""
+        return self._task is not None
+
+    # =====================================================
+    # LOG LOCAL
+    # =====================================================
+
+    def _append_lines(self, path: str, lines: List[str]) -> None:
+        with open(path, "a", encoding="utf-8") as log:
+            log.write("".join(lines))
+            log.flush()
+            if self.fsync:
+                os.fsync(log.fileno())
+
+    def _rewrite_log(self, lines: List[str]) -> None:
+        """Reemplazar el log de forma atómica (archivo temporal + rename)"""
+        temporary = self.log_path + ".tmp"
+        with open(temporary, "w", encoding="utf-8") as log:
+            log.write("".join(lines))
+            log.flush()
+            if self.fsync:
+                os.fsync(log.fileno())
+        os.replace(temporary, self.log_path)
+
+    def _read_log(self) -> List[Dict[str, Any]]:
+        if not self.log_path or not os.path.exists(self.log_path):
+            return []
+        entries = []
+        with open(self.log_path, encoding="utf-8") as log:
+            for line in log:
+                try:
+                    entries.append(json.loads(line))
+                except ValueError:
+                    # Línea a medias por una caída durante la escritura
+                    print("Línea corrupta en el log de escritura, se ignora")
+        return entries
+
+    @staticmethod
+    def _line(entry: Dict[str, Any]) -> str:
+        return json.dumps(entry, separators=(",", ":"), default=str) + "\n"
+
+    def _log_size(self) -> int:
+        try:
+            return os.path.getsize(self.log_path)
+        except OSError:
+            return 0
+
+    # =====================================================
+    # CICLO DE VIDA
+    # =====================================================
+
+    async def start(self) -> None:
+        """Reencolar las filas que quedaron en el log y lanzar el volcado periódico"""
+        if self._task is not None:
+            return
+        self._log_lock = asyncio.Lock()
+        self._flush_lock = asyncio.Lock()
+        self._wake = asyncio.Event()
+        for entry in await asyncio.to_thread(self._read_log):
+            self._pending[entry["row"]["id"]] = entry
+        if self._pending:
+            print(f"Reencolados {len(self._pending)} análisis pendientes del log de escritura")
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """Volcar lo pendiente y detener la tarea (lo que falle queda en el log)"""
+        if self._task is None:
+            return
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        self._task = None
+        try:
+            await self.flush()
+        except Exception as e:
+            print(f"Error volcando análisis al detener: {e}")
+
+    async def _run(self) -> None:
+        failures = 0
+        while True:
+            try:
+                await asyncio.wait_for(self._wake.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+            try:
+                await self.flush()
+                failures = 0
+            except Exception as e:
+                failures += 1
+                print(f"Error volcando análisis a Supabase ({self.pending_count} pendientes): {e}")
+                await asyncio.sleep(backoff_delay(failures - 1, self.flush_interval, MAX_FLUSH_BACKOFF))
+
+    # =====================================================
+    # ENCOLAR
+    # =====================================================
+
+    async def add(self, rows: List[Dict[str, Any]]) -> None:
+        """
+        Encolar filas de forma durable. Si el buffer no está en marcha o la
+        cola está llena se insertan directamente (en el segundo caso,
+        backpressure en lugar de crecer sin límite).
+        """
+        if not self.running or self.pending_count + len(rows) > self.max_pending:
+            await get_repository().upsert_analyses(self._uniform(rows))
+            return
+        # created_at va en la fila (y en el log): el volcado o la reproducción
+        # del log tras un reinicio no deben cambiarlo por el NOW() de Postgres
+        queued_at = datetime.now(timezone.utc).isoformat()
+        entries = [{"row": {"created_at": queued_at, **row}, "queued_at": queued_at} for row in rows]
+        async with self._log_lock:
+            if self.log_path:
+                await asyncio.to_thread(self._append_lines, self.log_path, [self._line(e) for e in entries])
+            for entry in entries:
+                self._pending[entry["row"]["id"]] = entry
+        if self.pending_count >= self.max_batch:
+            self._wake.set()
+
+    def get(self, analysis_id: str, user_id: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """Fila aún no volcada (para leer lo recién escrito)"""
+        entry = self._pending.get(analysis_id)
+        if entry is None or (user_id is not None and entry["row"].get("user_id") != user_id):
+            return None
+        return {"created_at": entry["queued_at"], **entry["row"]}
+
+    # =====================================================
+    # VOLCADO
+    # =====================================================
+
+    @staticmethod
+    def _uniform(rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Mismas columnas en todas las filas (requisito de los inserts múltiples de PostgREST)"""
+        columns = list(OrderedDict.fromkeys(column for row in rows for column in row))
+        return [{column: row.get(column) for column in columns} for row in rows]
+
+    async def _dead_letter(self, row: Dict[str, Any], error: Exception) -> None:
+        print(f"Análisis {row.get('id')} rechazado por Supabase, se aparta: {error}")
+        if self.log_path:
+            entry = {"row": row, "error": str(error), "failed_at": datetime.now().isoformat()}
+            await asyncio.to_thread(self._append_lines, self.log_path + ".failed", [self._line(entry)])
+
+    async def _write(self, rows: List[Dict[str, Any]]) -> None:
+        """
+        Insertar un lote. Un error permanente (4xx) de un lote se reparte fila
+        a fila para apartar solo las filas inválidas; los transitorios se propagan.
+        """
+        try:
+            await get_repository().upsert_analyses(self._uniform(rows))
+        except SupabaseError as e:
+            if e.status_code >= 500 or e.status_code in RETRYABLE_STATUS_CODES:
+                raise
+            if len(rows) == 1:
+                await self._dead_letter(rows[0], e)
+                return
+            for row in rows:
+                await self._write([row])
+
+    async def flush(self) -> int:
+        """Volcar todas las filas pendientes en lotes; devuelve cuántas se escribieron"""
+        if self._flush_lock is None:
+            return 0
+        async with self._flush_lock:
+            written = 0
+            while self._pending:
+                ids = list(self._pending)[:self.max_batch]
+                await self._write([self._pending[analysis_id]["row"] for analysis_id in ids])
+                for analysis_id in ids:
+                    self._pending.pop(analysis_id, None)
+                written += len(ids)
+            if written:
+                await self._compact()
+            return written
+
+    async def _compact(self) -> None:
+        """Vaciar el log si no queda nada pendiente o reescribirlo si creció demasiado"""
+        if not self.log_path:
+            return
+        async with self._log_lock:
+            if not self._pending:
+                await asyncio.to_thread(self._rewrite_log, [])
+            elif await asyncio.to_thread(self._log_size) > self.max_log_bytes:
+                await asyncio.to_thread(self._rewrite_log, [self._line(e) for e in self._pending.values()])
+
+
+_buffer: Optional[AnalysisWriteBuffer] = None
+
+
+def get_write_buffer() -> AnalysisWriteBuffer:
+    """Obtener el buffer compartido del proceso"""
+    global _buffer
+    if _buffer is None:
+        _buffer = AnalysisWriteBuffer(
+            log_path=settings.WRITE_BUFFER_LOG_PATH,
+            max_batch=settings.WRITE_BUFFER_MAX_BATCH,
+            flush_interval=settings.WRITE_BUFFER_FLUSH_INTERVAL,
+            max_pending=settings.WRITE_BUFFER_MAX_PENDING,
+            max_log_bytes=settings.WRITE_BUFFER_MAX_LOG_BYTES,
+            fsync=settings.WRITE_BUFFER_FSYNC,
+        )
+    return _buffer
@@ -0,0 +1,211 @@
+"""
+🧪 CONFIGURACIÓN COMPARTIDA DE LAS PRUEBAS
+=========================================
+
+Config lee las variables de entorno al importarse, así que se fijan aquí
+antes de importar cualquier módulo del backend: sin pool de procesos, sin
+embeddings ni buffer de escritura, y sin credenciales reales.
+
+Las pruebas de la API usan un repositorio y un gateway de Gemini falsos;
+ninguna prueba hace llamadas de red.
+"""
+
+import asyncio
+import json
+import os
+import re
+import sys
+import uuid
+from collections import Counter
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import pytest
+
+os.environ.update({
+    "ENVIRONMENT": "test",
+    "GEMINI_API_KEY": "test-key",
+    "SUPABASE_URL": "",
+    "AUTH_DEV_USER_ENABLED": "false",
+    "CPU_POOL_WORKERS": "0",
+    "EMBEDDINGS_ENABLED": "false",
+    "WRITE_BUFFER_ENABLED": "false",
+    "JOBS_ENABLED": "false",
+    "ANALYSIS_CACHE_SQLITE_PATH": "",
+    "RATE_LIMIT_BACKEND": "memory",
+})
+
+# Agregar el directorio backend al path para importaciones
+backend_dir = Path(__file__).parent.parent
+sys.path.insert(0, str(backend_dir))
+
+from api import analysis  # noqa: E402
+from api.analysis import parse_timestamp  # noqa: E402
+from api.main import app  # noqa: E402
+from services.auth import get_current_user_id  # noqa: E402
+from services.structured_output import BATCH_ANALYSIS_SCHEMA  # noqa: E402
+from services.supabase import get_repository  # noqa: E402
+
+_BATCH_INDEX_RE = re.compile(r"\[TEXTO (\d+)\]")
+
+
+def analysis_payload(text: str) -> Dict[str, Any]:
+    """Respuesta válida de Gemini para un texto"""
+    return {
+        "summary": f"Resumen de: {text[:30]}",
+        "keywords": ["prueba", "análisis"],
+        "sentiment": {"label": "positive", "confidence": 0.9},
+    }
+
+
+class FakeRepository:
+    """Repositorio en memoria con los métodos que usa el pipeline de análisis"""
+
+    def __init__(self):
+        self.rows: List[Dict[str, Any]] = []
+        self.inserts = 0
+        # (método, argumentos) de cada lectura, para comprobar qué se consulta
+        self.calls: List[Tuple[str, Dict[str, Any]]] = []
+
+    async def insert_analyses(self, rows: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        self.inserts += 1
+        self.rows.extend(rows)
+        return rows
+
+    async def upsert_analyses(self, rows: List[Dict[str, Any]]) -> None:
+        known = {row["id"] for row in self.rows}
+        self.inserts += 1
+        self.rows.extend(row for row in rows if row["id"] not in known)
+
+    def _user_rows(self, user_id: Optional[str]) -> List[Dict[str, Any]]:
+        return [row for row in self.rows if user_id is None or row["user_id"] == user_id]
+
+    @staticmethod
+    def _project(row: Dict[str, Any], columns: str) -> Dict[str, Any]:
+        if columns == "*":
+            return dict(row)
+        return {column: row.get(column) for column in columns.split(",")}
+
+    async def page_analyses(
+        self, limit: int, offset: int = 0, after: Optional[Tuple[str, str]] = None,
+        columns: str = "*", user_id: Optional[str] = None,
+    ) -> List[Dict[str, Any]]:
+        self.calls.append(("page_analyses", {"limit": limit, "offset": offset, "after": after, "columns": columns}))
+        key = lambda row: (parse_timestamp(row["created_at"]), row["id"])  # noqa: E731
+        rows = sorted(self._user_rows(user_id), key=key, reverse=True)
+        if after is not None:
+            position = (parse_timestamp(after[0]), after[1])
+            rows = [row for row in rows if key(row) < position]
+        else:
+            rows = rows[offset:]
+        return [self._project(row, columns) for row in rows[:limit]]
+
+    async def get_analysis(
+        self, analysis_id: str, columns: str = "*", user_id: Optional[str] = None
+    ) -> Optional[Dict[str, Any]]:
+        self.calls.append(("get_analysis", {"analysis_id": analysis_id, "columns": columns}))
+        for row in self._user_rows(user_id):
+            if row["id"] == analysis_id:
+                return self._project(row, columns)
+        return None
+
+    async def count_analyses(self, estimated: bool = False, user_id: Optional[str] = None) -> int:
+        self.calls.append(("count_analyses", {"estimated": estimated}))
+        return len(self._user_rows(user_id))
+
+    async def search_analyses(
+        self, user_id: str, query: str, limit: int, offset: int = 0,
+        after: Optional[Tuple[float, str, str]] = None, include_text: bool = False,
+    ) -> List[Dict[str, Any]]:
+        """Búsqueda simplificada: rank = términos de `query` presentes en la fila"""
+        self.calls.append(("search_analyses", {"query": query, "limit": limit, "offset": offset, "after": after}))
+        results = []
+        for row in self._user_rows(user_id):
+            haystack = " ".join([row["summary"], *row["keywords"], row["original_text"] if include_text else ""]).lower()
+            rank = float(sum(term in haystack for term in query.lower().split()))
+            if rank:
+                results.append({**self._project(row, analysis.ANALYSIS_LIST_COLUMNS), "rank": rank})
+        key = lambda row: (row["rank"], parse_timestamp(row["created_at"]), row["id"])  # noqa: E731
+        results.sort(key=key, reverse=True)
+        if after is not None:
+            position = (after[0], parse_timestamp(after[1]), after[2])
+            results = [row for row in results if key(row) < position]
+        else:
+            results = results[offset:]
+        return results[:limit]
+
+    async def get_analysis_stats(self, user_id: str, keyword_limit: int = 10) -> Dict[str, Any]:
+        """Mismo JSON que la función get_analysis_stats de database.sql"""
+        self.calls.append(("get_analysis_stats", {"keyword_limit": keyword_limit}))
+        rows = self._user_rows(user_id)
+        keywords = Counter(keyword for row in rows for keyword in row["keywords"])
+        month = datetime.now(timezone.utc).strftime("%Y-%m")
+        return {
+            "total_analyses": len(rows),
+            "sentiment_distribution": {
+                label: sum(row["sentiment_label"] == label for row in rows)
+                for label in ("positive", "negative", "neutral")
+            },
+            "most_common_keywords": sorted(keywords, key=lambda keyword: (-keywords[keyword], keyword))[:keyword_limit],
+            "analyses_this_month": sum(row["created_at"].startswith(month) for row in rows),
+            "average_confidence": sum(row["sentiment_confidence"] for row in rows) / len(rows) if rows else 0,
+        }
+
+    async def match_analyses(self, user_id: str, embedding: List[float], **kwargs) -> List[Dict[str, Any]]:
+        return []
+
+
+class FakeGateway:
+    """Gateway de Gemini que responde JSON válido y registra cada prompt"""
+
+    def __init__(self):
+        self.prompts: List[str] = []
+        self.error: Optional[Exception] = None
+        self.delay = 0.0
+
+    async def generate_with_usage(self, prompt: str, model: str, **kwargs):
+        self.prompts.append(prompt)
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        if self.error is not None:
+            raise self.error
+        if kwargs.get("response_schema") is BATCH_ANALYSIS_SCHEMA:
+            items = [
+                {"index": int(index), **analysis_payload(f"texto {index}")}
+                for index in _BATCH_INDEX_RE.findall(prompt)
+            ]
+            return json.dumps(items), {}
+        return json.dumps(analysis_payload(prompt)), {}
+
+    async def embed(self, texts: List[str], model: str, **kwargs) -> List[Optional[List[float]]]:
+        return [None] * len(texts)
+
+
+@pytest.fixture
+def repository() -> FakeRepository:
+    return FakeRepository()
+
+
+@pytest.fixture
+def gateway(monkeypatch) -> FakeGateway:
+    fake = FakeGateway()
+    monkeypatch.setattr(analysis, "get_gemini_gateway", lambda: fake)
+    return fake
+
+
+@pytest.fixture
+def user_id() -> str:
+    # Un usuario por prueba: la caché y los límites de uso son por usuario
+    return str(uuid.uuid4())
+
+
+@pytest.fixture
+def client(repository, gateway, user_id):
+    from fastapi.testclient import TestClient
+
+    app.dependency_overrides[get_repository] = lambda: repository
+    app.dependency_overrides[get_current_user_id] = lambda: user_id
+    # Sin "with": no se ejecuta el lifespan (ni Supabase, ni pools, ni workers)
+    yield TestClient(app)
+    app.dependency_overrides.clear()
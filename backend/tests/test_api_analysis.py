@@ -0,0 +1,423 @@
+"""
+Pruebas de /api/analysis con repositorio y gateway de Gemini falsos
+"""
+
+import asyncio
+import re
+import uuid
+from datetime import datetime
+
+import httpx
+import pytest
+
+from api import analysis
+from api.analysis import encode_cursor, parse_timestamp
+from api.main import app
+from services.auth import get_current_user_id
+from services.chunking import estimate_tokens
+from services import prompts
+from services.local_analyzer import LOCAL_ENGINE
+from services.rate_limit import BucketSpec, InMemoryBuckets, RateLimiter
+
+TEXT = "El servicio fue rápido y el equipo resolvió todas nuestras dudas sobre el contrato."
+
+
+def analyze(client, text=TEXT, headers=None, **fields):
+    return client.post("/api/analysis/analyze", json={"text": text, **fields}, headers=headers)
+
+
+# =====================================================
+# CACHÉ DE RESULTADOS
+# =====================================================
+
+def test_repeated_text_is_served_from_cache(client, repository, gateway):
+    first = analyze(client)
+    second = analyze(client)
+
+    assert first.status_code == 200
+    assert first.headers["X-Cache"] == "MISS"
+    assert second.headers["X-Cache"] == "HIT"
+    assert second.json()["cached"] is True
+    assert second.json()["id"] == first.json()["id"]
+    assert len(gateway.prompts) == 1
+    assert len(repository.rows) == 1
+
+
+def test_cache_ignores_case_and_whitespace(client, gateway):
+    analyze(client)
+    response = analyze(client, text="  " + TEXT.upper().replace(" ", "   ") + "\n")
+
+    assert response.headers["X-Cache"] == "HIT"
+    assert len(gateway.prompts) == 1
+
+
+def test_cache_is_scoped_per_user(client, gateway):
+    analyze(client)
+    app.dependency_overrides[get_current_user_id] = lambda: str(uuid.uuid4())
+    response = analyze(client)
+
+    assert response.headers["X-Cache"] == "MISS"
+    assert len(gateway.prompts) == 2
+
+
+def test_cache_key_includes_mode(client, gateway):
+    analyze(client)
+    response = analyze(client, mode="fast")
+
+    assert response.headers["X-Cache"] == "MISS"
+    assert response.headers["X-Analysis-Engine"] == LOCAL_ENGINE
+    assert len(gateway.prompts) == 1
+
+
+def test_degraded_result_is_not_cached(client, repository, gateway):
+    gateway.error = RuntimeError("Gemini caído")
+    first = analyze(client)
+    gateway.error = None
+    second = analyze(client)
+
+    assert first.json()["model"] == LOCAL_ENGINE
+    assert second.headers["X-Cache"] == "MISS"
+    assert second.json()["model"] != LOCAL_ENGINE
+    assert len(repository.rows) == 2
+
+
+# =====================================================
+# LOTES
+# =====================================================
+
+BATCH_TEXTS = [
+    "Primer comentario del cliente sobre la entrega del pedido.",
+    "Segundo comentario: la factura llegó con un importe incorrecto.",
+    "Tercer comentario, muy contento con la atención telefónica.",
+]
+
+
+def analyze_batch(client, texts=BATCH_TEXTS, **fields):
+    return client.post("/api/analysis/analyze/batch", json={"items": [{"text": t, **fields} for t in texts]})
+
+
+def test_batch_packs_texts_into_one_call_and_one_insert(client, repository, gateway):
+    response = analyze_batch(client)
+
+    body = response.json()
+    assert response.status_code == 200
+    assert body["succeeded"] == 3 and body["failed"] == 0
+    assert [result["index"] for result in body["results"]] == [0, 1, 2]
+    assert len(gateway.prompts) == 1
+    assert repository.inserts == 1
+    assert len(repository.rows) == 3
+
+
+def test_batch_reuses_results_cached_by_analyze(client, gateway):
+    analyze(client, text=BATCH_TEXTS[0])
+    response = analyze_batch(client)
+
+    results = response.json()["results"]
+    assert results[0]["analysis"]["cached"] is True
+    assert not results[1]["analysis"]["cached"]
+    assert len(gateway.prompts) == 2
+    assert re.findall(r"\[TEXTO (\d+)\]", gateway.prompts[1]) == ["1", "2"]
+
+
+def test_batch_results_are_cached_under_the_batch_prompt(client, gateway):
+    analyze_batch(client)
+    repeated = analyze_batch(client)
+    single = analyze(client, text=BATCH_TEXTS[0])
+
+    assert all(result["analysis"]["cached"] for result in repeated.json()["results"])
+    # El resultado del prompt de lote no se sirve como si fuera de /analyze
+    assert single.headers["X-Cache"] == "MISS"
+    assert len(gateway.prompts) == 2
+
+
+def test_batch_fast_items_do_not_call_gemini(client, repository, gateway):
+    response = analyze_batch(client, mode="fast")
+
+    assert response.json()["succeeded"] == 3
+    assert gateway.prompts == []
+    assert len(repository.rows) == 3
+
+
+# =====================================================
+# IDEMPOTENCIA Y COALESCENCIA
+# =====================================================
+
+def test_idempotent_retry_replays_the_original_response(client, repository, gateway):
+    first = analyze(client, headers={"Idempotency-Key": "pedido-1"})
+    retry = analyze(client, headers={"Idempotency-Key": "pedido-1"})
+
+    assert retry.status_code == 200
+    assert retry.headers["Idempotent-Replayed"] == "true"
+    assert retry.json() == first.json()
+    assert len(gateway.prompts) == 1
+    assert len(repository.rows) == 1
+
+
+def test_idempotency_key_reused_with_other_text_is_rejected(client):
+    analyze(client, headers={"Idempotency-Key": "pedido-2"})
+    response = analyze(client, text="Un texto completamente distinto al primero.", headers={"Idempotency-Key": "pedido-2"})
+
+    assert response.status_code == 422
+
+
+def test_idempotency_key_too_long_is_rejected(client, gateway):
+    response = analyze(client, headers={"Idempotency-Key": "x" * 256})
+
+    assert response.status_code == 400
+    assert gateway.prompts == []
+
+
+@pytest.mark.asyncio
+async def test_concurrent_identical_requests_are_coalesced(client, repository, gateway):
+    gateway.delay = 0.05
+    async with httpx.AsyncClient(app=app, base_url="http://test") as async_client:
+        responses = await asyncio.gather(*(
+            async_client.post("/api/analysis/analyze", json={"text": TEXT}) for _ in range(3)
+        ))
+
+    assert [response.status_code for response in responses] == [200] * 3
+    assert len({response.json()["id"] for response in responses}) == 1
+    assert len(gateway.prompts) == 1
+    assert len(repository.rows) == 1
+
+
+# =====================================================
+# LÍMITE DE USO
+# =====================================================
+
+@pytest.fixture
+def limiter(monkeypatch):
+    """Limitador en memoria que registra los tokens de cada cobro"""
+    limiter = RateLimiter(InMemoryBuckets(100), BucketSpec(100_000, 1000), BucketSpec(1_000_000, 1000))
+    limiter.charged = []
+    acquire = limiter.acquire
+
+    async def recording_acquire(user_id, tokens):
+        limiter.charged.append(tokens)
+        return await acquire(user_id, tokens)
+
+    limiter.acquire = recording_acquire
+    monkeypatch.setattr(analysis, "get_rate_limiter", lambda: limiter)
+    return limiter
+
+
+def test_only_requests_that_reach_gemini_are_charged(client, limiter):
+    miss = analyze(client)
+    analyze(client)
+    analyze(client, text="Texto que se procesa solo con el motor local.", mode="fast")
+
+    assert len(limiter.charged) == 1
+    assert "X-RateLimit-Remaining" in miss.headers
+
+    analyze(client, text="Otro texto enviado con clave de idempotencia.", headers={"Idempotency-Key": "k"})
+    analyze(client, text="Otro texto enviado con clave de idempotencia.", headers={"Idempotency-Key": "k"})
+
+    assert len(limiter.charged) == 2
+
+
+def test_exhausted_budget_returns_429_before_calling_gemini(client, gateway, limiter):
+    limiter.user_spec = BucketSpec(500, 0.1)
+    analyze(client)
+    response = analyze(client, text="Un segundo texto distinto que ya no cabe en el presupuesto.")
+
+    assert response.status_code == 429
+    assert int(response.headers["Retry-After"]) > 0
+    assert len(gateway.prompts) == 1
+
+
+def test_batch_charges_only_uncached_llm_texts(client, limiter):
+    analyze(client, text=BATCH_TEXTS[0])
+    client.post("/api/analysis/analyze/batch", json={"items": [
+        {"text": BATCH_TEXTS[0]},
+        {"text": BATCH_TEXTS[1]},
+        {"text": BATCH_TEXTS[2], "mode": "fast"},
+    ]})
+
+    overhead = analysis.settings.RATE_LIMIT_PROMPT_OVERHEAD_TOKENS
+    assert limiter.charged[1:] == [estimate_tokens(BATCH_TEXTS[1]) + overhead]
+
+
+def test_batch_canary_results_are_read_back_from_cache(client, gateway, monkeypatch):
+    monkeypatch.setattr(prompts.settings, "PROMPT_CANARY", "batch=v1:100")
+    analyze_batch(client)
+    repeated = analyze_batch(client)
+
+    assert all(result["analysis"]["cached"] for result in repeated.json()["results"])
+    assert len(gateway.prompts) == 1
+
+
+# =====================================================
+# USO DE PROMPTS (INTERNO)
+# =====================================================
+
+def test_prompt_usage_is_not_exposed_without_a_metrics_token(client, monkeypatch):
+    monkeypatch.setattr(analysis.settings, "METRICS_TOKEN", "")
+
+    assert client.get("/api/analysis/prompts/usage").status_code == 404
+
+
+def test_prompt_usage_requires_the_metrics_token(client, monkeypatch):
+    monkeypatch.setattr(analysis.settings, "METRICS_TOKEN", "interno")
+
+    assert client.get("/api/analysis/prompts/usage").status_code == 401
+    response = client.get("/api/analysis/prompts/usage", headers={"Authorization": "Bearer interno"})
+    assert response.status_code == 200
+
+
+def test_stored_row_has_the_created_at_returned_to_the_client(client, repository):
+    response = analyze(client)
+
+    returned = datetime.fromisoformat(response.json()["created_at"].replace("Z", "+00:00"))
+    assert datetime.fromisoformat(repository.rows[0]["created_at"]) == returned
+
+
+# =====================================================
+# HISTORIAL, BÚSQUEDA Y CURSORES
+# =====================================================
+
+HISTORY_TEXTS = [f"Comentario número {n} sobre la entrega del pedido." for n in range(5)]
+
+
+def seed_history(client, texts=HISTORY_TEXTS):
+    return [analyze(client, text=text, mode="fast").json()["id"] for text in texts]
+
+
+def test_history_list_leaves_out_original_text_and_total(client, repository):
+    seed_history(client)
+    body = client.get("/api/analysis/history").json()
+
+    assert [call for call, _ in repository.calls] == ["page_analyses"]
+    assert "original_text" not in repository.calls[0][1]["columns"].split(",")
+    assert all("original_text" not in item for item in body["analyses"])
+    assert body["total"] is None
+
+
+def test_history_total_is_counted_only_when_requested(client, repository):
+    seed_history(client)
+    body = client.get("/api/analysis/history", params={"include_total": "true"}).json()
+
+    assert body["total"] == len(HISTORY_TEXTS)
+    assert [call for call, _ in repository.calls] == ["page_analyses", "count_analyses"]
+
+
+def test_history_cursor_walks_every_row_once(client):
+    ids = seed_history(client)
+    seen, cursor = [], None
+    while True:
+        params = {"limit": 2, **({"cursor": cursor} if cursor else {})}
+        body = client.get("/api/analysis/history", params=params).json()
+        seen.extend(item["id"] for item in body["analyses"])
+        cursor = body["next_cursor"]
+        if cursor is None:
+            break
+
+    assert seen == list(reversed(ids))
+
+
+@pytest.mark.parametrize("position", [
+    ('2024-01-01",id.gt."0', str(uuid.uuid4())),
+    ("2024-01-01T00:00:00+00:00", 'x",user_id.neq."y'),
+    ("ayer", str(uuid.uuid4())),
+])
+def test_history_rejects_cursor_values_that_are_not_a_timestamp_and_uuid(client, repository, position):
+    response = client.get("/api/analysis/history", params={"cursor": encode_cursor(*position)})
+
+    assert response.status_code == 400
+    assert repository.calls == []
+
+
+def test_history_cursor_is_normalised_before_querying(client, repository):
+    analysis_id = str(uuid.uuid4())
+    cursor = encode_cursor("2024-05-01T10:00:00.12345Z", analysis_id.upper())
+    response = client.get("/api/analysis/history", params={"cursor": cursor})
+
+    assert response.status_code == 200
+    assert repository.calls[0][1]["after"] == ("2024-05-01T10:00:00.123450+00:00", analysis_id)
+
+
+def test_search_cursor_walks_results_by_rank(client):
+    seed_history(client)
+    first = client.get("/api/analysis/search", params={"q": "entrega", "limit": 3}).json()
+    second = client.get("/api/analysis/search", params={
+        "q": "entrega", "limit": 3, "cursor": first["next_cursor"]
+    }).json()
+
+    ids = [item["id"] for item in first["analyses"] + second["analyses"]]
+    assert len(ids) == len(set(ids)) == len(HISTORY_TEXTS)
+    assert second["next_cursor"] is None
+
+
+@pytest.mark.parametrize("position", [
+    ("nan", "2024-01-01T00:00:00+00:00", str(uuid.uuid4())),
+    ("1.0", '2024-01-01",id.gt."0', str(uuid.uuid4())),
+    ("1.0", "2024-01-01T00:00:00+00:00", "no-es-un-uuid"),
+])
+def test_search_rejects_invalid_cursor_values(client, repository, position):
+    response = client.get("/api/analysis/search", params={"q": "entrega", "cursor": encode_cursor(*position)})
+
+    assert response.status_code == 400
+    assert repository.calls == []
+
+
+def test_search_matches_original_text_only_when_requested(client):
+    analyze(client, text="La factura llegó con un importe incorrecto.")
+
+    plain = client.get("/api/analysis/search", params={"q": "factura"}).json()
+    with_text = client.get("/api/analysis/search", params={"q": "factura", "include_text": "true"}).json()
+
+    assert plain["analyses"] == []
+    assert len(with_text["analyses"]) == 1
+    assert "original_text" not in with_text["analyses"][0]
+
+
+def test_search_requires_a_query(client, repository):
+    assert client.get("/api/analysis/search").status_code == 422
+    assert client.get("/api/analysis/search", params={"q": "x" * 201}).status_code == 422
+    assert repository.calls == []
+
+
+@pytest.mark.parametrize("path", ["", "/detail", "/similar"])
+def test_non_uuid_analysis_id_is_rejected(client, repository, path):
+    response = client.get(f"/api/analysis/history/1,2{path}")
+
+    assert response.status_code == 400
+    assert repository.calls == []
+
+
+def test_get_analysis_accepts_a_valid_id(client):
+    analysis_id = seed_history(client, HISTORY_TEXTS[:1])[0]
+
+    assert client.get(f"/api/analysis/history/{analysis_id}").json()["id"] == analysis_id
+    assert client.get(f"/api/analysis/history/{uuid.uuid4()}").status_code == 404
+
+
+def test_parse_timestamp_accepts_postgres_fractions_and_z():
+    assert parse_timestamp("2024-05-01T10:00:00.1Z") == parse_timestamp("2024-05-01T10:00:00.100000+00:00")
+    assert parse_timestamp("2024-05-01T10:00:00.1234567+00:00").microsecond == 123456
+
+
+# =====================================================
+# ESTADÍSTICAS
+# =====================================================
+
+def test_stats_are_read_from_the_aggregates_in_one_call(client, repository):
+    seed_history(client, HISTORY_TEXTS[:2])
+    analyze(client)
+    response = client.get("/api/analysis/stats")
+
+    body = response.json()
+    assert response.status_code == 200
+    assert body["total_analyses"] == 3
+    assert body["analyses_this_month"] == 3
+    assert sum(body["sentiment_distribution"].values()) == 3
+    assert "prueba" in body["most_common_keywords"]
+    assert 0 <= body["average_confidence"] <= 1
+    assert [call for call, _ in repository.calls] == ["get_analysis_stats"]
+
+
+def test_stats_for_a_user_without_analyses(client):
+    body = client.get("/api/analysis/stats").json()
+
+    assert body["total_analyses"] == 0
+    assert body["most_common_keywords"] == []
+    assert body["average_confidence"] == 0
@@ -0,0 +1,151 @@
+"""
+Pruebas de la verificación local de tokens de Supabase
+"""
+
+import time
+
+import pytest
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from fastapi import HTTPException
+from jose import JWTError, jwk, jwt
+
+from config import settings
+from services.auth import DEVELOPMENT_USER_ID, TokenVerifier, get_current_user_id
+
+SECRET = "secreto-de-pruebas"
+AUDIENCE = "authenticated"
+
+
+def make_verifier(jwks=None) -> TokenVerifier:
+    verifier = TokenVerifier(
+        jwt_secret=SECRET,
+        jwks_url="http://supabase.test/auth/v1/.well-known/jwks.json",
+        audience=AUDIENCE,
+        cache_entries=16,
+        cache_ttl=60,
+        jwks_ttl=60,
+    )
+
+    async def get_jwks():
+        return jwks or {"keys": []}
+
+    verifier._get_jwks = get_jwks
+    return verifier
+
+
+def claims(**overrides):
+    return {"sub": "user-1", "aud": AUDIENCE, "exp": int(time.time()) + 60, **overrides}
+
+
+def rsa_key_pair():
+    private = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    pem = private.private_bytes(
+        serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8, serialization.NoEncryption()
+    )
+    public = jwk.construct(pem, "RS256").public_key().to_dict()
+    return pem, public
+
+
+@pytest.mark.asyncio
+async def test_valid_hs256_token():
+    token = jwt.encode(claims(), SECRET, algorithm="HS256")
+
+    assert (await make_verifier().verify(token))["sub"] == "user-1"
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("algorithm", ["HS384", "HS512"])
+async def test_other_hmac_algorithms_are_rejected(algorithm):
+    token = jwt.encode(claims(), SECRET, algorithm=algorithm)
+
+    with pytest.raises(JWTError, match="no permitido"):
+        await make_verifier().verify(token)
+
+
+@pytest.mark.asyncio
+async def test_unsigned_token_is_rejected():
+    unsigned = jwt.encode(claims(), SECRET, algorithm="HS256", headers={"alg": "none"})
+
+    with pytest.raises(JWTError, match="no permitido"):
+        await make_verifier().verify(unsigned)
+
+
+@pytest.mark.asyncio
+async def test_wrong_audience_is_rejected():
+    token = jwt.encode(claims(aud="otra"), SECRET, algorithm="HS256")
+
+    with pytest.raises(JWTError):
+        await make_verifier().verify(token)
+
+
+@pytest.mark.asyncio
+async def test_cached_token_still_expires(monkeypatch):
+    verifier = make_verifier()
+    token = jwt.encode(claims(), SECRET, algorithm="HS256")
+    await verifier.verify(token)
+
+    later = time.time() + 120
+    monkeypatch.setattr(time, "time", lambda: later)
+    with pytest.raises(JWTError, match="expirado"):
+        await verifier.verify(token)
+
+
+@pytest.mark.asyncio
+async def test_rs256_token_verified_with_jwks():
+    pem, public = rsa_key_pair()
+    token = jwt.encode(claims(), pem, algorithm="RS256", headers={"kid": "k1"})
+
+    verifier = make_verifier({"keys": [{**public, "kid": "k1", "alg": "RS256"}]})
+
+    assert (await verifier.verify(token))["sub"] == "user-1"
+
+
+@pytest.mark.asyncio
+async def test_token_alg_must_match_the_jwk_alg():
+    pem, public = rsa_key_pair()
+    token = jwt.encode(claims(), pem, algorithm="RS256", headers={"kid": "k1"})
+
+    verifier = make_verifier({"keys": [{**public, "kid": "k1", "alg": "ES256"}]})
+
+    with pytest.raises(JWTError, match="no coincide"):
+        await verifier.verify(token)
+
+
+@pytest.mark.asyncio
+async def test_unknown_kid_is_rejected():
+    pem, _ = rsa_key_pair()
+    token = jwt.encode(claims(), pem, algorithm="RS256", headers={"kid": "desconocida"})
+
+    with pytest.raises(JWTError, match="desconocida"):
+        await make_verifier().verify(token)
+
+
+# =====================================================
+# USUARIO DE DESARROLLO
+# =====================================================
+
+@pytest.mark.asyncio
+async def test_anonymous_request_is_rejected_by_default():
+    with pytest.raises(HTTPException) as error:
+        await get_current_user_id(None)
+
+    assert error.value.status_code == 401
+
+
+@pytest.mark.asyncio
+async def test_dev_user_requires_explicit_opt_in(monkeypatch):
+    monkeypatch.setattr(settings, "AUTH_DEV_USER_ENABLED", True)
+
+    assert await get_current_user_id(None) == DEVELOPMENT_USER_ID
+
+
+@pytest.mark.asyncio
+async def test_dev_user_is_never_used_in_production(monkeypatch):
+    monkeypatch.setattr(settings, "AUTH_DEV_USER_ENABLED", True)
+    monkeypatch.setattr(settings, "ENVIRONMENT", "production")
+
+    with pytest.raises(HTTPException) as error:
+        await get_current_user_id(None)
+
+    assert error.value.status_code == 401
@@ -0,0 +1,41 @@
+"""
+Pruebas del empaquetado de textos del endpoint por lotes
+"""
+
+from api.analysis import pack_texts
+
+
+def test_pack_texts_groups_until_char_budget():
+    items = [(0, "a" * 40), (1, "b" * 40), (2, "c" * 40)]
+
+    packs = pack_texts(items, max_chars=100, max_items=10)
+
+    assert packs == [[(0, "a" * 40), (1, "b" * 40)], [(2, "c" * 40)]]
+
+
+def test_pack_texts_respects_max_items():
+    items = [(index, "texto") for index in range(5)]
+
+    packs = pack_texts(items, max_chars=1000, max_items=2)
+
+    assert [len(pack) for pack in packs] == [2, 2, 1]
+
+
+def test_pack_texts_keeps_oversized_text_alone():
+    items = [(0, "corto"), (1, "x" * 500), (2, "corto")]
+
+    packs = pack_texts(items, max_chars=100, max_items=10)
+
+    assert packs == [[(0, "corto")], [(1, "x" * 500)], [(2, "corto")]]
+
+
+def test_pack_texts_preserves_order_and_indexes():
+    items = [(7, "uno"), (3, "dos"), (9, "tres")]
+
+    packs = pack_texts(items, max_chars=1000, max_items=10)
+
+    assert [index for pack in packs for index, _ in pack] == [7, 3, 9]
+
+
+def test_pack_texts_empty():
+    assert pack_texts([], max_chars=100, max_items=10) == []
@@ -0,0 +1,141 @@
+"""
+Pruebas de la división de documentos largos y la fusión de resultados
+"""
+
+import asyncio
+
+import pytest
+
+from api import analysis
+from models import AnalysisMode
+from services.chunking import CHARS_PER_TOKEN, merge_keywords, merge_sentiments, split_into_chunks
+
+
+# =====================================================
+# DIVISIÓN
+# =====================================================
+
+def test_short_text_is_a_single_chunk():
+    assert split_into_chunks("Un párrafo.\n\nOtro párrafo.", max_tokens=100) == ["Un párrafo.\n\nOtro párrafo."]
+
+
+def test_paragraphs_are_grouped_without_exceeding_the_budget():
+    paragraphs = [f"Párrafo {index} " + "x" * 30 for index in range(10)]
+    max_tokens = 25
+
+    chunks = split_into_chunks("\n\n".join(paragraphs), max_tokens)
+
+    assert len(chunks) > 1
+    assert all(len(chunk) <= max_tokens * CHARS_PER_TOKEN for chunk in chunks)
+    # Los párrafos no se parten y conservan el orden
+    assert "\n\n".join(chunks).split("\n\n") == paragraphs
+
+
+def test_oversized_paragraph_is_split_by_sentences():
+    sentences = [f"Oración número {index} del párrafo." for index in range(20)]
+
+    chunks = split_into_chunks(" ".join(sentences), max_tokens=30)
+
+    assert all(len(chunk) <= 30 * CHARS_PER_TOKEN for chunk in chunks)
+    assert " ".join(" ".join(chunks).split()) == " ".join(sentences)
+
+
+def test_oversized_sentence_is_split_by_words():
+    sentence = " ".join(f"palabra{index}" for index in range(200))
+
+    chunks = split_into_chunks(sentence, max_tokens=10)
+
+    assert all(len(chunk) <= 10 * CHARS_PER_TOKEN for chunk in chunks)
+    assert " ".join(chunks).split() == sentence.split()
+
+
+def test_blank_text_has_no_chunks():
+    assert split_into_chunks("\n\n  \n\n", max_tokens=100) == []
+
+
+# =====================================================
+# FUSIÓN
+# =====================================================
+
+def test_merge_keywords_ranks_by_position_and_weight():
+    merged = merge_keywords([["clima", "lluvia"], ["Clima", "sol"], ["sol"]], weights=[100, 100, 100])
+
+    # "clima" suma 100 + 100, "sol" 50 + 100, "lluvia" 50
+    assert merged == ["clima", "sol", "lluvia"]
+
+
+def test_merge_keywords_deduplicates_ignoring_case_and_keeps_first_spelling():
+    merged = merge_keywords([["  Madrid "], ["madrid", ""]], weights=[1, 1])
+
+    assert merged == ["Madrid"]
+
+
+def test_merge_keywords_respects_limit():
+    merged = merge_keywords([[f"k{index}" for index in range(20)]], weights=[1], limit=5)
+
+    assert merged == ["k0", "k1", "k2", "k3", "k4"]
+
+
+def test_merge_sentiments_weights_by_length_and_confidence():
+    sentiments = [
+        {"label": "positive", "confidence": 0.9},
+        {"label": "negative", "confidence": 0.9},
+        {"label": "negative", "confidence": 0.5},
+    ]
+
+    merged = merge_sentiments(sentiments, weights=[1000, 300, 300])
+
+    # positive: 900, negative: 270 + 150 = 420, sobre un peso total de 1600
+    assert merged == {"label": "positive", "confidence": 0.56}
+
+
+def test_merge_sentiments_without_results_is_neutral():
+    assert merge_sentiments([], weights=[]) == {"label": "neutral", "confidence": 0.0}
+
+
+# =====================================================
+# MAP CON CONCURRENCIA ACOTADA
+# =====================================================
+
+@pytest.mark.asyncio
+async def test_analyze_chunks_bounds_concurrency_and_falls_back(monkeypatch):
+    monkeypatch.setattr(analysis.settings, "LONG_DOC_MAX_CONCURRENCY", 3)
+    active = peak = 0
+
+    async def analyze_single(chunk, mode, quality):
+        nonlocal active, peak
+        active += 1
+        peak = max(peak, active)
+        await asyncio.sleep(0.01)
+        active -= 1
+        if chunk == "falla":
+            raise RuntimeError("Gemini saturado")
+        return {"summary": chunk, "engine": "gemini"}
+
+    async def local_analysis(chunk):
+        return {"summary": chunk, "engine": "local"}
+
+    monkeypatch.setattr(analysis, "analyze_single", analyze_single)
+    monkeypatch.setattr(analysis, "local_analysis", local_analysis)
+
+    chunks = ["ok"] * 9 + ["falla"]
+    outcomes = await analysis.analyze_chunks(chunks, AnalysisMode.LLM)
+
+    assert peak == 3
+    assert [outcome["engine"] for outcome in outcomes] == ["gemini"] * 9 + ["local"]
+
+
+@pytest.mark.asyncio
+async def test_analyze_chunks_reports_failed_chunk_as_none(monkeypatch):
+    monkeypatch.setattr(analysis.settings, "LOCAL_FALLBACK_ENABLED", False)
+
+    async def analyze_single(chunk, mode, quality):
+        if chunk == "falla":
+            raise RuntimeError("Gemini saturado")
+        return {"summary": chunk}
+
+    monkeypatch.setattr(analysis, "analyze_single", analyze_single)
+
+    outcomes = await analysis.analyze_chunks(["ok", "falla", "ok"], AnalysisMode.LLM)
+
+    assert outcomes == [{"summary": "ok"}, None, {"summary": "ok"}]
@@ -0,0 +1,78 @@
+"""
+Pruebas de la coalescencia de peticiones idénticas (single-flight)
+"""
+
+import asyncio
+
+import pytest
+
+from services.coalescing import SingleFlight
+
+
+@pytest.mark.asyncio
+async def test_concurrent_calls_share_one_execution():
+    flight = SingleFlight()
+    calls = 0
+
+    async def work():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return {"id": "a1"}
+
+    results = await asyncio.gather(*(flight.do("clave", work) for _ in range(5)))
+
+    assert calls == 1
+    assert all(result is results[0] for result in results)
+    assert len(flight) == 0
+
+
+@pytest.mark.asyncio
+async def test_different_keys_run_separately():
+    flight = SingleFlight()
+
+    async def work(value):
+        await asyncio.sleep(0.01)
+        return value
+
+    assert await asyncio.gather(flight.do("a", lambda: work(1)), flight.do("b", lambda: work(2))) == [1, 2]
+
+
+@pytest.mark.asyncio
+async def test_exception_is_shared_and_the_key_is_released():
+    flight = SingleFlight()
+    calls = 0
+
+    async def failing():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        raise RuntimeError("Gemini caído")
+
+    results = await asyncio.gather(flight.do("clave", failing), flight.do("clave", failing), return_exceptions=True)
+
+    assert calls == 1
+    assert all(isinstance(result, RuntimeError) for result in results)
+    # Una vez terminada, la siguiente llamada vuelve a ejecutar el trabajo
+    with pytest.raises(RuntimeError):
+        await flight.do("clave", failing)
+    assert calls == 2
+
+
+@pytest.mark.asyncio
+async def test_cancelled_caller_does_not_cancel_the_shared_work():
+    flight = SingleFlight()
+    finished = asyncio.Event()
+
+    async def work():
+        await asyncio.sleep(0.05)
+        finished.set()
+        return "hecho"
+
+    first = asyncio.ensure_future(flight.do("clave", work))
+    second = asyncio.ensure_future(flight.do("clave", work))
+    await asyncio.sleep(0.01)
+    first.cancel()
+
+    assert await second == "hecho"
+    assert finished.is_set()
@@ -0,0 +1,28 @@
+"""
+El arranque en frío no debe importar dependencias pesadas que solo hacen
+falta en la primera llamada real
+"""
+
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+backend_dir = Path(__file__).parent.parent
+
+
+def test_importing_the_app_does_not_load_heavy_modules():
+    script = (
+        "import sys; import api.main; "
+        "print(','.join(m for m in ('numpy', 'google.generativeai', 'jose') if m in sys.modules))"
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", script],
+        cwd=backend_dir,
+        env={**os.environ, "PYTHONPATH": str(backend_dir)},
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+
+    assert result.stdout.strip() == ""
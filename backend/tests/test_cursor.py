@@ -0,0 +1,42 @@
+"""
+Pruebas del cursor opaco de la paginación por keyset
+"""
+
+import base64
+import json
+
+import pytest
+from fastapi import HTTPException
+
+from api.analysis import decode_cursor, encode_cursor
+
+POSITION = ("2024-05-01T10:00:00.123456+00:00", "633a8bbc-6727-426b-ad97-a497fbb15653")
+
+
+def test_cursor_round_trip():
+    assert decode_cursor(encode_cursor(*POSITION)) == POSITION
+
+
+def test_cursor_is_url_safe_without_padding():
+    cursor = encode_cursor(*POSITION, "0.87")
+
+    assert "=" not in cursor and "+" not in cursor and "/" not in cursor
+    assert decode_cursor(cursor, size=3) == (*POSITION, "0.87")
+
+
+def test_cursor_values_are_strings():
+    assert decode_cursor(encode_cursor(0.5, 42)) == ("0.5", "42")
+
+
+@pytest.mark.parametrize("cursor", [
+    "no es base64 !!",
+    base64.urlsafe_b64encode(b"no es json").decode(),
+    base64.urlsafe_b64encode(json.dumps({"created_at": "x"}).encode()).decode(),
+    encode_cursor("solo-uno"),
+    encode_cursor("a", "b", "c"),
+])
+def test_invalid_cursor_is_rejected_with_400(cursor):
+    with pytest.raises(HTTPException) as error:
+        decode_cursor(cursor)
+
+    assert error.value.status_code == 400
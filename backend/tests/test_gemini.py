@@ -0,0 +1,44 @@
+"""
+Pruebas del gateway de Gemini (sin llamadas de red: el SDK se sustituye)
+"""
+
+import time
+
+import pytest
+
+from services.gemini import GeminiGateway, GeminiTimeoutError
+from services.resilience import CircuitBreaker, CircuitOpenError
+
+
+def make_gateway():
+    gateway = GeminiGateway(api_key="test-key", max_concurrency=4, max_queue=4, queue_timeout=1, call_timeout=1)
+    gateway.retry_base_delay = 0
+    return gateway
+
+
+@pytest.mark.asyncio
+async def test_embedding_timeouts_do_not_open_the_generation_circuit():
+    gateway = make_gateway()
+
+    def slow_embed(**kwargs):
+        time.sleep(0.05)
+        return {"embedding": [[0.0]]}
+
+    gateway._genai.embed_content = slow_embed
+    for _ in range(gateway.embed_breaker.min_calls):
+        with pytest.raises(GeminiTimeoutError):
+            await gateway.embed(["texto"], "models/text-embedding-004", timeout=0.01, max_retries=0)
+
+    assert gateway.embed_breaker.state == CircuitBreaker.OPEN
+    assert gateway.breaker.state == CircuitBreaker.CLOSED
+    with pytest.raises(CircuitOpenError):
+        await gateway.embed(["texto"], "models/text-embedding-004", max_retries=0)
+
+
+@pytest.mark.asyncio
+async def test_embeddings_do_not_feed_the_hedging_latencies():
+    gateway = make_gateway()
+    gateway._genai.embed_content = lambda **kwargs: {"embedding": [[0.1], [0.2]]}
+
+    assert await gateway.embed(["a", "b"], "models/text-embedding-004") == [[0.1], [0.2]]
+    assert len(gateway.latency) == 0
@@ -0,0 +1,187 @@
+"""
+Pruebas de la cola de trabajos y de las reservas (lease) del almacén compartido
+"""
+
+import asyncio
+
+import pytest
+
+from services.jobs import (
+    JOB_FAILED,
+    JOB_QUEUED,
+    JOB_RUNNING,
+    JOB_SUCCEEDED,
+    InMemoryJobStore,
+    JobQueue,
+    JobQueueFullError,
+    SupabaseJobStore,
+)
+
+LEASE_SECONDS = 30
+MAX_ATTEMPTS = 2
+
+
+class FakeJobRepository:
+    """
+    Tabla analysis_jobs en memoria. claim_job reproduce la función
+    claim_analysis_job de database.sql con un reloj que avanzan las pruebas.
+    """
+
+    def __init__(self):
+        self.jobs = {}
+        self.now = 0.0
+        self.reads = 0
+
+    async def insert_job(self, job):
+        self.jobs[job["id"]] = {**job, "attempts": 0, "locked_until": None}
+
+    async def get_job(self, job_id, columns="*"):
+        self.reads += 1
+        job = self.jobs.get(job_id)
+        return dict(job) if job is not None else None
+
+    async def update_job(self, job_id, fields):
+        self.jobs[job_id].update(fields)
+
+    async def count_jobs(self, status):
+        return sum(job["status"] == status for job in self.jobs.values())
+
+    def _expired(self, job):
+        return job["status"] == JOB_RUNNING and job["locked_until"] < self.now
+
+    async def claim_job(self, lease_seconds, max_attempts):
+        for job in self.jobs.values():
+            if self._expired(job) and job["attempts"] >= max_attempts:
+                job.update(status=JOB_FAILED, error="Se agotaron los intentos", locked_until=None)
+        pending = [job for job in self.jobs.values() if job["status"] == JOB_QUEUED or self._expired(job)]
+        if not pending:
+            return None
+        job = min(pending, key=lambda job: job["created_at"])
+        job.update(status=JOB_RUNNING, attempts=job["attempts"] + 1, locked_until=self.now + lease_seconds)
+        return dict(job)
+
+
+@pytest.fixture
+def repository():
+    return FakeJobRepository()
+
+
+@pytest.fixture
+def store(repository):
+    return SupabaseJobStore(repository, LEASE_SECONDS, MAX_ATTEMPTS)
+
+
+async def wait_for_status(queue, job_id, status):
+    for _ in range(200):
+        job = await queue.get(job_id)
+        if job["status"] == status:
+            return job
+        await asyncio.sleep(0.01)
+    raise AssertionError(f"El trabajo no llegó a {status}: {job}")
+
+
+# =====================================================
+# RESERVAS DEL ALMACÉN COMPARTIDO
+# =====================================================
+
+@pytest.mark.asyncio
+async def test_claim_takes_the_oldest_queued_job_under_a_lease(repository, store):
+    queue = JobQueue(store, workers=0, max_size=10)
+    first = await queue.submit("user-1", {"text": "primero"})
+    await queue.submit("user-1", {"text": "segundo"})
+
+    claimed = await store.claim()
+
+    assert claimed["id"] == first["id"]
+    assert claimed["attempts"] == 1
+    assert claimed["locked_until"] == repository.now + LEASE_SECONDS
+    assert (await store.claim())["id"] != first["id"]
+    assert await store.claim() is None
+
+
+@pytest.mark.asyncio
+async def test_expired_lease_is_claimed_again(repository, store):
+    job = await JobQueue(store, workers=0, max_size=10).submit("user-1", {"text": "hola"})
+    await store.claim()
+
+    # Mientras la reserva está vigente, ningún otro worker lo toma
+    repository.now += LEASE_SECONDS - 1
+    assert await store.claim() is None
+
+    # El host que lo reservó murió: al vencer la reserva se vuelve a reservar
+    repository.now += 2
+    reclaimed = await store.claim()
+    assert reclaimed["id"] == job["id"]
+    assert reclaimed["attempts"] == 2
+
+
+@pytest.mark.asyncio
+async def test_job_fails_after_max_attempts(repository, store):
+    job = await JobQueue(store, workers=0, max_size=10).submit("user-1", {"text": "hola"})
+    for _ in range(MAX_ATTEMPTS):
+        assert await store.claim() is not None
+        repository.now += LEASE_SECONDS + 1
+
+    assert await store.claim() is None
+    failed = await store.get(job["id"])
+    assert failed["status"] == JOB_FAILED
+    assert failed["error"] == "Se agotaron los intentos"
+
+
+@pytest.mark.asyncio
+async def test_finished_job_releases_its_lease(repository, store):
+    job = await JobQueue(store, workers=0, max_size=10).submit("user-1", {"text": "hola"})
+    await store.claim()
+    await store.update(job["id"], status=JOB_SUCCEEDED, result={"ok": True})
+
+    repository.now += LEASE_SECONDS + 1
+    assert repository.jobs[job["id"]]["locked_until"] is None
+    assert await store.claim() is None
+
+
+@pytest.mark.asyncio
+async def test_shared_store_rejects_non_uuid_ids_without_querying(repository, store):
+    assert await store.get("1,2") is None
+    assert repository.reads == 0
+
+
+@pytest.mark.asyncio
+async def test_shared_queue_counts_queued_jobs_against_max_size(store):
+    queue = JobQueue(store, workers=0, max_size=1)
+    await queue.submit("user-1", {"text": "uno"})
+
+    with pytest.raises(JobQueueFullError):
+        await queue.submit("user-1", {"text": "dos"})
+
+
+# =====================================================
+# WORKERS
+# =====================================================
+
+@pytest.mark.asyncio
+async def test_shared_worker_processes_claimed_jobs(store):
+    queue = JobQueue(store, workers=1, max_size=10, poll_interval=0.01)
+    queue.set_handler(lambda job: asyncio.sleep(0, result={"echo": job["payload"]["text"]}))
+    try:
+        job = await queue.submit("user-1", {"text": "hola"})
+        done = await wait_for_status(queue, job["id"], JOB_SUCCEEDED)
+    finally:
+        await queue.stop()
+
+    assert done["result"] == {"echo": "hola"}
+
+
+@pytest.mark.asyncio
+async def test_handler_error_marks_the_job_failed():
+    async def failing(job):
+        raise ValueError("texto inválido")
+
+    queue = JobQueue(InMemoryJobStore(10), workers=1, max_size=10)
+    queue.set_handler(failing)
+    try:
+        job = await queue.submit("user-1", {"text": "hola"})
+        failed = await wait_for_status(queue, job["id"], JOB_FAILED)
+    finally:
+        await queue.stop()
+
+    assert failed["error"] == "texto inválido"
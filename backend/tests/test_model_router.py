@@ -0,0 +1,154 @@
+"""
+Pruebas del router de modelos
+"""
+
+import pytest
+
+from config import settings
+from services.gemini import GeminiTimeoutError
+from services.model_router import ECONOMY, HIGH, STANDARD, ModelRouter
+
+
+class ProviderError(Exception):
+    def __init__(self, code):
+        super().__init__(f"HTTP {code}")
+        self.code = code
+
+
+def make_router(**overrides):
+    options = {
+        "tiers": {ECONOMY: "lite", STANDARD: "flash", HIGH: "pro"},
+        "fallback": "backup",
+        "short_chars": 100,
+        "latency_slo": 5,
+        "probe_every": 3,
+        **overrides,
+    }
+    return ModelRouter(**options)
+
+
+class Recorder:
+    """call(modelo, timeout, max_retries) que falla según el modelo"""
+
+    def __init__(self, errors=None):
+        self.errors = errors or {}
+        self.calls = []
+
+    async def __call__(self, model, timeout, max_retries):
+        self.calls.append((model, timeout, max_retries))
+        if model in self.errors:
+            raise self.errors[model]
+        return f"respuesta de {model}"
+
+
+def test_default_models_are_not_retired():
+    for model in (settings.MODEL_ECONOMY, settings.MODEL_STANDARD, settings.MODEL_HIGH, settings.MODEL_FALLBACK):
+        assert not model.startswith(("gemini-1.", "gemini-pro"))
+
+
+# =====================================================
+# CALIDAD Y TAMAÑO
+# =====================================================
+
+@pytest.mark.parametrize("length, quality, model", [
+    (50, STANDARD, "lite"),
+    (500, STANDARD, "flash"),
+    (500, ECONOMY, "lite"),
+    (50, HIGH, "pro"),
+    (5000, HIGH, "pro"),
+])
+def test_quality_and_size_choose_the_primary(length, quality, model):
+    assert make_router().candidates(length, quality) == [model, "backup"]
+
+
+def test_no_fallback_configured():
+    assert make_router(fallback="").candidates(500) == ["flash"]
+    assert make_router(fallback="flash").candidates(500) == ["flash"]
+
+
+# =====================================================
+# FAILOVER
+# =====================================================
+
+@pytest.mark.asyncio
+async def test_primary_is_tried_first_with_the_slo_and_no_retries():
+    call = Recorder()
+
+    result, model = await make_router().call(500, STANDARD, call)
+
+    assert (result, model) == ("respuesta de flash", "flash")
+    assert call.calls == [("flash", 5, 0)]
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("error", [GeminiTimeoutError("lento"), ProviderError(503), ProviderError(429)])
+async def test_transient_failure_fails_over_to_the_fallback(error):
+    call = Recorder({"flash": error})
+
+    _, model = await make_router().call(500, STANDARD, call)
+
+    assert model == "backup"
+    # El último intento usa el timeout y los reintentos por defecto del gateway
+    assert call.calls == [("flash", 5, 0), ("backup", None, None)]
+
+
+@pytest.mark.asyncio
+async def test_client_error_does_not_fail_over():
+    call = Recorder({"flash": ProviderError(400)})
+
+    with pytest.raises(ProviderError):
+        await make_router().call(500, STANDARD, call)
+    assert [model for model, _, _ in call.calls] == ["flash"]
+
+
+@pytest.mark.asyncio
+async def test_last_candidate_error_is_raised():
+    call = Recorder({"flash": ProviderError(503), "backup": ProviderError(503)})
+
+    with pytest.raises(ProviderError):
+        await make_router().call(500, STANDARD, call)
+
+
+@pytest.mark.asyncio
+async def test_slow_primary_is_demoted_and_probed_periodically():
+    router = make_router()
+    for _ in range(10):
+        router.record("flash", 9)
+
+    orders = [router.candidates(500) for _ in range(6)]
+
+    assert orders.count(["backup", "flash"]) == 4
+    assert orders[2] == orders[5] == ["flash", "backup"]
+
+
+# =====================================================
+# MODELO INEXISTENTE
+# =====================================================
+
+@pytest.mark.asyncio
+async def test_unknown_model_fails_over_and_is_tried_last_afterwards():
+    router = make_router()
+    call = Recorder({"pro": ProviderError(404)})
+
+    _, model = await router.call(50, HIGH, call)
+
+    assert model == "backup"
+    assert router.candidates(50, HIGH) == ["backup", "pro"]
+
+
+@pytest.mark.asyncio
+async def test_unknown_model_is_restored_when_it_answers_again():
+    router = make_router()
+    await router.call(50, HIGH, Recorder({"pro": ProviderError(404)}))
+
+    await router.call(50, HIGH, Recorder({"backup": ProviderError(503)}))
+
+    assert router.candidates(50, HIGH) == ["pro", "backup"]
+
+
+@pytest.mark.asyncio
+async def test_unknown_fallback_is_raised():
+    call = Recorder({"flash": ProviderError(503), "backup": ProviderError(404)})
+
+    with pytest.raises(ProviderError):
+        await make_router().call(500, STANDARD, call)
@@ -0,0 +1,104 @@
+"""
+Pruebas del límite de uso por tokens
+"""
+
+import pytest
+
+from services import rate_limit
+from services.rate_limit import GLOBAL_BUCKET, BucketSpec, InMemoryBuckets, RateLimiter
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Reloj controlado para la recarga de los buckets"""
+    now = [1000.0]
+    monkeypatch.setattr(rate_limit.time, "monotonic", lambda: now[0])
+    return now
+
+
+def make_limiter(user_capacity=100, user_rate=10, global_capacity=1000, global_rate=100, max_buckets=100):
+    return RateLimiter(
+        InMemoryBuckets(max_buckets),
+        user_spec=BucketSpec(user_capacity, user_rate),
+        global_spec=BucketSpec(global_capacity, global_rate),
+    )
+
+
+@pytest.mark.asyncio
+async def test_buckets_charge_all_or_nothing(clock):
+    buckets = InMemoryBuckets(10)
+    specs = [BucketSpec(100, 1), BucketSpec(30, 1)]
+
+    allowed, levels = await buckets.consume(["a", "b"], specs, 50)
+
+    assert not allowed
+    # Ninguno de los dos se cobró
+    assert levels == [100, 30]
+    allowed, levels = await buckets.consume(["a", "b"], specs, 20)
+    assert allowed and levels == [80, 10]
+
+
+@pytest.mark.asyncio
+async def test_buckets_refill_over_time_up_to_capacity(clock):
+    buckets = InMemoryBuckets(10)
+    spec = BucketSpec(100, 10)
+    await buckets.consume(["a"], [spec], 100)
+
+    clock[0] += 3
+    assert (await buckets.consume(["a"], [spec], 0))[1] == [30]
+    clock[0] += 60
+    assert (await buckets.consume(["a"], [spec], 0))[1] == [100]
+
+
+@pytest.mark.asyncio
+async def test_buckets_evict_least_recently_used(clock):
+    buckets = InMemoryBuckets(2)
+    spec = BucketSpec(100, 1)
+    for key in ("a", "b", "a", "c"):
+        await buckets.consume([key], [spec], 10)
+
+    assert (await buckets.consume(["a"], [spec], 0))[1] == [80]
+    # "b" se descartó: vuelve a empezar lleno
+    assert (await buckets.consume(["b"], [spec], 0))[1] == [100]
+
+
+@pytest.mark.asyncio
+async def test_limiter_reports_remaining_budget(clock):
+    decision = await make_limiter().acquire("user-1", 40)
+
+    assert decision.allowed
+    assert decision.headers() == {"X-RateLimit-Limit": "100", "X-RateLimit-Remaining": "60", "X-RateLimit-Reset": "4"}
+
+
+@pytest.mark.asyncio
+async def test_limiter_rejects_with_retry_after(clock):
+    limiter = make_limiter()
+    await limiter.acquire("user-1", 90)
+
+    decision = await limiter.acquire("user-1", 30)
+
+    assert not decision.allowed
+    # Faltan 20 tokens a 10 por segundo
+    assert decision.retry_after == pytest.approx(2)
+    assert decision.headers()["Retry-After"] == "2"
+
+
+@pytest.mark.asyncio
+async def test_users_do_not_share_budget_but_share_the_global_one(clock):
+    limiter = make_limiter(global_capacity=150)
+    await limiter.acquire("user-1", 100)
+
+    assert (await limiter.acquire("user-2", 40)).allowed
+    # El global se agota aunque user-3 no haya gastado nada
+    assert not (await limiter.acquire("user-3", 40)).allowed
+    assert limiter.buckets._buckets[GLOBAL_BUCKET][0] == 10
+
+
+@pytest.mark.asyncio
+async def test_request_larger_than_the_burst_costs_the_whole_burst(clock):
+    limiter = make_limiter()
+
+    decision = await limiter.acquire("user-1", 10_000)
+
+    assert decision.allowed
+    assert decision.remaining == 0
@@ -0,0 +1,155 @@
+"""
+Pruebas de reintentos, latencias y circuit breaker
+"""
+
+import asyncio
+
+import pytest
+
+from services import resilience
+from services.resilience import CircuitBreaker, CircuitOpenError, LatencyTracker, backoff_delay, is_retryable
+
+
+class ProviderError(Exception):
+    def __init__(self, code):
+        super().__init__(f"HTTP {code}")
+        self.code = code
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(resilience.time, "monotonic", lambda: now[0])
+    return now
+
+
+def make_breaker(**overrides):
+    options = {"error_rate": 0.5, "min_calls": 4, "window": 10, "cooldown": 30, **overrides}
+    return CircuitBreaker(**options)
+
+
+def record(breaker, outcomes):
+    for success in outcomes:
+        if success:
+            breaker.record_success()
+        else:
+            breaker.record_failure()
+
+
+def open_breaker(breaker):
+    for _ in range(breaker.min_calls):
+        breaker.before_call()
+        breaker.record_failure()
+    assert breaker.state == CircuitBreaker.OPEN
+
+
+# =====================================================
+# REINTENTOS
+# =====================================================
+
+@pytest.mark.parametrize("error, retryable", [
+    (asyncio.TimeoutError(), True),
+    (ProviderError(429), True),
+    (ProviderError(503), True),
+    (ProviderError(400), False),
+    (ProviderError(403), False),
+    (ValueError("respuesta inválida"), False),
+])
+def test_is_retryable(error, retryable):
+    assert is_retryable(error) is retryable
+
+
+def test_backoff_delay_is_capped_full_jitter():
+    delays = [backoff_delay(attempt, base=0.5, cap=4) for attempt in range(10) for _ in range(20)]
+
+    assert all(0 <= delay <= 4 for delay in delays)
+    assert all(backoff_delay(0, base=0.5, cap=4) <= 0.5 for _ in range(20))
+
+
+def test_latency_tracker_percentiles():
+    tracker = LatencyTracker(window=100)
+    assert tracker.percentile(95) is None
+
+    for value in range(1, 101):
+        tracker.record(float(value))
+
+    assert tracker.percentile(50) == 51.0
+    assert tracker.percentile(95) == 95.0
+
+
+# =====================================================
+# CIRCUIT BREAKER
+# =====================================================
+
+def test_breaker_needs_min_calls_before_opening(clock):
+    breaker = make_breaker()
+    record(breaker, [False] * 3)
+
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_breaker_opens_at_the_error_rate(clock):
+    breaker = make_breaker()
+    record(breaker, [True, True, False, False])
+
+    assert breaker.state == CircuitBreaker.OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+
+def test_breaker_stays_closed_below_the_error_rate(clock):
+    breaker = make_breaker()
+    record(breaker, [True, True, True, False, True, False])
+
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+def test_half_open_allows_a_single_probe(clock):
+    breaker = make_breaker()
+    open_breaker(breaker)
+
+    clock[0] += 30
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    breaker.before_call()
+    with pytest.raises(CircuitOpenError):
+        breaker.before_call()
+
+
+def test_successful_probe_closes_the_breaker(clock):
+    breaker = make_breaker()
+    open_breaker(breaker)
+    clock[0] += 30
+
+    breaker.before_call()
+    breaker.record_success()
+
+    assert breaker.state == CircuitBreaker.CLOSED
+    breaker.before_call()
+
+
+def test_failed_probe_reopens_for_another_cooldown(clock):
+    breaker = make_breaker()
+    open_breaker(breaker)
+    clock[0] += 30
+
+    breaker.before_call()
+    breaker.record_failure()
+
+    assert breaker.state == CircuitBreaker.OPEN
+    clock[0] += 29
+    assert breaker.state == CircuitBreaker.OPEN
+    clock[0] += 1
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+
+
+def test_ignored_probe_releases_the_probe_slot(clock):
+    breaker = make_breaker()
+    open_breaker(breaker)
+    clock[0] += 30
+
+    breaker.before_call()
+    breaker.record_ignored()
+
+    # Sigue en semiabierto y otra llamada puede hacer de prueba
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    breaker.before_call()
@@ -0,0 +1,68 @@
+"""
+Pruebas del separador resumen / JSON de la respuesta en streaming
+"""
+
+import pytest
+
+from api.analysis import STREAM_MARKER, SummaryStreamSplitter
+
+SUMMARY = "El cliente valora la rapidez del servicio."
+PAYLOAD = '{"keywords": ["servicio"], "sentiment": {"label": "positive", "confidence": 0.8}}'
+RESPONSE = f"{SUMMARY}\n{STREAM_MARKER}\n{PAYLOAD}"
+
+
+def feed_all(splitter, chunks):
+    return "".join(splitter.feed(chunk) for chunk in chunks)
+
+
+@pytest.mark.parametrize("size", [1, 2, 3, 5, 7, 11, len(RESPONSE)])
+def test_splits_summary_and_json_for_any_chunking(size):
+    splitter = SummaryStreamSplitter()
+    chunks = [RESPONSE[start:start + size] for start in range(0, len(RESPONSE), size)]
+
+    streamed = feed_all(splitter, chunks)
+    rest, summary, payload = splitter.finish()
+
+    assert rest == ""
+    assert (streamed + rest).strip() == SUMMARY
+    assert summary == SUMMARY
+    assert payload.strip() == PAYLOAD
+
+
+def test_never_emits_part_of_the_marker():
+    splitter = SummaryStreamSplitter()
+
+    emitted = [splitter.feed("Resumen ###"), splitter.feed("JS"), splitter.feed("ON###{}")]
+
+    assert "#" not in "".join(emitted)
+    assert "".join(emitted) == "Resumen "
+
+
+def test_holds_back_only_a_possible_marker_prefix():
+    splitter = SummaryStreamSplitter()
+    text = "Un resumen bastante largo ##"
+
+    emitted = splitter.feed(text)
+    # Se retiene la cola que podría ser el inicio del separador
+    assert emitted == text[:len(text) - len(STREAM_MARKER) + 1]
+    # No era el separador: se emite en cuanto llega más texto
+    assert emitted + splitter.feed(" y más" + " " * len(STREAM_MARKER)) == text + " y más "
+
+
+def test_nothing_is_emitted_after_the_marker():
+    splitter = SummaryStreamSplitter()
+    splitter.feed(f"Resumen{STREAM_MARKER}")
+
+    assert splitter.feed('{"keywords": []}') == ""
+    assert splitter.finish()[2] == '{"keywords": []}'
+
+
+def test_without_marker_finish_flushes_the_rest_as_summary():
+    splitter = SummaryStreamSplitter()
+
+    streamed = splitter.feed("Solo resumen")
+    rest, summary, payload = splitter.finish()
+
+    assert streamed + rest == "Solo resumen"
+    assert summary == "Solo resumen"
+    assert payload == ""
@@ -0,0 +1,138 @@
+"""
+Pruebas del decodificador de respuestas estructuradas de Gemini
+"""
+
+import json
+
+import pytest
+
+from services.structured_output import (
+    StructuredOutputError, decode_analysis, decode_batch_analysis, decode_json, extract_json,
+    missing_fields, normalize_analysis,
+)
+
+ANALYSIS = {
+    "summary": "El cliente está satisfecho.",
+    "keywords": ["servicio", "atención"],
+    "sentiment": {"label": "positive", "confidence": 0.92},
+}
+RAW = json.dumps(ANALYSIS, ensure_ascii=False)
+
+
+# =====================================================
+# EXTRACCIÓN Y REPARACIÓN
+# =====================================================
+
+@pytest.mark.parametrize("raw", [
+    RAW,
+    f"```json\n{RAW}\n```",
+    f"```\n{RAW}\n```",
+    f"Aquí tienes el análisis:\n{RAW}",
+    f"{RAW}\nEspero que sirva.",
+])
+def test_decodes_json_with_fences_or_surrounding_text(raw):
+    assert decode_json(raw) == ANALYSIS
+
+
+def test_text_without_json_is_an_error():
+    with pytest.raises(StructuredOutputError):
+        extract_json("No puedo analizar este texto.")
+
+
+def test_truncated_string_is_closed():
+    decoded = decode_json('{"summary": "El cliente está satisf')
+
+    assert decoded == {"summary": "El cliente está satisf"}
+
+
+def test_truncated_array_is_closed():
+    decoded = decode_json('{"summary": "Bien", "keywords": ["servicio", "aten')
+
+    assert decoded == {"summary": "Bien", "keywords": ["servicio", "aten"]}
+
+
+def test_truncated_after_key_gets_a_null_value():
+    decoded = decode_json('{"summary": "Bien", "keywords": ["a"], "sentiment": {"label": "positive", "confidence":')
+
+    assert decoded["sentiment"] == {"label": "positive", "confidence": None}
+    assert normalize_analysis(decoded)["sentiment"] == {"label": "positive", "confidence": 0.5}
+
+
+def test_truncated_batch_keeps_complete_items():
+    items = [{"index": 0, **ANALYSIS}, {"index": 1, **ANALYSIS}]
+    raw = json.dumps(items, ensure_ascii=False)
+    truncated = raw[:raw.rindex('"sentiment"') + 15]
+
+    decoded = decode_batch_analysis(truncated)
+
+    assert not missing_fields(decoded[0])
+    assert missing_fields(decoded.get(1, {})) == ["sentiment"]
+
+
+def test_unrecoverable_json_is_an_error():
+    with pytest.raises(StructuredOutputError):
+        decode_json('{"summary": }}}')
+
+
+# =====================================================
+# NORMALIZACIÓN
+# =====================================================
+
+def test_normalize_accepts_aliases_and_clamps_confidence():
+    analysis = normalize_analysis({
+        "summary": "  Resumen  ",
+        "keywords": "uno, Dos, dos, , tres",
+        "sentiment": {"label": "Negativo", "confidence": 3},
+    })
+
+    assert analysis == {
+        "summary": "Resumen",
+        "keywords": ["uno", "Dos", "tres"],
+        "sentiment": {"label": "negative", "confidence": 1.0},
+    }
+
+
+def test_normalize_drops_invalid_fields():
+    analysis = normalize_analysis({
+        "summary": "",
+        "keywords": [1, None],
+        "sentiment": {"label": "enfadado"},
+    })
+
+    assert analysis == {}
+    assert missing_fields(analysis) == ["summary", "keywords", "sentiment"]
+
+
+def test_normalize_sentiment_from_plain_label():
+    analysis = normalize_analysis({"sentiment": "neutro"})
+
+    assert analysis["sentiment"] == {"label": "neutral", "confidence": 0.5}
+
+
+def test_normalize_limits_keywords():
+    analysis = normalize_analysis({"keywords": [f"k{index}" for index in range(15)]})
+
+    assert len(analysis["keywords"]) == 10
+
+
+def test_decode_analysis_returns_empty_dict_on_garbage():
+    assert decode_analysis("Lo siento, no puedo ayudar con eso.") == {}
+
+
+# =====================================================
+# LOTES
+# =====================================================
+
+def test_decode_batch_indexes_items():
+    raw = json.dumps([{"index": 2, **ANALYSIS}, {"index": "0", **ANALYSIS}, {"sin": "index"}, "texto"])
+
+    decoded = decode_batch_analysis(raw)
+
+    assert sorted(decoded) == [0, 2]
+    assert decoded[2]["sentiment"]["label"] == "positive"
+
+
+def test_decode_batch_accepts_wrapped_results():
+    decoded = decode_batch_analysis(json.dumps({"results": [{"index": 0, **ANALYSIS}]}))
+
+    assert list(decoded) == [0]
@@ -0,0 +1,107 @@
+"""
+Pruebas del repositorio de Supabase contra un transporte HTTP falso
+"""
+
+import json
+
+import httpx
+import pytest
+
+from services.supabase import SupabaseRepository
+from services.telemetry import render_metrics
+
+
+class RecordingTransport(httpx.AsyncBaseTransport):
+    """Responde siempre `body` y guarda las peticiones recibidas"""
+
+    def __init__(self, body):
+        self.body = body
+        self.requests = []
+
+    async def handle_async_request(self, request):
+        await request.aread()
+        self.requests.append(request)
+        return httpx.Response(200, json=self.body, request=request)
+
+
+def make_repository(body):
+    repository = SupabaseRepository("https://db.test", "anon-key", "service-key")
+    transport = RecordingTransport(body)
+    repository._client = httpx.AsyncClient(
+        base_url=repository.url, transport=transport, event_hooks=repository._client.event_hooks
+    )
+    return repository, transport
+
+
+# =====================================================
+# BÚSQUEDA
+# =====================================================
+
+@pytest.mark.asyncio
+async def test_search_calls_the_rpc_with_keyset_position():
+    repository, transport = make_repository([])
+    await repository.search_analyses(
+        "user-1", "factura -retraso", 11, after=(0.5, "2024-05-01T10:00:00+00:00", "a1"), include_text=True
+    )
+    await repository.close()
+
+    request = transport.requests[0]
+    assert request.url.path == "/rest/v1/rpc/search_analyses"
+    assert json.loads(request.content) == {
+        "p_user_id": "user-1",
+        "p_query": "factura -retraso",
+        "p_include_text": True,
+        "p_limit": 11,
+        "p_offset": 0,
+        "p_after_rank": 0.5,
+        "p_after_created_at": "2024-05-01T10:00:00+00:00",
+        "p_after_id": "a1",
+    }
+
+
+@pytest.mark.asyncio
+async def test_search_without_cursor_pages_by_offset():
+    repository, transport = make_repository([])
+    await repository.search_analyses("user-1", "factura", 11, offset=20)
+    await repository.close()
+
+    payload = json.loads(transport.requests[0].content)
+    assert payload["p_offset"] == 20
+    assert payload["p_include_text"] is False
+    assert "p_after_rank" not in payload
+
+
+# =====================================================
+# ESTADÍSTICAS
+# =====================================================
+
+@pytest.mark.asyncio
+async def test_stats_come_from_a_single_rpc_call():
+    stats = {
+        "total_analyses": 2,
+        "sentiment_distribution": {"positive": 1, "negative": 0, "neutral": 1},
+        "most_common_keywords": ["entrega"],
+        "analyses_this_month": 2,
+        "average_confidence": 0.8,
+    }
+    repository, transport = make_repository(stats)
+    result = await repository.get_analysis_stats("user-1", keyword_limit=5)
+    await repository.close()
+
+    assert result == stats
+    assert len(transport.requests) == 1
+    assert transport.requests[0].url.path == "/rest/v1/rpc/get_analysis_stats"
+    assert json.loads(transport.requests[0].content) == {"p_user_id": "user-1", "p_keyword_limit": 5}
+
+
+# =====================================================
+# TELEMETRÍA
+# =====================================================
+
+@pytest.mark.asyncio
+async def test_calls_are_recorded_by_table_or_rpc_name():
+    repository, _ = make_repository([])
+    await repository.search_analyses("user-1", "factura", 10)
+    await repository.close()
+
+    assert 'upstream="supabase",operation="rpc/search_analyses",outcome="ok"' in render_metrics()
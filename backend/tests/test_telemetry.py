@@ -0,0 +1,61 @@
+"""
+Pruebas de las trazas por petición, Server-Timing y /metrics
+"""
+
+import uuid
+
+from config import settings
+from services.telemetry import Histogram, render_metrics, span
+
+
+def test_histogram_renders_cumulative_prometheus_buckets():
+    histogram = Histogram("demo_seconds", "Demo", ("route",), buckets=(0.1, 1.0))
+    histogram.observe(0.05, "/a")
+    histogram.observe(0.5, "/a")
+    histogram.observe(5.0, "/a")
+
+    lines = histogram.render()
+    assert 'demo_seconds_bucket{route="/a",le="0.1"} 1' in lines
+    assert 'demo_seconds_bucket{route="/a",le="1.0"} 2' in lines
+    assert 'demo_seconds_bucket{route="/a",le="+Inf"} 3' in lines
+    assert 'demo_seconds_sum{route="/a"} 5.55' in lines
+    assert 'demo_seconds_count{route="/a"} 3' in lines
+
+
+def test_span_outside_a_request_only_feeds_the_histogram():
+    with span("prueba_sin_traza"):
+        pass
+
+    assert 'stage_duration_seconds_count{stage="prueba_sin_traza"}' in render_metrics()
+
+
+def test_responses_carry_server_timing_with_stages(client):
+    response = client.get("/api/analysis/history")
+
+    timing = response.headers["Server-Timing"]
+    assert "history_page;dur=" in timing
+    assert timing.split(", ")[-1].startswith("total;dur=")
+
+
+def test_metrics_label_routes_by_template_not_by_id(client):
+    analysis_id = str(uuid.uuid4())
+    client.get(f"/api/analysis/history/{analysis_id}")
+    body = client.get("/metrics").text
+
+    assert 'route="/api/analysis/history/{analysis_id}",status="404"' in body
+    assert analysis_id not in body
+
+
+def test_metrics_require_the_token_when_configured(client, monkeypatch):
+    monkeypatch.setattr(settings, "METRICS_TOKEN", "interno")
+
+    assert client.get("/metrics").status_code == 401
+    response = client.get("/metrics", headers={"Authorization": "Bearer interno"})
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+
+
+def test_telemetry_can_be_disabled(client, monkeypatch):
+    monkeypatch.setattr(settings, "TELEMETRY_ENABLED", False)
+
+    assert "Server-Timing" not in client.get("/api/analysis/history").headers
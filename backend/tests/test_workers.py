@@ -0,0 +1,57 @@
+"""
+Pruebas del pool de procesos para trabajo CPU
+"""
+
+import asyncio
+import os
+import time
+from concurrent.futures.process import BrokenProcessPool
+
+import pytest
+
+from services.workers import CPUWorkerPool, WorkerPoolSaturatedError, WorkerTimeoutError
+
+
+@pytest.mark.asyncio
+async def test_runs_in_threads_without_processes():
+    pool = CPUWorkerPool(workers=0, max_pending=4, task_timeout=5)
+
+    assert await pool.run(sum, [1, 2, 3]) == 6
+    assert pool.pending == 0
+
+
+@pytest.mark.asyncio
+async def test_rejects_work_when_the_queue_is_full():
+    pool = CPUWorkerPool(workers=0, max_pending=1, task_timeout=5)
+    running = asyncio.ensure_future(pool.run(time.sleep, 0.2))
+    await asyncio.sleep(0.01)
+
+    with pytest.raises(WorkerPoolSaturatedError):
+        await pool.run(sum, [1])
+    await running
+
+
+@pytest.mark.asyncio
+async def test_timed_out_task_keeps_its_slot_until_it_finishes():
+    pool = CPUWorkerPool(workers=0, max_pending=4, task_timeout=0.05)
+
+    with pytest.raises(WorkerTimeoutError):
+        await pool.run(time.sleep, 0.3)
+    # La tarea sigue ejecutándose en su hilo y ocupa su hueco
+    assert pool.pending == 1
+
+    await asyncio.sleep(0.4)
+    assert pool.pending == 0
+
+
+@pytest.mark.asyncio
+async def test_broken_process_pool_is_recreated():
+    pool = CPUWorkerPool(workers=1, max_pending=4, task_timeout=10)
+    try:
+        with pytest.raises(BrokenProcessPool):
+            await pool.run(os._exit, 1)
+
+        assert await pool.run(sum, [2, 3]) == 5
+        assert pool.pending == 0
+    finally:
+        pool.shutdown()
@@ -0,0 +1,194 @@
+"""
+Pruebas del buffer de escritura de análisis
+"""
+
+import json
+
+import pytest
+
+from services import write_buffer
+from services.supabase import SupabaseError
+from services.write_buffer import AnalysisWriteBuffer
+
+
+class FlakyRepository:
+    """Repositorio que registra los upserts y puede rechazar filas"""
+
+    def __init__(self):
+        self.rows = {}
+        self.calls = 0
+        self.rejected_ids = set()
+        self.unavailable = False
+
+    async def upsert_analyses(self, rows):
+        self.calls += 1
+        if self.unavailable:
+            raise SupabaseError("Servicio no disponible", 503)
+        if any(row["id"] in self.rejected_ids for row in rows):
+            raise SupabaseError("Fila inválida", 400)
+        for row in rows:
+            self.rows.setdefault(row["id"], row)
+
+
+@pytest.fixture
+def repository(monkeypatch):
+    repository = FlakyRepository()
+    monkeypatch.setattr(write_buffer, "get_repository", lambda: repository)
+    return repository
+
+
+@pytest.fixture
+def log_path(tmp_path):
+    return str(tmp_path / "analyses.log")
+
+
+def make_buffer(log_path, **overrides):
+    options = {
+        "max_batch": 100,
+        "flush_interval": 60,
+        "max_pending": 100,
+        "max_log_bytes": 1024 * 1024,
+        "fsync": False,
+        **overrides,
+    }
+    return AnalysisWriteBuffer(log_path, **options)
+
+
+def row(analysis_id, **extra):
+    return {"id": analysis_id, "user_id": "user-1", "summary": "Resumen", **extra}
+
+
+def log_lines(path):
+    with open(path, encoding="utf-8") as log:
+        return [json.loads(line) for line in log]
+
+
+@pytest.mark.asyncio
+async def test_without_start_rows_are_inserted_directly(repository, log_path):
+    buffer = make_buffer(log_path)
+
+    await buffer.add([row("a1")])
+
+    assert list(repository.rows) == ["a1"]
+    assert buffer.pending_count == 0
+
+
+@pytest.mark.asyncio
+async def test_added_rows_are_logged_readable_and_flushed(repository, log_path):
+    buffer = make_buffer(log_path)
+    await buffer.start()
+    try:
+        await buffer.add([row("a1"), row("a2")])
+
+        assert [entry["row"]["id"] for entry in log_lines(log_path)] == ["a1", "a2"]
+        assert buffer.get("a1", "user-1")["created_at"]
+        assert buffer.get("a1", "otro-usuario") is None
+        assert repository.rows == {}
+
+        assert await buffer.flush() == 2
+        assert set(repository.rows) == {"a1", "a2"}
+        # El log se vacía cuando no queda nada pendiente
+        assert log_lines(log_path) == []
+    finally:
+        await buffer.stop()
+
+
+@pytest.mark.asyncio
+async def test_rows_left_in_the_log_are_replayed_on_start(repository, log_path):
+    with open(log_path, "w", encoding="utf-8") as log:
+        log.write(json.dumps({"row": row("a1"), "queued_at": "2024-01-01T00:00:00"}) + "\n")
+        log.write(json.dumps({"row": row("a2"), "queued_at": "2024-01-01T00:00:00"}) + "\n")
+        # Línea a medias por una caída durante la escritura
+        log.write('{"row": {"id": "a3"')
+    repository.rows["a1"] = row("a1", summary="Ya volcado antes de la caída")
+
+    buffer = make_buffer(log_path)
+    await buffer.start()
+    try:
+        assert buffer.pending_count == 2
+        await buffer.flush()
+    finally:
+        await buffer.stop()
+
+    # Reprocesar el log no duplica ni pisa filas ya volcadas
+    assert set(repository.rows) == {"a1", "a2"}
+    assert repository.rows["a1"]["summary"] == "Ya volcado antes de la caída"
+
+
+@pytest.mark.asyncio
+async def test_rejected_row_goes_to_the_failed_log(repository, log_path):
+    repository.rejected_ids.add("mala")
+    buffer = make_buffer(log_path)
+    await buffer.start()
+    try:
+        await buffer.add([row("a1"), row("mala"), row("a2")])
+        await buffer.flush()
+    finally:
+        await buffer.stop()
+
+    assert set(repository.rows) == {"a1", "a2"}
+    assert [entry["row"]["id"] for entry in log_lines(log_path + ".failed")] == ["mala"]
+    assert buffer.pending_count == 0
+
+
+@pytest.mark.asyncio
+async def test_transient_error_keeps_rows_pending_and_logged(repository, log_path):
+    repository.unavailable = True
+    buffer = make_buffer(log_path)
+    await buffer.start()
+    try:
+        await buffer.add([row("a1")])
+        with pytest.raises(SupabaseError):
+            await buffer.flush()
+
+        assert buffer.pending_count == 1
+        assert [entry["row"]["id"] for entry in log_lines(log_path)] == ["a1"]
+
+        repository.unavailable = False
+        assert await buffer.flush() == 1
+    finally:
+        await buffer.stop()
+
+
+@pytest.mark.asyncio
+async def test_full_buffer_inserts_directly(repository, log_path):
+    buffer = make_buffer(log_path, max_pending=1)
+    await buffer.start()
+    try:
+        await buffer.add([row("a1")])
+        await buffer.add([row("a2")])
+
+        assert buffer.pending_count == 1
+        assert list(repository.rows) == ["a2"]
+    finally:
+        await buffer.stop()
+
+
+@pytest.mark.asyncio
+async def test_stop_flushes_pending_rows(repository, log_path):
+    buffer = make_buffer(log_path)
+    await buffer.start()
+    await buffer.add([row("a1")])
+
+    await buffer.stop()
+
+    assert list(repository.rows) == ["a1"]
+    assert not buffer.running
+
+
+@pytest.mark.asyncio
+async def test_created_at_is_fixed_when_buffered_and_survives_replay(repository, log_path):
+    buffer = make_buffer(log_path)
+    await buffer.start()
+    await buffer.add([row("a1", created_at="2024-05-01T10:00:00+00:00"), row("a2")])
+    logged = {entry["row"]["id"]: entry["row"]["created_at"] for entry in log_lines(log_path)}
+    # Simular una caída: el proceso muere sin volcar
+    buffer._task.cancel()
+
+    replayed = make_buffer(log_path)
+    await replayed.start()
+    await replayed.stop()
+
+    assert logged["a1"] == "2024-05-01T10:00:00+00:00"
+    assert logged["a2"]
+    assert {analysis_id: stored["created_at"] for analysis_id, stored in repository.rows.items()} == logged
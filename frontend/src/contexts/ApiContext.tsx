@@ -21,7 +21,10 @@ export interface AnalysisResponse {
   created_at: string
 }
 
-export interface AnalysisHistory extends AnalysisResponse {}
+// El listado del historial no incluye el texto original (ver /history/{id}/detail)
+export interface AnalysisHistory extends Omit<AnalysisResponse, 'original_text'> {
+  original_text?: string
+}
 
 export interface HistoryResponse {
   items: AnalysisHistory[]
@@ -86,6 +89,18 @@ const apiClient = axios.create({
   withCredentials: true
 })
 
+// Clave de localStorage para el access token de Supabase
+const TOKEN_STORAGE_KEY = 'access_token'
+
+// Enviar el access token en cada petición
+apiClient.interceptors.request.use(config => {
+  const token = localStorage.getItem(TOKEN_STORAGE_KEY)
+  if (token) {
+    config.headers.Authorization = `Bearer ${token}`
+  }
+  return config
+})
+
 // Interceptor para manejar errores de autenticación
 apiClient.interceptors.response.use(
   response => response,
@@ -139,7 +154,7 @@ export class ApiService {
   }
 
   // Obtener análisis por ID
-  static async getAnalysisById(id: string): Promise<AnalysisResponse> {
+  static async getAnalysisById(id: string): Promise<AnalysisHistory> {
     const response = await apiClient.get(`/api/analysis/history/${id}`)
     return response.data
   }
@@ -147,18 +162,26 @@ export class ApiService {
   // Login
   static async login(credentials: LoginRequest): Promise<AuthResponse> {
     const response = await apiClient.post('/api/auth/login', credentials)
+    localStorage.setItem(TOKEN_STORAGE_KEY, response.data.access_token)
     return response.data
   }
 
   // Registro
   static async register(userData: RegisterRequest): Promise<AuthResponse> {
     const response = await apiClient.post('/api/auth/register', userData)
+    if (response.data.access_token) {
+      localStorage.setItem(TOKEN_STORAGE_KEY, response.data.access_token)
+    }
     return response.data
   }
 
   // Logout
   static async logout(): Promise<void> {
-    await apiClient.post('/api/auth/logout')
+    try {
+      await apiClient.post('/api/auth/logout')
+    } finally {
+      localStorage.removeItem(TOKEN_STORAGE_KEY)
+    }
   }
 
   // Obtener usuario actual
@@ -30,7 +30,7 @@ const HistoryPage: React.FC = () => {
   }, [])
 
   const filteredHistory = history.filter(item =>
-    item.original_text.toLowerCase().includes(searchTerm.toLowerCase()) ||
+    item.original_text?.toLowerCase().includes(searchTerm.toLowerCase()) ||
     item.summary.toLowerCase().includes(searchTerm.toLowerCase()) ||
     item.keywords.some(keyword => keyword.toLowerCase().includes(searchTerm.toLowerCase()))
   )
@@ -189,12 +189,14 @@ const HistoryPage: React.FC = () => {
                   </div>
 
                   <div className="space-y-3">
-                    <div>
-                      <h3 className="font-medium text-gray-900 mb-1">Texto Original</h3>
-                      <p className="text-gray-700 text-sm">
-                        {truncateText(item.original_text)}
-                      </p>
-                    </div>
+                    {item.original_text && (
+                      <div>
+                        <h3 className="font-medium text-gray-900 mb-1">Texto Original</h3>
+                        <p className="text-gray-700 text-sm">
+                          {truncateText(item.original_text)}
+                        </p>
+                      </div>
+                    )}
 
                     <div>
                       <h4 className="font-medium text-gray-900 mb-1 flex items-center">
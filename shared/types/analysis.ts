@@ -16,6 +16,7 @@ export interface SentimentResult {
 
 export interface AnalysisRequest {
   text: string;
+  quality?: 'economy' | 'standard' | 'high';
 }
 
 export interface AnalysisResponse {
@@ -24,11 +25,33 @@ export interface AnalysisResponse {
   keywords: string[];
   sentiment: SentimentResult;
   created_at: string;
+  model?: string;
 }
 
 export interface AnalysisHistory {
   analyses: Analysis[];
-  total: number;
+  total?: number;
   page: number;
   limit: number;
-}
\ No newline at end of file
+  next_cursor?: string;
+}
+export interface AnalysisJob {
+  id: string;
+  status: 'queued' | 'running' | 'succeeded' | 'failed';
+  created_at: string;
+  updated_at: string;
+  result?: AnalysisResponse;
+  error?: string;
+}
+
+export interface AnalysisStats {
+  total_analyses: number;
+  sentiment_distribution: Record<'positive' | 'negative' | 'neutral', number>;
+  most_common_keywords: string[];
+  analyses_this_month: number;
+  average_confidence: number;
+}
+
+export interface SimilarAnalysis extends AnalysisResponse {
+  similarity: number;
+}